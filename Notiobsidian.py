@@ -1,8 +1,48 @@
 # LifeDrive.py
-from app import create_app
+# 启动方式：
+#   python Notiobsidian.py                     开发服务器（Werkzeug，每个连接一个线程）
+#   python Notiobsidian.py --server gevent     生产模式：gevent 协程服务器，每个 WebSocket 连接只占几个协程
+#   gunicorn -k gevent -w 4 -b 0.0.0.0:5004 Notiobsidian:app
+# 多 worker 时由 SQLite 租约选出一个进程调度提醒，通知经 broadcast_message 表转发到每个 worker 的客户端
+import argparse
+import os
 
-app = create_app()
+def parse_args():
+    parser = argparse.ArgumentParser(description='Notiobsidian server')
+    parser.add_argument('--server', choices=('dev', 'gevent'),
+                        default=os.environ.get('NOTIOBSIDIAN_SERVER', 'dev'),
+                        help='dev: Flask 开发服务器；gevent: 生产模式协程服务器')
+    parser.add_argument('--host', default=os.environ.get('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5004)))
+    parser.add_argument('--max-connections', type=int, default=int(os.environ.get('MAX_CONNECTIONS', 10000)),
+                        help='gevent 模式下同时处理的最大连接数（含 WebSocket）')
+    return parser.parse_args()
+
+def serve_gevent(app, host, port, max_connections):
+    """gevent WSGI 服务器：连接由协程池处理，空闲 WebSocket 不占用系统线程"""
+    from gevent.pool import Pool
+    from gevent.pywsgi import WSGIServer
+
+    server = WSGIServer((host, port), app, spawn=Pool(max_connections))
+    print(f"🚀 gevent 服务器已启动: http://{host}:{port} (最大连接数 {max_connections})")
+    server.serve_forever()
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5004, debug=False)
-    #change true port and metion your firewall accessable#
\ No newline at end of file
+    args = parse_args()
+    if args.server == 'gevent':
+        # 必须在导入应用（threading / socket / sqlite 相关模块）之前打补丁
+        from gevent import monkey
+        monkey.patch_all()
+
+    from app import create_app
+    app = create_app()
+
+    if args.server == 'gevent':
+        serve_gevent(app, args.host, args.port, args.max_connections)
+    else:
+        app.run(host=args.host, port=args.port, debug=False)
+        #change true port and metion your firewall accessable#
+else:
+    # 被 gunicorn 等 WSGI 服务器导入
+    from app import create_app
+    app = create_app()
@@ -2,6 +2,7 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from app.socket import sock  # 从socket模块导入
+from app import database
 import os
 
 db = SQLAlchemy()
@@ -12,15 +13,25 @@ def create_app():
                 template_folder='../templates')
     
     app.secret_key = os.environ.get('SECRET_KEY', 'nation_secret_key')
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///nation_pro_v3.db'
+    # 数据库位置和连接参数（WAL / PRAGMA / 连接池）统一由 app.database 配置，提醒调度器共用同一套连接设置
+    app.config['SQLALCHEMY_DATABASE_URI'] = database.DATABASE_URI
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = database.engine_options()
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['UPLOAD_FOLDER'] = os.path.join('static', 'uploads')
+    # 未完成的分片上传（可能有数 GB）放在 instance 目录，不进入源码树和静态目录
+    app.config['UPLOAD_PARTIAL_FOLDER'] = os.environ.get(
+        'UPLOAD_PARTIAL_FOLDER', os.path.join(app.instance_path, 'upload_parts')
+    )
     
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     
     db.init_app(app)
     
-    # 初始化WebSocket
+    # 初始化WebSocket：定时 ping 以便及时发现断开的连接，并限制单条消息大小
+    app.config['SOCK_SERVER_OPTIONS'] = {
+        'ping_interval': int(os.environ.get('WS_PING_INTERVAL', 25)),
+        'max_message_size': int(os.environ.get('WS_MAX_MESSAGE_SIZE', 1024 * 1024))
+    }
     sock.init_app(app)
     
     # 注册蓝图
@@ -32,12 +43,22 @@ def create_app():
     # 导入WebSocket路由（确保在sock.init_app之后）
     from app import websocket  # 这会注册websocket_handler
     
-    # 创建数据库表
+    # 创建数据库表并执行结构迁移
     with app.app_context():
-        db.create_all()
+        from app.migrations import upgrade_database
+        upgrade_database()
+        
         from app.utils.helpers import init_db_data
         from app.models.page import Page
         if not Page.query.first():
             init_db_data()
+        
+        # 全文搜索索引（触发器同步）
+        from app.utils.search import init_search_index
+        init_search_index()
+    
+    # 数据就绪后启动跨进程广播转发和提醒调度（多 worker 时只有持有租约的进程调度数据库提醒）
+    websocket.relay.start(websocket.broadcast_payload)
+    websocket.notification_checker.start()
     
     return app
\ No newline at end of file
@@ -0,0 +1,260 @@
+# app/cluster.py
+# 多进程部署（gunicorn / uWSGI 多 worker）时的协调：
+#   LeaderLease     基于 SQLite 租约行的选主，只有一个进程运行提醒调度
+#   BroadcastRelay  基于 SQLite 表的广播队列，每个进程把消息推送给自己持有的 WebSocket 连接
+#                   非主进程在 worker_lease 表里登记心跳，主进程据此判断是否有其他 worker，单进程时页面事件不写队列
+import os
+import socket
+import time
+import uuid
+from threading import Lock, Thread
+from app import database
+
+# 协调表放在 database.CLUSTER_DB_PATH，由首次连接时创建，不属于主库的模型和迁移
+CLUSTER_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS worker_lease ('
+    'name VARCHAR(150) PRIMARY KEY, owner VARCHAR(100), expires_at FLOAT DEFAULT 0)',
+    'CREATE TABLE IF NOT EXISTS broadcast_message ('
+    'id INTEGER PRIMARY KEY, message_id VARCHAR(300) UNIQUE, origin VARCHAR(100), payload TEXT, created_at FLOAT)',
+    'CREATE INDEX IF NOT EXISTS ix_broadcast_message_created_at ON broadcast_message (created_at)',
+)
+
+def connect():
+    """打开协调库的自动提交连接（租约和广播各自持有一个）"""
+    conn = database.connect(path=database.CLUSTER_DB_PATH, check_same_thread=False, isolation_level=None)
+    for statement in CLUSTER_SCHEMA:
+        conn.execute(statement)
+    return conn
+
+def new_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+# 当前进程的唯一标识；fork 出的子进程（gunicorn --preload）在 reinit_after_fork 中重新生成
+WORKER_ID = new_worker_id()
+
+LEASE_TTL = float(os.environ.get('CHECKER_LEASE_TTL', 15))                # 租约有效期（秒）
+RELAY_POLL_INTERVAL = float(os.environ.get('BROADCAST_POLL_INTERVAL', 0.5))
+RELAY_RETENTION = float(os.environ.get('BROADCAST_RETENTION', 600))       # 广播队列保留时长（秒）
+
+
+class LeaderLease:
+    """
+    租约行选主：持有者每 ttl/3 秒续约一次，进程退出或卡死后租约过期，其他进程下次尝试时接管
+    抢占和续约是同一条 upsert，由 SQLite 写锁保证同一时刻只有一个持有者
+    """
+
+    def __init__(self, name, ttl=LEASE_TTL):
+        self.name = name
+        self.ttl = ttl
+        self.renew_interval = ttl / 3
+        self.conn = None
+        self.lock = Lock()
+        self.held = False  # 最近一次抢占/续约的结果
+
+    def _connection(self):
+        if self.conn is None:
+            self.conn = connect()
+        return self.conn
+
+    def try_acquire(self):
+        """抢占或续约，返回当前进程是否持有租约"""
+        now = time.time()
+        with self.lock:
+            try:
+                cur = self._connection().execute(
+                    'INSERT INTO worker_lease (name, owner, expires_at) VALUES (?, ?, ?) '
+                    'ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at '
+                    'WHERE worker_lease.owner = excluded.owner OR worker_lease.expires_at < ?',
+                    (self.name, WORKER_ID, now + self.ttl, now)
+                )
+                self.held = cur.rowcount == 1
+            except Exception as e:
+                print(f"⚠️ 租约 {self.name} 更新失败: {e}")
+                self.conn = None
+                self.held = False
+            return self.held
+
+    def release(self):
+        """主动释放租约，其他进程无需等待过期即可接管"""
+        with self.lock:
+            try:
+                self._connection().execute(
+                    'UPDATE worker_lease SET expires_at = 0 WHERE name = ? AND owner = ?',
+                    (self.name, WORKER_ID)
+                )
+            except Exception:
+                pass
+            self.held = False
+
+    def after_fork(self):
+        """子进程不能沿用父进程的连接和锁，租约按未持有处理"""
+        self.conn = None
+        self.lock = Lock()
+        self.held = False
+
+
+class BroadcastRelay:
+    """
+    跨进程广播：publish 写入 broadcast_message 表（按 message_id 去重），本进程立即推送；
+    其他进程的轮询线程发现新行后推送给各自的客户端。PRAGMA data_version 不变时轮询不读取数据
+    """
+
+    def __init__(self, lease, poll_interval=RELAY_POLL_INTERVAL, retention=RELAY_RETENTION):
+        self.lease = lease            # 调度租约，持有者即主进程
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.peers = True             # 是否有其他 worker 在运行，确认之前按有处理
+        self.peers_checked = 0
+        self.deliver = None
+        self.conn = None
+        self.lock = Lock()
+        self.last_id = 0
+        self.data_version = None
+        self.thread = None
+        self.running = False
+        self.relayed = 0
+
+    def _connection(self):
+        if self.conn is None:
+            self.conn = connect()
+        return self.conn
+
+    def start(self, deliver):
+        """deliver(payload): 把已序列化的消息推送给本进程的客户端"""
+        if self.thread:
+            return
+        self.deliver = deliver
+        with self.lock:
+            try:
+                row = self._connection().execute('SELECT MAX(id) FROM broadcast_message').fetchone()
+                self.last_id = row[0] or 0
+            except Exception:
+                self.conn = None
+        self.running = True
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def after_fork(self):
+        """父进程的轮询线程不会被 fork 复制：重置连接和锁，父进程已启动转发时在子进程重新启动"""
+        self.conn = None
+        self.lock = Lock()
+        self.data_version = None
+        self.peers = True
+        self.peers_checked = 0
+        was_running, self.running, self.thread = self.running, False, None
+        if was_running:
+            self.start(self.deliver)
+
+    def publish(self, message_id, payload):
+        """
+        写入广播队列，返回是否需要由本进程推送
+        同一 message_id 已被其他进程写入时返回 False；数据库不可用时退化为仅本进程推送
+        """
+        with self.lock:
+            try:
+                cur = self._connection().execute(
+                    'INSERT OR IGNORE INTO broadcast_message (message_id, origin, payload, created_at) '
+                    'VALUES (?, ?, ?, ?)',
+                    (message_id, WORKER_ID, payload, time.time())
+                )
+                return cur.rowcount == 1
+            except Exception as e:
+                print(f"⚠️ 广播写入失败，仅推送本进程: {e}")
+                self.conn = None
+                return True
+
+    def prune(self):
+        """删除超过保留时长的广播和已过期的心跳（由调度主进程定期调用）"""
+        with self.lock:
+            try:
+                conn = self._connection()
+                conn.execute('DELETE FROM broadcast_message WHERE created_at < ?', (time.time() - self.retention,))
+                conn.execute(
+                    "DELETE FROM worker_lease WHERE name LIKE 'worker:%' AND expires_at < ?",
+                    (time.time() - self.retention,)
+                )
+            except Exception:
+                self.conn = None
+
+    def check_peers(self):
+        """
+        非主进程续写自己的心跳（主进程必然存在，视为有其他 worker）；
+        主进程只读取未过期的心跳，单进程部署时除租约续约外没有额外写入
+        """
+        now = time.time()
+        with self.lock:
+            try:
+                conn = self._connection()
+                if self.lease.held:
+                    row = conn.execute(
+                        "SELECT COUNT(*) FROM worker_lease WHERE name LIKE 'worker:%' AND owner != ? AND expires_at > ?",
+                        (WORKER_ID, now)
+                    ).fetchone()
+                    self.peers = row[0] > 0
+                else:
+                    conn.execute(
+                        'INSERT OR REPLACE INTO worker_lease (name, owner, expires_at) VALUES (?, ?, ?)',
+                        (f'worker:{WORKER_ID}', WORKER_ID, now + self.lease.ttl)
+                    )
+                    self.peers = True
+            except Exception:
+                self.conn = None
+                self.peers = True
+
+    def poll(self):
+        """取出其他进程写入的新广播"""
+        with self.lock:
+            try:
+                conn = self._connection()
+                data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+                if data_version == self.data_version:
+                    return []
+                self.data_version = data_version
+                rows = conn.execute(
+                    'SELECT id, origin, payload FROM broadcast_message WHERE id > ? ORDER BY id',
+                    (self.last_id,)
+                ).fetchall()
+            except Exception:
+                self.conn = None
+                return []
+        if rows:
+            self.last_id = rows[-1][0]
+        return [payload for _, origin, payload in rows if origin != WORKER_ID]
+
+    def run(self):
+        while self.running:
+            if time.monotonic() - self.peers_checked >= self.lease.renew_interval:
+                self.peers_checked = time.monotonic()
+                self.check_peers()
+            for payload in self.poll():
+                try:
+                    self.deliver(payload)
+                    self.relayed += 1
+                except Exception:
+                    pass
+            time.sleep(self.poll_interval)
+
+    def stats(self):
+        return {'worker': WORKER_ID, 'last_id': self.last_id, 'relayed': self.relayed, 'peers': self.peers}
+
+
+# 进程级单例
+checker_lease = LeaderLease('notification_checker')
+relay = BroadcastRelay(checker_lease)
+
+
+def reinit_after_fork():
+    """预加载应用后 fork 的 worker 继承了父进程的 ID，必须重新生成，否则所有 worker 都认为自己持有租约"""
+    global WORKER_ID
+    WORKER_ID = new_worker_id()
+    checker_lease.after_fork()
+    relay.after_fork()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reinit_after_fork)
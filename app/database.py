@@ -0,0 +1,62 @@
+# app/database.py
+import os
+import sqlite3
+from urllib.parse import quote
+
+# 数据库文件位置：默认放在 app 目录下（与旧版 Flask-SQLAlchemy 相对路径解析的位置一致）
+DB_PATH = os.path.abspath(os.environ.get(
+    'DATABASE_PATH', os.path.join(os.path.dirname(__file__), 'nation_pro_v3.db')
+))
+DATABASE_URI = 'sqlite:///' + DB_PATH
+# 多进程协调（租约、心跳、广播队列）使用独立的数据库文件：这些高频写入不改变主库的 PRAGMA data_version，
+# 提醒调度器和空闲的连接不会因此被唤醒
+CLUSTER_DB_PATH = os.path.abspath(os.environ.get(
+    'CLUSTER_DATABASE_PATH', os.path.splitext(DB_PATH)[0] + '_cluster.db'
+))
+
+# 每个连接建立时执行的 PRAGMA，均可用环境变量覆盖
+# WAL 让读写互不阻塞；synchronous=NORMAL 在 WAL 下仍保证一致性，只是断电时可能丢最后几个事务
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),         # 毫秒
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64000)),           # 负数单位为 KiB，约 64MB
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),  # 字节
+    'temp_store': os.environ.get('SQLITE_TEMP_STORE', 'MEMORY'),
+}
+
+# SQLAlchemy 连接池大小：连接复用，PRAGMA 和 mmap 只在新建连接时设置一次
+POOL_SIZE = int(os.environ.get('SQLITE_POOL_SIZE', 5))
+POOL_OVERFLOW = int(os.environ.get('SQLITE_POOL_OVERFLOW', 10))
+
+def apply_pragmas(conn, pragmas=None):
+    """在 sqlite3 连接上执行连接级 PRAGMA"""
+    for name, value in (pragmas or SQLITE_PRAGMAS).items():
+        conn.execute(f'PRAGMA {name} = {value}')
+
+def connect(readonly=False, path=None, **kwargs):
+    """
+    创建已调优的 sqlite3 连接
+    SQLAlchemy 引擎（通过 creator）和提醒调度器都从这里取连接，保证所有连接配置一致
+    readonly=True 时以只读模式打开，不修改 journal_mode（WAL 由读写连接设置）
+    path 默认为主数据库，多进程协调传入 CLUSTER_DB_PATH
+    """
+    path = path or DB_PATH
+    timeout = SQLITE_PRAGMAS['busy_timeout'] / 1000
+    if readonly:
+        conn = sqlite3.connect(f'file:{quote(path)}?mode=ro', uri=True, timeout=timeout, **kwargs)
+        apply_pragmas(conn, {k: v for k, v in SQLITE_PRAGMAS.items() if k != 'journal_mode'})
+    else:
+        conn = sqlite3.connect(path, timeout=timeout, **kwargs)
+        apply_pragmas(conn)
+    return conn
+
+def engine_options():
+    """Flask-SQLAlchemy 的 SQLALCHEMY_ENGINE_OPTIONS"""
+    from sqlalchemy.pool import QueuePool
+    return {
+        'creator': lambda: connect(check_same_thread=False),
+        'poolclass': QueuePool,
+        'pool_size': POOL_SIZE,
+        'max_overflow': POOL_OVERFLOW,
+    }
@@ -0,0 +1,68 @@
+# app/migrations.py
+# 数据库结构迁移：create_all 只会创建缺失的表，已有表的加列、加索引和数据回填在这里按版本号依次执行
+# 当前版本号保存在 PRAGMA user_version 中，每个迁移成功后立即更新，中途失败下次启动会从失败处继续
+from sqlalchemy import inspect, text
+from app import db
+
+def add_page_version_column():
+    columns = {c['name'] for c in inspect(db.engine).get_columns('page')}
+    if 'version' not in columns:
+        with db.engine.begin() as conn:
+            conn.execute(text('ALTER TABLE page ADD COLUMN version INTEGER DEFAULT 0'))
+
+def build_page_index():
+    from app.utils.helpers import rebuild_page_index
+    rebuild_page_index()
+
+def build_variable_history():
+    from app.models.page import VariableObservation
+    from app.utils.variables import rebuild_variable_history
+    if not VariableObservation.query.first():
+        rebuild_variable_history()
+
+def add_hot_column_indexes():
+    # 索引名与模型中 index=True 生成的名字一致，新建数据库和升级后的数据库结构相同
+    with db.engine.begin() as conn:
+        for table, column in (
+            ('variable_value', 'page_id'),
+            ('variable_value', 'variable_id'),
+            ('page', 'created_at'),
+            ('page', 'is_pinned'),
+        ):
+            conn.execute(text(f'CREATE INDEX IF NOT EXISTS ix_{table}_{column} ON {table} ({column})'))
+
+# (版本号, 说明, 迁移函数)，只能在末尾追加
+MIGRATIONS = [
+    (1, 'page.version 列', add_page_version_column),
+    (2, '链接/标签/日历事件/提醒索引表回填', build_page_index),
+    (3, '变量历史回填', build_variable_history),
+    (4, 'variable_value / page 热点列索引', add_hot_column_indexes),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version():
+    with db.engine.connect() as conn:
+        return conn.execute(text('PRAGMA user_version')).scalar()
+
+def set_schema_version(version):
+    with db.engine.begin() as conn:
+        conn.execute(text(f'PRAGMA user_version = {int(version)}'))
+
+def upgrade_database():
+    """
+    建表并执行未完成的迁移
+    全新数据库由 create_all 按最新模型建表，直接标记为最新版本
+    """
+    fresh = 'page' not in inspect(db.engine).get_table_names()
+    db.create_all()
+    if fresh:
+        set_schema_version(LATEST_VERSION)
+        return
+
+    current = get_schema_version()
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        print(f"🛠️ 数据库迁移 {version}: {description}")
+        migrate()
+        set_schema_version(version)
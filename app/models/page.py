@@ -10,12 +10,17 @@ class Page(db.Model):
     icon = db.Column(db.String(20), default="📄")
     cover = db.Column(db.String(200), default="") 
     content = db.Column(db.Text, default="") 
+    version = db.Column(db.Integer, default=0)  # 正文版本号，每次正文变化递增，用于增量保存的冲突检测
     page_type = db.Column(db.String(20), default="doc") 
     graph_config = db.Column(db.Text, default='{"visible_ids": []}')
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     var_values = db.relationship('VariableValue', backref='page', lazy=True, cascade='all, delete-orphan')
+    links = db.relationship('PageLink', backref='page', lazy=True, cascade='all, delete-orphan')
+    tags = db.relationship('PageTag', backref='page', lazy=True, cascade='all, delete-orphan')
+    events = db.relationship('CalendarEvent', backref='page', lazy=True, cascade='all, delete-orphan')
+    notices = db.relationship('PageNotice', backref='page', lazy=True, cascade='all, delete-orphan')
     
-    is_pinned = db.Column(db.Boolean, default=False)  # 是否置顶
+    is_pinned = db.Column(db.Boolean, default=False, index=True)  # 是否置顶
 
 class DailyLog(db.Model):
     __tablename__ = 'daily_log'
@@ -25,6 +30,47 @@ class DailyLog(db.Model):
     content = db.Column(db.Text, default="")
     
     
+# ========== 链接/标签索引 ==========
+
+class PageLink(db.Model):
+    """链接索引表：记录页面中的 [[@标题]] 出链，保存时增量维护"""
+    __tablename__ = 'page_link'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    source_id = db.Column(db.Integer, db.ForeignKey('page.id'), nullable=False, index=True)
+    # 按标题记录目标，页面改名后链接自动指向新的同名页面
+    target_title = db.Column(db.String(100), nullable=False, index=True)
+
+class PageTag(db.Model):
+    """标签索引表：记录页面中的 [[标签]]"""
+    __tablename__ = 'page_tag'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    page_id = db.Column(db.Integer, db.ForeignKey('page.id'), nullable=False, index=True)
+    tag = db.Column(db.String(100), nullable=False, index=True)
+
+class CalendarEvent(db.Model):
+    """日历事件表：保存页面时从 @YYYY.MM.DD HH:MM [事件|提醒] 中提取"""
+    __tablename__ = 'calendar_event'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    page_id = db.Column(db.Integer, db.ForeignKey('page.id'), nullable=False, index=True)
+    title = db.Column(db.String(200), default="")
+    date = db.Column(db.Date, nullable=False, index=True)
+    start = db.Column(db.String(5))     # HH:MM，全天事件为空
+    end = db.Column(db.String(5))
+    reminder = db.Column(db.String(50))  # 例如 15m / 1h
+
+class PageNotice(db.Model):
+    """提醒组件表：保存页面时从 {{notice|条件|内容}} 中提取"""
+    __tablename__ = 'page_notice'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    page_id = db.Column(db.Integer, db.ForeignKey('page.id'), nullable=False, index=True)
+    condition = db.Column(db.String(100), default="")  # 例如 daily 09:00 / every 15m
+    content = db.Column(db.String(200), default="")
+    
+
 # ========== 新增：变量系统 ==========
 
 class Variable(db.Model):
@@ -47,11 +93,41 @@ class VariableValue(db.Model):
     __tablename__ = 'variable_value'
     
     id = db.Column(db.Integer, primary_key=True)
-    variable_id = db.Column(db.Integer, db.ForeignKey('variable.id'), nullable=False)
-    page_id = db.Column(db.Integer, db.ForeignKey('page.id'), nullable=False)
+    variable_id = db.Column(db.Integer, db.ForeignKey('variable.id'), nullable=False, index=True)
+    page_id = db.Column(db.Integer, db.ForeignKey('page.id'), nullable=False, index=True)
     
     # 存储计算后的结果 (例如页面里写了 10*5, 这里存 50.0)
     value = db.Column(db.Float, default=0.0)
     
     # 记录最后更新时间，用于生成时序图
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
\ No newline at end of file
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class VariableObservation(db.Model):
+    """变量历史日志（只追加）：页面对某变量的贡献值每变化一次记一行"""
+    __tablename__ = 'variable_observation'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    variable_id = db.Column(db.Integer, db.ForeignKey('variable.id'), nullable=False, index=True)
+    # 不设外键：页面删除后历史仍然保留
+    page_id = db.Column(db.Integer, nullable=False, index=True)
+    value = db.Column(db.Float, default=0.0)   # 变化后的值
+    delta = db.Column(db.Float, default=0.0)   # 相对上一次的变化量
+    observed_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class VariableRollup(db.Model):
+    """变量汇总表：按 日/周/月 分桶累计变化量，写入时增量更新，图表直接读取"""
+    __tablename__ = 'variable_rollup'
+    
+    variable_id = db.Column(db.Integer, db.ForeignKey('variable.id'), primary_key=True)
+    period = db.Column(db.String(10), primary_key=True)  # day / week / month
+    bucket = db.Column(db.Date, primary_key=True)        # 桶起始日期（周一 / 月初）
+    total = db.Column(db.Float, default=0.0)             # 桶内变化量之和
+    samples = db.Column(db.Integer, default=0)           # 桶内观测次数
+
+class MetaVersion(db.Model):
+    """数据版本表：页面/变量写入时递增，用作 JSON 接口的 ETag"""
+    __tablename__ = 'meta_version'
+    
+    name = db.Column(db.String(50), primary_key=True)  # pages / variables / calendar
+    version = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)  # 最近一次递增的时间，用作 Last-Modified
@@ -1,17 +1,133 @@
 # app/routes/api.py
-from flask import Blueprint, request, jsonify, url_for, session
+from flask import Blueprint, request, jsonify, session, Response, stream_with_context
 from app import db
 from app.models.page import Page, DailyLog, Variable, VariableValue
-from datetime import datetime, timedelta
-from werkzeug.utils import secure_filename
+from app.utils.helpers import (
+    index_page_meta, parse_page_content, page_parse_cache, extract_calendar_events,
+    extract_notices, build_graph_meta, page_summary_query, page_summary_dict, page_meta_dict,
+    bump_meta_version, versioned_json, apply_text_patch, utf16_len
+)
+from app.utils.search import search_pages
+from app.utils.calc import evaluate_expression, calc_cache
+from app.utils.ics import import_ics_stream, feed_response
+from app.utils.uploads import (
+    UploadError, save_stream, create_upload, read_meta, upload_status, append_chunk, cancel_upload
+)
+from app.utils.variables import ROLLUP_PERIODS, record_variable_observations, delete_variable_history, variable_stats
+from app.websocket import notification_checker, client_stats, sent_notifications_cache, relay, publish_page_event
+from datetime import datetime
+from sqlalchemy.orm.attributes import set_committed_value
 import json
 import re
 import os
-from icalendar import Calendar as ICalCalendar, Event as ICalEvent
 
 bp = Blueprint('api', __name__, url_prefix='/api')
 
+# 页面事件中随事件下发的正文/补丁上限（UTF-16 码元），超过时只标记正文已变化，由客户端自行重新加载
+PAGE_EVENT_CONTENT_LIMIT = int(os.environ.get('WS_PAGE_EVENT_CONTENT_LIMIT', 64 * 1024))
+
+def content_event_fields(page, patch=None, base_version=None):
+    """正文变化事件的字段：链接/标签（供图谱更新），以及补丁或完整正文（不超过上限时）"""
+    fields = {
+        'links': [l.target_title for l in page.links],
+        'tags': [t.tag for t in page.tags]
+    }
+    if patch is not None and sum(utf16_len(str(op.get('ins', ''))) for op in patch) <= PAGE_EVENT_CONTENT_LIMIT:
+        fields['patch'] = {'base_version': base_version, 'ops': patch}
+    elif utf16_len(page.content) <= PAGE_EVENT_CONTENT_LIMIT:
+        fields['content'] = page.content
+    return fields
+
+def emit_page_event(event, page_id, **kwargs):
+    """在提交之后广播页面事件，发起请求的标签页通过 X-Client-Id 请求头识别自己"""
+    publish_page_event(event, page_id, origin=request.headers.get('X-Client-Id'), **kwargs)
+
 # ========== 页面管理 ==========
+@bp.route('/pages', methods=['GET'])
+def list_pages():
+    """分页返回页面摘要（不含正文）: /api/pages?page=1&per_page=100"""
+    if 'logged_in' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    page_num = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 100, type=int), 1), 500)
+    
+    query = page_summary_query()
+    total = query.count()
+    rows = query.offset((page_num - 1) * per_page).limit(per_page).all()
+    
+    return jsonify({
+        'pages': [page_summary_dict(p) for p in rows],
+        'page': page_num,
+        'per_page': per_page,
+        'total': total
+    })
+
+# ========== 缓存统计 ==========
+@bp.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """进程内缓存的命中/未命中计数"""
+    if 'logged_in' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify({
+        'page_parse': page_parse_cache.stats(),
+        'calc': calc_cache.stats(),
+        'notification_dedupe': sent_notifications_cache.stats()
+    })
+
+@bp.route('/ws/stats', methods=['GET'])
+def ws_stats():
+    """WebSocket 客户端发送队列深度和发送/丢弃计数，以及提醒调度器的条目数"""
+    if 'logged_in' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify({**client_stats(), 'scheduler': notification_checker.stats(), 'relay': relay.stats()})
+
+# ========== 可缓存的元数据接口 ==========
+@bp.route('/meta/graph', methods=['GET'])
+def graph_meta():
+    """图谱节点和边（基于链接/标签索引），带 ETag"""
+    if 'logged_in' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    def build():
+        nodes, edges, _ = build_graph_meta()
+        return {'nodes': nodes, 'edges': edges}
+    return versioned_json('pages', build)
+
+@bp.route('/meta/notices', methods=['GET'])
+def notices_meta():
+    """全局提醒列表，带 ETag"""
+    if 'logged_in' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    return versioned_json('pages', extract_notices)
+
+@bp.route('/search', methods=['GET'])
+def search():
+    """全文搜索: /api/search?q=关键词&limit=20"""
+    if 'logged_in' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    q = (request.args.get('q') or '').strip()
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    return jsonify({'query': q, 'results': search_pages(q, limit)})
+
+@bp.route('/page/<int:page_id>', methods=['GET'])
+def get_page(page_id):
+    """
+    单个页面的头部字段和链接/标签，?content=1 时附带正文
+    其他 worker 转发过来的页面事件不带字段，客户端用它拉取最新值
+    """
+    if 'logged_in' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    page = Page.query.get_or_404(page_id)
+    data = page_meta_dict(page)
+    data['links'] = [l.target_title for l in page.links]
+    data['tags'] = [t.tag for t in page.tags]
+    if request.args.get('content', type=int):
+        data['content'] = page.content
+    return jsonify(data)
+
 @bp.route('/page/create', methods=['POST'])
 def create_page():
     if 'logged_in' not in session:
@@ -27,7 +143,9 @@ def create_page():
         page_type=p_type
     )
     db.session.add(new_page)
+    bump_meta_version('pages')
     db.session.commit()
+    emit_page_event('page_created', new_page.id, version=new_page.version, fields=page_summary_dict(new_page))
     return jsonify({'id': new_page.id, 'status': 'success'})
 
 @bp.route('/page/<int:page_id>/update', methods=['POST'])
@@ -54,10 +172,40 @@ def update_page(page_id):
     if 'cover' in data: 
         page.cover = data['cover']
     
+    # 增量保存：客户端发送相对 base_version 的补丁，版本不一致时返回 409（客户端取回最新正文后重新提交）
+    # 全量保存带 base_version 时同样校验；不带时以本次读到的版本为准
+    patch = None
+    base_version = data['base_version'] if 'base_version' in data else page.version
+    if 'patch' in data:
+        if data.get('base_version') != page.version:
+            return jsonify({'error': 'Version conflict', 'version': page.version}), 409
+        try:
+            new_content = apply_text_patch(page.content, data['patch'])
+        except (ValueError, TypeError, KeyError):
+            return jsonify({'error': 'Invalid patch'}), 400
+        if 'length' in data and utf16_len(new_content) != data['length']:
+            return jsonify({'error': 'Version conflict', 'version': page.version}), 409
+        data['content'] = new_content
+        patch = data['patch']
+    
     if 'content' in data: 
-        page.content = data['content']
+        if base_version != page.version:
+            return jsonify({'error': 'Version conflict', 'version': page.version}), 409
+        # 条件更新：读取版本之后如果有其他请求先写入，WHERE 匹配不到行，整个请求回滚并返回 409
+        updated = Page.query.filter_by(id=page.id, version=base_version).update(
+            {'content': data['content'], 'version': Page.version + 1}, synchronize_session=False
+        )
+        if not updated:
+            db.session.rollback()
+            page = db.session.get(Page, page_id)
+            return jsonify({'error': 'Version conflict', 'version': page.version if page else None}), 409
+        # 同步内存中的对象，不再标记为脏，提交时不会再发出一次无条件的 UPDATE
+        set_committed_value(page, 'content', data['content'])
+        set_committed_value(page, 'version', base_version + 1)
         # 触发变量提取逻辑
         process_page_variables(page)
+        # 增量维护链接/标签索引
+        index_page_meta(page)
         
     if 'graph_config' in data:
         if isinstance(data['graph_config'], dict):
@@ -65,8 +213,78 @@ def update_page(page_id):
         else:
             page.graph_config = data['graph_config']
 
+    if {'title', 'icon', 'content'} & set(data):
+        bump_meta_version('pages')
+    # 订阅源中的事件标注了来源页面标题
+    if 'title' in data:
+        bump_meta_version('calendar')
     db.session.commit()
-    return jsonify({'status': 'success'})
+    
+    # 提醒来源于正文，标题出现在提醒文案里
+    if 'content' in data or 'title' in data:
+        notification_checker.reload_page(page.id)
+    
+    fields = {f: getattr(page, f) for f in ('title', 'icon', 'cover') if f in data}
+    if 'icon' in data:
+        fields['cover'] = page.cover or ''
+    changed = list(fields)
+    if 'content' in data:
+        fields.update(content_event_fields(page, patch, base_version))
+        changed.append('content')
+    if changed:
+        emit_page_event('page_updated', page.id, version=page.version, fields=fields, changed=changed)
+    return jsonify({'status': 'success', 'version': page.version})
+
+# 可通过元数据接口修改的字段及其类型
+META_FIELDS = {'title': str, 'icon': str, 'cover': str, 'is_pinned': bool}
+
+@bp.route('/page/<int:page_id>/meta', methods=['POST'])
+def update_page_meta(page_id):
+    """
+    一次请求原子地修改多个元数据字段（标题/图标/封面/置顶）
+    先整体校验再写入，任一字段不合法则什么都不改；返回更新后的页面片段供前端原地刷新
+    """
+    if 'logged_in' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    page = db.session.get(Page, page_id)
+    if not page:
+        return jsonify({'error': 'Page not found'}), 404
+    
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not data:
+        return jsonify({'error': 'No fields to update'}), 400
+    
+    unknown = set(data) - set(META_FIELDS)
+    if unknown:
+        return jsonify({'error': f"Unknown fields: {', '.join(sorted(unknown))}"}), 400
+    for field, value in data.items():
+        if not isinstance(value, META_FIELDS[field]):
+            return jsonify({'error': f'Invalid value for {field}'}), 400
+        limit = getattr(Page, field).type.length if field != 'is_pinned' else None
+        if limit and len(value) > limit:
+            return jsonify({'error': f'{field} too long (max {limit})'}), 400
+    
+    # 图标包含 '||' 时进入隐藏模式，封面一并清空
+    if '||' in data.get('icon', ''):
+        data['cover'] = ''
+    
+    changed = {f for f, v in data.items() if getattr(page, f) != v}
+    for field in changed:
+        setattr(page, field, data[field])
+    
+    if changed & {'title', 'icon', 'is_pinned'}:
+        bump_meta_version('pages')
+    if 'title' in changed:
+        bump_meta_version('calendar')
+    db.session.commit()
+    
+    if 'title' in changed:
+        notification_checker.reload_page(page.id)
+    if changed:
+        emit_page_event('page_updated', page.id, version=page.version,
+                        fields={f: getattr(page, f) for f in changed})
+    return jsonify({'status': 'success', 'page': page_meta_dict(page)})
 
 @bp.route('/page/<int:page_id>/delete', methods=['POST'])
 def delete_page(page_id):
@@ -75,8 +293,14 @@ def delete_page(page_id):
     
     page = db.session.get(Page, page_id)
     if page:
+        # 页面贡献的变量值归零，记入历史
+        record_variable_observations(page.id, {})
         db.session.delete(page)
+        bump_meta_version('pages')
+        bump_meta_version('calendar')
         db.session.commit()
+        notification_checker.remove_page(page_id)
+        emit_page_event('page_deleted', page_id)
         return jsonify({'status': 'success'})
     return jsonify({'error': 'Not found'}), 404
 
@@ -86,22 +310,16 @@ def process_page_variables(page):
     从页面内容中提取 {{calc|var_name: expression}}
     并更新 VariableValue 表
     """
-    content = page.content or ""
-    
-    # 1. 查找所有 calc 标签: {{calc|calc_cost: 100+20}}
-    # 格式: {{calc | 变量名 : 表达式}}
-    pattern = r'\{\{calc\|(calc_\w+):([0-9\.\+\-\*\/\(\)\s]+)\}\}'
-    matches = re.findall(pattern, content)
+    # 1. 查找所有 calc 标签（解析结果按正文哈希缓存，与链接/标签索引共用）
+    matches = parse_page_content(page.id, page.content)['calcs']
     
     # 2. 准备数据容器 { 'calc_cost': 120.0, 'calc_weight': 60.0 }
     extracted_data = {}
     
     for var_name, expression in matches:
         try:
-            # 简单的安全计算，仅允许基础数学运算
-            # 注意：eval 在生产环境有风险，但在个人工具且限制了 regex 字符集的情况下尚可
-            # 更好的做法是使用 simpleeval 库
-            value = float(eval(expression, {"__builtins__": None}, {}))
+            # 表达式由 calc 模块解析为 AST 后求值（不使用 eval），编译结果按表达式文本缓存
+            value = evaluate_expression(expression)
             
             if var_name in extracted_data:
                 extracted_data[var_name] += value
@@ -111,24 +329,26 @@ def process_page_variables(page):
             print(f"Calculation error for {var_name} in page {page.id}: {e}")
             continue
 
-    # 3. 更新数据库
-    # 先清除该页面所有的旧变量值记录（覆盖更新模式）
-    VariableValue.query.filter_by(page_id=page.id).delete()
+    # 3. 解析变量定义
+    # 策略：必须先在管理面板创建变量，否则忽略（防止拼写错误产生垃圾数据）
+    # 一次查询取出全部用到的变量定义，查询次数与 calc 标签数量无关
+    var_ids = dict(db.session.query(Variable.name, Variable.id).filter(
+        Variable.name.in_(list(extracted_data))
+    )) if extracted_data else {}
+    new_values = {
+        var_ids[var_name]: total_value
+        for var_name, total_value in extracted_data.items() if var_name in var_ids
+    }
     
-    # 写入新记录
-    for var_name, total_value in extracted_data.items():
-        # 检查变量是否已定义，如果未定义，是否要自动创建？
-        # 策略：必须先在管理面板创建变量，否则忽略（防止拼写错误产生垃圾数据）
-        # 或者：为了方便，这里先只处理已存在的变量
-        var_def = Variable.query.filter_by(name=var_name).first()
-        
-        if var_def:
-            new_val = VariableValue(
-                variable_id=var_def.id,
-                page_id=page.id,
-                value=total_value
-            )
-            db.session.add(new_val)
+    # 4. 有变化的值追加到历史日志并更新日/周/月汇总
+    record_variable_observations(page.id, new_values)
+    
+    # 5. 覆盖当前值：先清除该页面所有的旧变量值记录，再写入新记录
+    VariableValue.query.filter_by(page_id=page.id).delete()
+    db.session.add_all([
+        VariableValue(variable_id=var_id, page_id=page.id, value=value)
+        for var_id, value in new_values.items()
+    ])
     
     # 注意：这里不需要 commit，因为外层 update_page 会统一 commit
 
@@ -137,14 +357,13 @@ def process_page_variables(page):
 def list_variables():
     if 'logged_in' not in session: 
         return jsonify([]), 401
-    vars = Variable.query.all()
-    return jsonify([{
+    return versioned_json('variables', lambda: [{
         'id': v.id,
         'name': v.name,
         'display_name': v.display_name or v.name,
         'unit': v.unit,
         'color': v.color
-    } for v in vars])
+    } for v in Variable.query.all()])
 
 @bp.route('/vars/create', methods=['POST'])
 def create_variable():
@@ -168,12 +387,14 @@ def create_variable():
         chart_type=data.get('chart_type', 'line')
     )
     db.session.add(new_var)
+    bump_meta_version('variables')
     db.session.commit()
     return jsonify({'status': 'success', 'name': new_var.name})
 
 
 
 # ========== 文件上传 ==========
+# 文件按内容哈希保存，相同内容只存一份；大文件走 /uploads 分片续传协议
 @bp.route('/upload', methods=['POST'])
 def upload_file():
     if 'logged_in' not in session:
@@ -184,19 +405,61 @@ def upload_file():
     file = request.files['file']
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
-        
-    if file:
-        filename = secure_filename(file.filename)
-        # 简单的时间戳重命名防止覆盖
-        filename = f"{int(datetime.now().timestamp())}_{filename}"
-        upload_folder = os.path.join('static', 'uploads')
-        if not os.path.exists(upload_folder):
-            os.makedirs(upload_folder)
-            
-        file.save(os.path.join(upload_folder, filename))
-        return jsonify({'url': url_for('static', filename=f'uploads/{filename}')})
     
-    return jsonify({'error': 'Unknown error'}), 500
+    try:
+        return jsonify(save_stream(file.stream, file.filename))
+    except UploadError as e:
+        return jsonify({'error': str(e), **e.extra}), e.status
+
+@bp.route('/uploads', methods=['POST'])
+def upload_create():
+    """开始分片上传：{filename, size, sha256?}，sha256 命中已有文件时直接返回 url"""
+    if 'logged_in' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    data = request.json or {}
+    try:
+        result = create_upload(data.get('filename'), data.get('size'), data.get('sha256'))
+    except UploadError as e:
+        return jsonify({'error': str(e), **e.extra}), e.status
+    return jsonify(result), 200 if result['status'] == 'complete' else 201
+
+@bp.route('/uploads/<upload_id>', methods=['GET'])
+def upload_status_route(upload_id):
+    """查询已接收的字节数，断线重连后从该偏移继续"""
+    if 'logged_in' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    try:
+        return jsonify(upload_status(read_meta(upload_id)))
+    except UploadError as e:
+        return jsonify({'error': str(e), **e.extra}), e.status
+
+@bp.route('/uploads/<upload_id>', methods=['PATCH'])
+def upload_chunk(upload_id):
+    """请求体为原始分片字节，Upload-Offset 请求头为该分片在文件中的起始位置"""
+    if 'logged_in' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        return jsonify({'error': 'Upload-Offset header required'}), 400
+    try:
+        return jsonify(append_chunk(upload_id, offset, request.stream, request.content_length))
+    except UploadError as e:
+        return jsonify({'error': str(e), **e.extra}), e.status
+
+@bp.route('/uploads/<upload_id>', methods=['DELETE'])
+def upload_cancel(upload_id):
+    if 'logged_in' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    try:
+        cancel_upload(upload_id)
+    except UploadError as e:
+        return jsonify({'error': str(e), **e.extra}), e.status
+    return jsonify({'status': 'success'})
 
 
 # ========== 图谱管理 ==========
@@ -213,11 +476,20 @@ def graph_connect():
     if not page or not target_title:
         return jsonify({'error': 'Invalid data'}), 400
     
-    if f"[[@{target_title}]]" not in page.content:
+    if f"[[@{target_title}]]" not in (page.content or ""):
         page.content = (page.content or "") + f"\n\n[[@{target_title}]]"
+        page.version = (page.version or 0) + 1
+        index_page_meta(page)
+        bump_meta_version('pages')
         db.session.commit()
+        emit_page_event('page_updated', page.id, version=page.version,
+                        fields=content_event_fields(page), changed=['content'])
         
-    return jsonify({'status': 'success', 'content': page.content})
+    return jsonify({
+        'status': 'success',
+        'content': page.content,
+        'links': [l.target_title for l in page.links]
+    })
 
 @bp.route('/graph/disconnect', methods=['POST'])
 def graph_disconnect():
@@ -233,10 +505,19 @@ def graph_disconnect():
         return jsonify({'error': 'Page not found'}), 404
     
     pattern = re.compile(rf'\[\[@{re.escape(target_title)}\]\]')
-    page.content = pattern.sub('', page.content)
+    page.content = pattern.sub('', page.content or "")
+    page.version = (page.version or 0) + 1
+    index_page_meta(page)
+    bump_meta_version('pages')
     db.session.commit()
+    emit_page_event('page_updated', page.id, version=page.version,
+                    fields=content_event_fields(page), changed=['content'])
     
-    return jsonify({'status': 'success', 'content': page.content})
+    return jsonify({
+        'status': 'success',
+        'content': page.content,
+        'links': [l.target_title for l in page.links]
+    })
 
 @bp.route('/page/<int:page_id>/save_graph', methods=['POST'])
 def save_graph_config(page_id):
@@ -251,6 +532,10 @@ def save_graph_config(page_id):
 # ========== 日历导入导出 ==========
 @bp.route('/calendar/import', methods=['POST'])
 def import_ics():
+    """
+    流式导入 ICS：逐个解析 VEVENT（支持 DTEND/DURATION、TZID、RRULE），每满一块写成一个导入页面
+    不再把整个文件读入内存，也不再生成单个巨大的页面
+    """
     if 'logged_in' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     
@@ -258,135 +543,115 @@ def import_ics():
         return jsonify({'error': 'No file'}), 400
     file = request.files['file']
     
+    def run():
+        """边解析边写入；每写入一个页面就通知调度器和各客户端"""
+        try:
+            for message in import_ics_stream(file.stream, request.content_length):
+                if message['type'] == 'page':
+                    notification_checker.reload_page(message['page_id'])
+                    page = db.session.get(Page, message['page_id'])
+                    emit_page_event('page_created', page.id, version=page.version, fields=page_summary_dict(page))
+                yield message
+        except Exception as e:
+            db.session.rollback()
+            yield {'type': 'error', 'error': str(e)}
+    
+    # 请求 application/x-ndjson 时逐行返回进度，否则导入完成后返回汇总
+    if 'application/x-ndjson' in request.headers.get('Accept', ''):
+        lines = (json.dumps(message) + '\n' for message in run())
+        return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+    
+    result = None
+    for result in run():
+        pass
+    if result['type'] == 'error':
+        return jsonify({'error': result['error']}), 500
+    return jsonify({
+        'status': 'success',
+        'page_id': result['page_ids'][0] if result['page_ids'] else None,
+        **result
+    })
+
+@bp.route('/calendar/events')
+def list_calendar_events():
+    """按日期范围查询日历事件: /api/calendar/events?start=YYYY-MM-DD&end=YYYY-MM-DD"""
+    if 'logged_in' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
     try:
-        cal = ICalCalendar.from_ical(file.read())
-        content_lines = ["# Imported Calendar Events\n"]
-        
-        for component in cal.walk():
-            if component.name == "VEVENT":
-                summary = component.get('summary')
-                dtstart = component.get('dtstart').dt
-                
-                if isinstance(dtstart, datetime):
-                    d_str = dtstart.strftime('%Y.%m.%d')
-                    t_str = dtstart.strftime('%H:%M')
-                    line = f"@{d_str} {t_str} [{summary}]"
-                else:
-                    d_str = dtstart.strftime('%Y.%m.%d')
-                    line = f"@{d_str} [{summary}]"
-                
-                content_lines.append(line)
-        
-        new_page = Page(
-            title=f"Imported-{datetime.now().strftime('%m%d')}",
-            page_type="doc",
-            icon="📥",
-            content="\n\n".join(content_lines)
-        )
-        db.session.add(new_page)
-        db.session.commit()
-        
-        return jsonify({'status': 'success', 'page_id': new_page.id})
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        start = request.args.get('start')
+        end = request.args.get('end')
+        start = datetime.strptime(start, '%Y-%m-%d').date() if start else None
+        end = datetime.strptime(end, '%Y-%m-%d').date() if end else None
+    except ValueError:
+        return jsonify({'error': 'Invalid date'}), 400
+    
+    return versioned_json('calendar', lambda: extract_calendar_events(start, end))
 
 @bp.route('/calendar/export')
 def export_ics():
+    """下载全部日历事件（与 /calendar.ics 订阅源相同的内容和缓存）"""
     if 'logged_in' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
+    return feed_response(filename='calendar.ics')
     
-    from app.utils.helpers import extract_calendar_events
-    from flask import make_response
-    
-    events = extract_calendar_events()
-    cal = ICalCalendar()
-    cal.add('prodid', '-//Nation Pro Calendar//mxm.dk//')
-    cal.add('version', '2.0')
+#=====================自定义变量============================
+def parse_stats_args():
+    """解析统计接口的公共参数: bucket / start / end / points，不合法时抛出 ValueError"""
+    period = request.args.get('bucket', 'day')
+    if period not in ROLLUP_PERIODS:
+        raise ValueError(f"bucket must be one of {', '.join(ROLLUP_PERIODS)}")
+    try:
+        start = request.args.get('start')
+        end = request.args.get('end')
+        start = datetime.strptime(start, '%Y-%m-%d').date() if start else None
+        end = datetime.strptime(end, '%Y-%m-%d').date() if end else None
+    except ValueError:
+        raise ValueError('Invalid date')
+    points = request.args.get('points', type=int)
+    if points is not None:
+        points = min(max(points, 2), 2000)
+    return {'period': period, 'start': start, 'end': end, 'points': points}
+
+@bp.route('/vars/stats', methods=['GET'])
+def get_variables_stats():
+    """
+    批量获取多个变量的统计数据，仪表盘一次请求加载全部图表
+    /api/vars/stats?ids=1,2,3&bucket=day&start=YYYY-MM-DD&end=YYYY-MM-DD&points=60
+    ids 省略时返回所有变量；返回 {变量ID: 与单变量接口相同的结构}
+    """
+    if 'logged_in' not in session: return jsonify({'error': 'Unauthorized'}), 401
     
-    for e in events:
-        event = ICalEvent()
-        event.add('summary', f"{e['title']} (from {e['source_page']})")
-        
-        start_str = f"{e['date']} {e.get('start', '00:00')}"
-        dt_start = datetime.strptime(start_str, '%Y-%m-%d %H:%M')
-        event.add('dtstart', dt_start)
-        
-        if e.get('end'):
-            end_str = f"{e['date']} {e.get('end')}"
-            dt_end = datetime.strptime(end_str, '%Y-%m-%d %H:%M')
-            event.add('dtend', dt_end)
+    try:
+        args = parse_stats_args()
+        ids = request.args.get('ids')
+        if ids:
+            var_ids = [int(i) for i in ids.split(',') if i.strip()]
         else:
-            event.add('dtend', dt_start + timedelta(hours=1))
-            
-        cal.add_component(event)
-        
-    response = make_response(cal.to_ical())
-    response.headers["Content-Disposition"] = "attachment; filename=calendar.ics"
-    response.headers["Content-Type"] = "text/calendar"
-    return response
+            var_ids = [v.id for v in db.session.query(Variable.id)]
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-#=====================自定义变量============================
+    return jsonify(variable_stats(var_ids, **args))
+
 @bp.route('/vars/<int:var_id>/stats', methods=['GET'])
 def get_variable_stats(var_id):
     """
     获取变量的统计数据，用于前端绘图
     返回:
-    1. timeline: 按日期聚合的总值 (折线图)
-    2. distribution: 按页面聚合的总值 (饼图)
+    1. timeline: 按 日/周/月 (?bucket=day|week|month) 聚合的变化量 (折线图)，支持 start/end/points
+    2. distribution: 按页面聚合的总值 (饼图)，前 10 个来源之外合并为 Others
     """
     if 'logged_in' not in session: return jsonify({'error': 'Unauthorized'}), 401
     
-    var = db.session.get(Variable, var_id)
-    if not var: return jsonify({'error': 'Variable not found'}), 404
-    
-    # 1. 获取所有记录
-    values = VariableValue.query.filter_by(variable_id=var_id).all()
-    
-    # 2. 聚合逻辑 - 时间轴 (Line Chart)
-    # 按更新日期的 "YYYY-MM-DD" 聚合
-    timeline_map = {}
-    
-    # 3. 聚合逻辑 - 分布 (Pie Chart)
-    # 按页面标题聚合
-    dist_map = {}
-    
-    for v in values:
-        # 时间聚合
-        date_str = v.updated_at.strftime('%Y-%m-%d')
-        if date_str not in timeline_map: timeline_map[date_str] = 0
-        timeline_map[date_str] += v.value
-        
-        # 分布聚合
-        page_title = v.page.title if v.page else "Unknown"
-        if page_title not in dist_map: dist_map[page_title] = 0
-        dist_map[page_title] += v.value
-        
-    # 排序并格式化
-    sorted_dates = sorted(timeline_map.keys())
-    timeline_data = {
-        'labels': sorted_dates,
-        'values': [timeline_map[d] for d in sorted_dates]
-    }
-    
-    # 饼图数据 (取前10个来源，其他的合并为 Others)
-    sorted_dist = sorted(dist_map.items(), key=lambda x: x[1], reverse=True)
-    pie_labels = [x[0] for x in sorted_dist[:10]]
-    pie_values = [x[1] for x in sorted_dist[:10]]
+    try:
+        args = parse_stats_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    if len(sorted_dist) > 10:
-        others_val = sum([x[1] for x in sorted_dist[10:]])
-        pie_labels.append('Others')
-        pie_values.append(others_val)
-        
-    return jsonify({
-        'variable': {
-            'name': var.display_name,
-            'unit': var.unit,
-            'color': var.color
-        },
-        'timeline': timeline_data,
-        'distribution': {'labels': pie_labels, 'values': pie_values}
-    })
+    stats = variable_stats([var_id], **args)
+    if var_id not in stats: return jsonify({'error': 'Variable not found'}), 404
+    return jsonify(stats[var_id])
     
 @bp.route('/vars/<int:var_id>/delete', methods=['POST'])
 def delete_variable(var_id):
@@ -402,7 +667,9 @@ def delete_variable(var_id):
     try:
         # 由于在 models 中可能没有设置 cascade delete，我们手动清理关联数据
         VariableValue.query.filter_by(variable_id=var_id).delete()
+        delete_variable_history(var_id)
         db.session.delete(var)
+        bump_meta_version('variables')
         db.session.commit()
         return jsonify({'status': 'success'})
     except Exception as e:
@@ -419,7 +686,9 @@ def toggle_pin(page_id):
     page = db.session.get(Page, page_id)
     if page:
         page.is_pinned = not page.is_pinned
+        bump_meta_version('pages')
         db.session.commit()
+        emit_page_event('page_updated', page.id, version=page.version, fields={'is_pinned': page.is_pinned})
         return jsonify({
             'status': 'success', 
             'is_pinned': page.is_pinned
@@ -1,23 +1,30 @@
 # app/routes/main.py
 from flask import Blueprint, render_template, request, redirect, url_for, session, jsonify
 from app import db
-from app.models.page import Page, DailyLog, Variable
-from app.utils.helpers import parse_content_meta, extract_calendar_events, extract_notices
-from datetime import datetime, date
-import json
+from app.models.page import Page, DailyLog
+from app.utils.helpers import page_summary_query
+from app.utils.ics import feed_response
+from datetime import datetime, date, timedelta
+import hmac
+import os
 
 bp = Blueprint('main', __name__)
 
+# 日历订阅令牌：日历客户端无法登录，设置后可用 /calendar.ics?token=... 订阅
+CALENDAR_FEED_TOKEN = os.environ.get('CALENDAR_FEED_TOKEN', '')
+# past / future 滚动窗口的上限（天）
+CALENDAR_FEED_MAX_DAYS = int(os.environ.get('CALENDAR_FEED_MAX_DAYS', 3650))
+
 @bp.route('/')
 def index():
     if 'logged_in' not in session:
         return redirect(url_for('auth.login'))
     
-    first = Page.query.first()
+    first = db.session.query(Page.id).first()
     if not first:
         from app.utils.helpers import init_db_data
         init_db_data()
-        first = Page.query.first()
+        first = db.session.query(Page.id).first()
     return redirect(url_for('main.view_page', page_id=first.id))
 
 @bp.route('/p/<int:page_id>')
@@ -25,37 +32,20 @@ def view_page(page_id):
     if 'logged_in' not in session:
         return redirect(url_for('auth.login'))
     
-    pages = Page.query.order_by(Page.created_at).all()
+    # 侧边栏只需要标题/图标等元数据
+    pages = page_summary_query().all()
     current_page = db.session.get(Page, page_id)
     if not current_page:
         return redirect(url_for('main.index'))
     
-    nodes, edges, page_tags_map = parse_content_meta(pages)
-    cal_events = extract_calendar_events()
-    global_notices = extract_notices()
-    
-    # 获取所有定义的变量供前端选择
-    all_vars = Variable.query.all()
-    vars_json = json.dumps([{
-        'name': v.name, 
-        'display_name': v.display_name, 
-        'unit': v.unit
-    } for v in all_vars])
-    
+    # 图谱、提醒、变量等全库元数据由 /api/meta/* 和 /api/vars/list 按 ETag 缓存提供，
+    # 这里只渲染当前页面
     context = {
         'pages': pages,
         'current_page': current_page,
-        'graph_data': json.dumps({'nodes': nodes, 'edges': edges}),
         'graph_config': current_page.graph_config if current_page.page_type == 'graph' else '{}',
-        'all_files_meta': json.dumps(nodes),
-        'calendar_events': json.dumps(cal_events),
-        'global_notices': json.dumps(global_notices),
-        'all_variables': vars_json,
     }
 
-    if current_page.page_type == 'calendar':
-        context['calendar_events'] = json.dumps(extract_calendar_events())
-
     if current_page.page_type == 'tracker':
         target_date_str = request.args.get('date', date.today().strftime('%Y-%m-%d'))
         try:
@@ -66,4 +56,38 @@ def view_page(page_id):
         context['tracker_date'] = target_date_str
         context['tracker_content'] = log.content if log else ""
 
-    return render_template('index.html', **context)
\ No newline at end of file
+    return render_template('index.html', **context)
+
+@bp.route('/calendar.ics')
+def calendar_feed():
+    """
+    可订阅的日历源: /calendar.ics?token=...&start=YYYY-MM-DD&end=YYYY-MM-DD
+    也可用 past=天数 / future=天数 指定相对今天的滚动窗口；提醒组件以 RRULE 导出
+    """
+    # compare_digest 只接受 ASCII 字符串，按 UTF-8 字节比较，非 ASCII 的令牌同样返回 401
+    token = request.args.get('token', '').encode('utf-8')
+    if 'logged_in' not in session and not (
+        CALENDAR_FEED_TOKEN and hmac.compare_digest(token, CALENDAR_FEED_TOKEN.encode('utf-8'))
+    ):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    try:
+        start = request.args.get('start')
+        end = request.args.get('end')
+        start = datetime.strptime(start, '%Y-%m-%d').date() if start else None
+        end = datetime.strptime(end, '%Y-%m-%d').date() if end else None
+        past = request.args.get('past')
+        future = request.args.get('future')
+        past = int(past) if past else None
+        future = int(future) if future else None
+        for days in (past, future):
+            if days is not None and not 0 <= days <= CALENDAR_FEED_MAX_DAYS:
+                raise ValueError(days)
+        if past is not None:
+            start = date.today() - timedelta(days=past)
+        if future is not None:
+            end = date.today() + timedelta(days=future)
+    except (ValueError, OverflowError):
+        return jsonify({'error': 'Invalid date window'}), 400
+    
+    return feed_response(start, end)
@@ -0,0 +1,111 @@
+# app/utils/cache.py
+import math
+import time
+from collections import OrderedDict, deque
+from threading import Lock
+
+
+class LRUCache:
+    """
+    线程安全的定长 LRU 缓存
+    超出容量时淘汰最久未使用的条目，并统计命中/未命中/淘汰次数
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max(int(max_entries), 1)
+        self.data = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.data:
+                self.data.move_to_end(key)
+                self.hits += 1
+                return self.data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self.lock:
+            return self.data.pop(key, default)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self.data),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
+
+
+class TimeBucketDedupe:
+    """
+    按时间分桶的去重集合
+    键记录在当前时间桶中，整桶超过保留时间后一起丢弃；
+    一个键写入后至少在 retention 秒内都会被判定为重复，内存只与窗口内的键数量相关
+    """
+
+    def __init__(self, retention=120, bucket_seconds=60):
+        self.retention = retention
+        self.bucket_seconds = bucket_seconds
+        # 多保留一个桶：最早的桶即使刚好在边界写入，也能覆盖完整的 retention
+        self.max_buckets = math.ceil(retention / bucket_seconds) + 1
+        self.buckets = deque()  # (桶序号, {键})，按时间从旧到新
+        self.lock = Lock()
+        self.suppressed = 0
+
+    def _expire(self, now):
+        current = int(now // self.bucket_seconds)
+        while self.buckets and self.buckets[0][0] <= current - self.max_buckets:
+            self.buckets.popleft()
+        return current
+
+    def add(self, key, now=None):
+        """窗口内首次出现返回 True 并记录；重复返回 False"""
+        now = time.time() if now is None else now
+        with self.lock:
+            current = self._expire(now)
+            if any(key in keys for _, keys in self.buckets):
+                self.suppressed += 1
+                return False
+            if not self.buckets or self.buckets[-1][0] != current:
+                self.buckets.append((current, set()))
+            self.buckets[-1][1].add(key)
+            return True
+
+    def __contains__(self, key):
+        with self.lock:
+            self._expire(time.time())
+            return any(key in keys for _, keys in self.buckets)
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(keys) for _, keys in self.buckets)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': sum(len(keys) for _, keys in self.buckets),
+                'buckets': len(self.buckets),
+                'retention': self.retention,
+                'suppressed': self.suppressed
+            }
@@ -0,0 +1,172 @@
+# app/utils/calc.py
+import os
+import re
+from app.utils.cache import LRUCache
+
+# 编译结果按表达式文本缓存，同一表达式在多次自动保存之间只解析一次
+calc_cache = LRUCache(int(os.environ.get('CALC_CACHE_SIZE', 1024)))
+
+TOKEN_PATTERN = re.compile(r'\s*(?:(\d+\.?\d*|\.\d+)|(\*\*|//|[-+*/()]))')
+
+# 最大嵌套深度（括号、一元符号、** 链），防止恶意输入耗尽递归栈
+# 每层括号在解析时占 6 个栈帧，100 层连同求值仍远低于 Python 默认的 1000 层递归上限
+# 同级的 + - * / // 运算链解析为一个多元节点，链再长也不增加深度
+MAX_DEPTH = 100
+# 指数绝对值上限，超过时不计算乘方
+MAX_EXPONENT = 1000
+
+
+class CalcError(ValueError):
+    """表达式无法解析"""
+
+
+def tokenize(expression):
+    tokens = []
+    pos = 0
+    expression = expression.rstrip()
+    while pos < len(expression):
+        match = TOKEN_PATTERN.match(expression, pos)
+        if not match:
+            raise CalcError(f"无法识别的字符: {expression[pos:pos + 10]!r}")
+        number, op = match.groups()
+        tokens.append(('num', float(number)) if number is not None else ('op', op))
+        pos = match.end()
+    return tokens
+
+
+class Parser:
+    """
+    递归下降解析器，语法与 Python 算术一致:
+        expr   := term (('+' | '-') term)*
+        term   := unary (('*' | '/' | '//') unary)*
+        unary  := ('+' | '-') unary | power
+        power  := atom ('**' unary)?
+        atom   := NUMBER | '(' expr ')'
+    结果是嵌套元组形式的 AST: ('num', v) / ('neg', node) / ('**', base, exponent) /
+    ('chain', first, ((op, node), ...))，后者是左结合的同级运算链，求值时按顺序循环计算
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+        self.depth = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take_op(self, *ops):
+        kind, value = self.peek()
+        if kind == 'op' and value in ops:
+            self.pos += 1
+            return value
+        return None
+
+    def parse(self):
+        if not self.tokens:
+            raise CalcError("空表达式")
+        node = self.expr()
+        if self.pos != len(self.tokens):
+            raise CalcError(f"多余的符号: {self.peek()[1]}")
+        return node
+
+    def expr(self):
+        first, rest = self.term(), []
+        while True:
+            op = self.take_op('+', '-')
+            if not op:
+                return ('chain', first, tuple(rest)) if rest else first
+            rest.append((op, self.term()))
+
+    def term(self):
+        first, rest = self.unary(), []
+        while True:
+            op = self.take_op('*', '/', '//')
+            if not op:
+                return ('chain', first, tuple(rest)) if rest else first
+            rest.append((op, self.unary()))
+
+    def nested(self, parse):
+        """进入一层递归解析，超过 MAX_DEPTH 时报错"""
+        self.depth += 1
+        if self.depth > MAX_DEPTH:
+            raise CalcError("表达式嵌套过深")
+        node = parse()
+        self.depth -= 1
+        return node
+
+    def unary(self):
+        op = self.take_op('+', '-')
+        if not op:
+            return self.power()
+        operand = self.nested(self.unary)
+        return ('neg', operand) if op == '-' else operand
+
+    def power(self):
+        node = self.atom()
+        if self.take_op('**'):
+            # 右结合的 ** 链每一层都会递归
+            node = ('**', node, self.nested(self.unary))
+        return node
+
+    def atom(self):
+        kind, value = self.peek()
+        if kind == 'num':
+            self.pos += 1
+            return ('num', value)
+        if self.take_op('('):
+            node = self.nested(self.expr)
+            if not self.take_op(')'):
+                raise CalcError("缺少右括号")
+            return node
+        raise CalcError(f"意外的符号: {value}" if value is not None else "表达式不完整")
+
+
+def power(base, exponent):
+    if abs(exponent) > MAX_EXPONENT:
+        raise CalcError("指数过大")
+    return base ** exponent
+
+
+BINARY_OPS = {
+    '+': lambda a, b: a + b,
+    '-': lambda a, b: a - b,
+    '*': lambda a, b: a * b,
+    '/': lambda a, b: a / b,
+    '//': lambda a, b: a // b,
+    '**': power,
+}
+
+
+def evaluate_node(node):
+    """递归求值；运算链按顺序循环计算，递归深度只随嵌套增长（已由解析器限制）"""
+    kind = node[0]
+    if kind == 'num':
+        return node[1]
+    if kind == 'neg':
+        return -evaluate_node(node[1])
+    if kind == 'chain':
+        value = evaluate_node(node[1])
+        for op, operand in node[2]:
+            value = BINARY_OPS[op](value, evaluate_node(operand))
+        return value
+    return BINARY_OPS[kind](evaluate_node(node[1]), evaluate_node(node[2]))
+
+
+def compile_expression(expression):
+    """解析表达式为 AST，按表达式文本缓存"""
+    node = calc_cache.get(expression)
+    if node is None:
+        node = Parser(tokenize(expression)).parse()
+        calc_cache.put(expression, node)
+    return node
+
+
+def evaluate_expression(expression):
+    """
+    计算 calc 标签中的算术表达式（不使用 eval）
+    全程使用浮点运算，溢出/除零/复数结果会抛出异常
+    """
+    value = evaluate_node(compile_expression(expression))
+    if isinstance(value, complex):
+        raise CalcError("结果不是实数")
+    return float(value)
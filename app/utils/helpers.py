@@ -1,79 +1,291 @@
 # app/utils/helpers.py
 import re
+import os
 import json
+import random
+import hashlib
 from datetime import datetime
+from flask import request, jsonify, make_response
 from app import db
-from app.models.page import Page, DailyLog
+from app.models.page import Page, DailyLog, PageLink, PageTag, CalendarEvent, PageNotice, MetaVersion
+from app.utils.cache import LRUCache
+
+LINK_PATTERN = re.compile(r'\[\[@(.*?)\]\]')
+TAG_PATTERN = re.compile(r'\[\[(?!@)(.*?)\]\]')
+NOTICE_PATTERN = re.compile(r'\{\{notice\|(.*?)\|(.*?)\}\}')
+EVENT_PATTERN = re.compile(r'@(\d{4}[.\-]\d{2}[.\-]\d{2})(?:\s+(\d{1,2}:\d{2})(?:-(\d{1,2}:\d{2}))?)?\s*\[(.*?)(?:\|(.*?))?\]')
+# 格式: {{calc|变量名:表达式}}，例如 {{calc|calc_cost: 100+20}}
+CALC_PATTERN = re.compile(r'\{\{calc\|(calc_\w+):([0-9\.\+\-\*\/\(\)\s]+)\}\}')
+
+# 页面派生数据缓存：按 (page_id, 正文哈希) 缓存解析结果，正文不变就不再重复解析
+page_parse_cache = LRUCache(int(os.environ.get('PARSE_CACHE_SIZE', 512)))
+page_cache_keys = {}  # page_id -> 当前版本的缓存键，用于及时释放旧版本
+
+def extract_links_and_tags(content):
+    """从正文中提取出链标题和标签（均去重）"""
+    content = content or ""
+    return set(LINK_PATTERN.findall(content)), set(TAG_PATTERN.findall(content))
+
+def extract_page_events(content):
+    """
+    从正文中提取日历事件，返回 (date, start, end, title, reminder) 元组集合
+    日期非法的条目（例如 2024.13.45）直接跳过
+    """
+    events = set()
+    for date_str, start_time, end_time, event_name, reminder_rule in EVENT_PATTERN.findall(content or ""):
+        try:
+            event_date = datetime.strptime(date_str.replace('.', '-'), '%Y-%m-%d').date()
+        except ValueError:
+            continue
+        events.add((
+            event_date,
+            start_time or None,
+            end_time or None,
+            event_name,
+            reminder_rule.strip() if reminder_rule else None
+        ))
+    return events
 
-def parse_content_meta(pages):
-    """解析页面内容，提取节点、边和标签"""
+def extract_page_notices(content):
+    """从正文中提取提醒组件，返回 (condition, content) 元组集合"""
+    return {
+        (condition.strip(), text.strip())
+        for condition, text in NOTICE_PATTERN.findall(content or "")
+    }
+
+def parse_page_content(page_id, content):
+    """
+    返回页面正文的全部派生数据: links / tags / events / notices / calcs
+    命中 (page_id, 正文哈希) 缓存时直接返回，不重新解析
+    """
+    content = content or ""
+    key = (page_id, hashlib.sha1(content.encode('utf-8')).hexdigest())
+    parsed = page_parse_cache.get(key)
+    if parsed is not None:
+        return parsed
+    
+    links, tags = extract_links_and_tags(content)
+    parsed = {
+        'links': frozenset(links),
+        'tags': frozenset(tags),
+        'events': frozenset(extract_page_events(content)),
+        'notices': frozenset(extract_page_notices(content)),
+        'calcs': tuple((name, expr.strip()) for name, expr in CALC_PATTERN.findall(content))
+    }
+    page_parse_cache.put(key, parsed)
+    
+    if page_id is not None:
+        old_key = page_cache_keys.get(page_id)
+        if old_key and old_key != key:
+            page_parse_cache.pop(old_key)
+        page_cache_keys[page_id] = key
+    return parsed
+
+def index_page_meta(page):
+    """
+    增量更新单个页面的链接/标签/日历事件/提醒索引
+    只增删有变化的行；不负责 commit，由调用方统一提交
+    """
+    parsed = parse_page_content(page.id, page.content)
+    links, tags = parsed['links'], parsed['tags']
+    
+    current_links = {l.target_title: l for l in page.links}
+    for title in set(current_links) - links:
+        page.links.remove(current_links[title])
+    for title in links - set(current_links):
+        page.links.append(PageLink(target_title=title))
+    
+    current_tags = {t.tag: t for t in page.tags}
+    for tag in set(current_tags) - tags:
+        page.tags.remove(current_tags[tag])
+    for tag in tags - set(current_tags):
+        page.tags.append(PageTag(tag=tag))
+    
+    events = parsed['events']
+    current_events = {(e.date, e.start, e.end, e.title, e.reminder): e for e in page.events}
+    notices = parsed['notices']
+    current_notices = {(n.condition, n.content): n for n in page.notices}
+    # 日历订阅源只在事件或提醒变化时重新生成
+    if events != set(current_events) or notices != set(current_notices):
+        bump_meta_version('calendar')
+    
+    for key in set(current_events) - events:
+        page.events.remove(current_events[key])
+    for event_date, start, end, title, reminder in events - set(current_events):
+        page.events.append(CalendarEvent(
+            date=event_date, start=start, end=end, title=title, reminder=reminder
+        ))
+    
+    for key in set(current_notices) - notices:
+        page.notices.remove(current_notices[key])
+    for condition, text in notices - set(current_notices):
+        page.notices.append(PageNotice(condition=condition, content=text))
+
+def rebuild_page_index():
+    """全量重建链接/标签/日历事件/提醒索引（用于旧数据库首次升级）"""
+    for page in Page.query.yield_per(100):
+        index_page_meta(page)
+    db.session.commit()
+
+def page_summary_query():
+    """页面摘要查询：只取侧边栏/图谱需要的列，不加载 content 和 graph_config"""
+    return db.session.query(
+        Page.id, Page.title, Page.icon, Page.page_type, Page.is_pinned, Page.created_at
+    ).order_by(Page.created_at, Page.id)
+
+def page_summary_dict(p):
+    """把页面摘要行转换为前端使用的字典"""
+    return {
+        'id': p.id,
+        'title': p.title,
+        'icon': p.icon,
+        'type': p.page_type,
+        'is_pinned': bool(p.is_pinned),
+        'created_at': p.created_at.isoformat() if p.created_at else None
+    }
+
+def page_meta_dict(page):
+    """页面头部片段（标题/图标/封面/置顶），元数据更新接口返回它供前端原地刷新"""
+    data = page_summary_dict(page)
+    data['cover'] = page.cover or ''
+    data['version'] = page.version or 0
+    return data
+
+def build_graph_meta():
+    """基于链接/标签索引构建节点、边和标签，不读取页面正文"""
     nodes = []
     edges = []
+    pages = page_summary_query().all()
     page_map = {p.title: p.id for p in pages}
+    
     page_tags = {}
-
-    link_pattern = re.compile(r'\[\[@(.*?)\]\]')
-    tag_pattern = re.compile(r'\[\[(?!@)(.*?)\]\]')
-
+    for page_id, tag in db.session.query(PageTag.page_id, PageTag.tag):
+        page_tags.setdefault(page_id, []).append(tag)
+    
+    page_links = {}
+    for source_id, target_title in db.session.query(PageLink.source_id, PageLink.target_title):
+        page_links.setdefault(source_id, []).append(target_title)
+        target_id = page_map.get(target_title)
+        if target_id:
+            edges.append({'from': source_id, 'to': target_id})
+    
     for p in pages:
-        tags = tag_pattern.findall(p.content)
-        page_tags[p.id] = list(set(tags))
-
         nodes.append({
             'id': p.id,
             'label': f"{p.icon} {p.title}",
             'group': p.page_type,
-            'tags': page_tags[p.id],
+            'tags': page_tags.get(p.id, []),
+            'links': page_links.get(p.id, []),
             'last_modified': p.created_at.strftime('%Y-%m-%d') if p.created_at else ''
         })
-
-        links = link_pattern.findall(p.content)
-        for link_title in links:
-            target_id = page_map.get(link_title)
-            if target_id:
-                edges.append({'from': p.id, 'to': target_id})
-
+    
     return nodes, edges, page_tags
 
-def extract_calendar_events():
-    """从所有页面中提取日历事件"""
-    events = []
-    pages = Page.query.all()
+def extract_calendar_events(start=None, end=None):
+    """
+    从日历事件表中查询事件，可按日期范围过滤（闭区间，date 对象）
+    """
+    query = db.session.query(CalendarEvent, Page.title).join(Page, Page.id == CalendarEvent.page_id)
+    if start:
+        query = query.filter(CalendarEvent.date >= start)
+    if end:
+        query = query.filter(CalendarEvent.date <= end)
     
-    pattern = re.compile(r'@(\d{4}[.\-]\d{2}[.\-]\d{2})(?:\s+(\d{1,2}:\d{2})(?:-(\d{1,2}:\d{2}))?)?\s*\[(.*?)(?:\|(.*?))?\]')
-    
-    for p in pages:
-        matches = pattern.findall(p.content)
-        for date_str, start_time, end_time, event_name, reminder_rule in matches:
-            clean_date = date_str.replace('.', '-')
-            events.append({
-                'id': p.id,
-                'title': event_name,
-                'date': clean_date,
-                'start': start_time if start_time else None,
-                'end': end_time if end_time else None,
-                'source_page': p.title,
-                'reminder': reminder_rule.strip() if reminder_rule else None
-            })
+    events = []
+    for e, page_title in query.order_by(CalendarEvent.date, CalendarEvent.start):
+        events.append({
+            'id': e.page_id,
+            'title': e.title,
+            'date': e.date.strftime('%Y-%m-%d'),
+            'start': e.start,
+            'end': e.end,
+            'source_page': page_title,
+            'reminder': e.reminder
+        })
     return events
 
 def extract_notices():
-    """从所有页面中提取通知组件"""
+    """从提醒表中查询所有通知组件"""
     notices = []
-    pages = Page.query.all()
-    pattern = re.compile(r'\{\{notice\|(.*?)\|(.*?)\}\}')
-    
-    for p in pages:
-        matches = pattern.findall(p.content)
-        for condition, content in matches:
-            notices.append({
-                'page_id': p.id,
-                'source_page': p.title,
-                'condition': condition.strip(),
-                'content': content.strip()
-            })
+    query = db.session.query(PageNotice, Page.title).join(Page, Page.id == PageNotice.page_id)
+    for n, page_title in query.order_by(PageNotice.page_id, PageNotice.id):
+        notices.append({
+            'page_id': n.page_id,
+            'source_page': page_title,
+            'condition': n.condition,
+            'content': n.content
+        })
     return notices
 
+def utf16_len(text):
+    """按 UTF-16 码元计算长度，与浏览器 String.length 一致"""
+    return len((text or "").encode('utf-16-le')) // 2
+
+def apply_text_patch(text, ops):
+    """
+    把补丁应用到文本上
+    ops: [{'pos': 起点, 'del': 删除长度, 'ins': 插入文本}, ...]，位置均相对原文、按 pos 升序且互不重叠，
+    偏移按 UTF-16 码元计算（与前端一致，避免 emoji 等补充平面字符错位）
+    类型不符的操作（字符串偏移、布尔值、非字符串的 ins 等）直接拒绝，不做隐式转换
+    """
+    if not isinstance(ops, list):
+        raise ValueError('Patch must be a list')
+    buf = (text or "").encode('utf-16-le')
+    parts = []
+    cursor = 0
+    for op in ops:
+        if not isinstance(op, dict):
+            raise ValueError('Invalid patch op')
+        pos, length, ins = op.get('pos'), op.get('del', 0), op.get('ins', '')
+        # bool 是 int 的子类，需要单独排除
+        if type(pos) is not int or type(length) is not int or not isinstance(ins, str):
+            raise ValueError('Invalid patch op')
+        pos *= 2
+        end = pos + length * 2
+        if pos < cursor or end < pos or end > len(buf):
+            raise ValueError('Patch out of range')
+        parts.append(buf[cursor:pos])
+        parts.append(ins.encode('utf-16-le'))
+        cursor = end
+    parts.append(buf[cursor:])
+    # 切断代理对时解码会抛出 UnicodeDecodeError（ValueError 子类）
+    return b''.join(parts).decode('utf-16-le')
+
+def get_meta_row(name):
+    """读取数据版本行；首次使用时以随机值起步，避免重建数据库后与浏览器缓存的 ETag 撞车"""
+    row = db.session.get(MetaVersion, name)
+    if not row:
+        row = MetaVersion(name=name, version=random.randint(1, 2 ** 30), updated_at=datetime.utcnow())
+        db.session.add(row)
+        db.session.commit()
+    return row
+
+def get_meta_version(name):
+    return get_meta_row(name).version
+
+def bump_meta_version(name):
+    """数据变化时递增版本（不负责 commit，随调用方的写入一起提交）"""
+    updated = MetaVersion.query.filter_by(name=name).update({
+        'version': MetaVersion.version + 1,
+        'updated_at': datetime.utcnow()
+    })
+    if not updated:
+        db.session.add(MetaVersion(name=name, version=random.randint(1, 2 ** 30), updated_at=datetime.utcnow()))
+
+def versioned_json(name, build):
+    """
+    带 ETag 的 JSON 响应
+    客户端的 If-None-Match 与当前版本一致时直接返回 304，不调用 build 重新计算
+    """
+    etag = f"{name}-{get_meta_version(name)}"
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 def init_db_data():
     """初始化数据库测试数据"""
     from app.models.page import Page
@@ -759,5 +971,8 @@ The page title uses icon `📖`, making it easily identifiable in the sidebar an
     p4 = Page(title="知识图谱", icon="🔗", page_type="graph")
     p5 = Page(title="全局日历", icon="📅", page_type="calendar")
     
+    for p in [p1, p2, p3, p4, p5]:
+        index_page_meta(p)
+    
     db.session.add_all([p1, p2, p3, p4 ,p5])
     db.session.commit()
\ No newline at end of file
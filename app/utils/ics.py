@@ -0,0 +1,466 @@
+# app/utils/ics.py
+# 流式导入 ICS：逐行读取上传文件，每次只解析一个 VEVENT，展开 RRULE 后按块写入页面和日历事件表
+# 内存占用只与单个事件和一个块的大小有关，与文件大小无关
+# 订阅源导出：按数据版本缓存，带 ETag / Last-Modified，流式输出
+import os
+import re
+import hashlib
+from datetime import datetime, timedelta
+from itertools import chain, islice
+from dateutil import tz
+from dateutil.rrule import rrulestr
+from flask import request, Response, stream_with_context
+from icalendar import Event as ICalEvent, Alarm as ICalAlarm, vRecur
+from app import db
+from app.models.page import Page, CalendarEvent, PageNotice
+from app.utils.cache import LRUCache
+from app.utils.helpers import extract_page_events, bump_meta_version, get_meta_row
+
+IMPORT_CHUNK_SIZE = int(os.environ.get('ICS_IMPORT_CHUNK_SIZE', 500))            # 每个导入页面的事件数
+IMPORT_HORIZON_DAYS = int(os.environ.get('ICS_IMPORT_HORIZON_DAYS', 365))        # 无结束的重复事件最多展开到今后多少天
+IMPORT_MAX_OCCURRENCES = int(os.environ.get('ICS_IMPORT_MAX_OCCURRENCES', 1000)) # 单个重复事件最多展开的次数
+IMPORT_MAX_SPAN_DAYS = 31                                                        # 跨天全天事件最多展开的天数
+PROGRESS_EVERY = 1000                                                            # 每解析多少个 VEVENT 报告一次进度
+
+# 标题里的这些字符会破坏 @日期 [标题|提醒] 语法，或被识别为链接/标签/提醒组件
+TITLE_UNSAFE = re.compile(r'[\[\]|{}\r\n]+')
+LOCAL_TZ = tz.tzlocal()
+
+def iter_vevents(stream):
+    """
+    逐个产出 VEVENT 组件（icalendar.Event）
+    按 RFC 5545 展开折行，只缓存当前事件的行；无法解析的事件跳过
+    """
+    block = None
+    pending = None
+
+    def finish(line):
+        nonlocal block
+        upper = line.upper()
+        if upper == 'BEGIN:VEVENT':
+            block = [line]
+        elif block is not None:
+            block.append(line)
+            if upper == 'END:VEVENT':
+                text, block = '\r\n'.join(block), None
+                try:
+                    return ICalEvent.from_ical(text)
+                except Exception:
+                    return None
+        return None
+
+    for raw in stream:
+        line = raw.decode('utf-8', errors='replace').rstrip('\r\n') if isinstance(raw, bytes) else raw.rstrip('\r\n')
+        if line[:1] in (' ', '\t'):
+            if pending is not None:
+                pending += line[1:]
+            continue
+        if pending is not None:
+            event = finish(pending)
+            if event is not None:
+                yield event
+        pending = line
+    if pending is not None:
+        event = finish(pending)
+        if event is not None:
+            yield event
+
+def to_local(value):
+    """带时区的时间转换为服务器本地时间（提醒调度使用本地时间）；浮动时间和日期原样返回"""
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(LOCAL_TZ).replace(tzinfo=None)
+    return value
+
+def alarm_reminder(component):
+    """取第一个相对开始时间的 VALARM，换算为 15m / 2h / 1d 形式的提醒"""
+    for alarm in component.walk('VALARM'):
+        trigger = alarm.get('trigger')
+        value = getattr(trigger, 'dt', None)
+        if not isinstance(value, timedelta) or value > timedelta(0):
+            continue
+        minutes = int(-value.total_seconds() // 60)
+        if minutes and minutes % 1440 == 0:
+            return f"{minutes // 1440}d"
+        if minutes and minutes % 60 == 0:
+            return f"{minutes // 60}h"
+        return f"{minutes}m"
+    return None
+
+def wall_time(value, zone):
+    """转换为 zone 中的不带时区的墙上时间；zone 为空（浮动时间）时转换为本地时间"""
+    if not isinstance(value, datetime):
+        return datetime.combine(value, datetime.min.time())
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(zone).replace(tzinfo=None) if zone else to_local(value)
+
+def attach_zone(value, zone):
+    """给墙上时间加上时区；pytz 时区需要 localize 才能得到正确的夏令时偏移"""
+    if zone is None:
+        return value
+    if hasattr(zone, 'localize'):
+        return zone.localize(value)
+    return value.replace(tzinfo=zone)
+
+def occurrence_starts(component, start):
+    """
+    展开 RRULE / RDATE / EXDATE，返回各次开始时间（仍在事件自己的时区）
+    按墙上时间展开再附加时区，跨夏令时的重复事件保持相同的本地钟点
+    """
+    rule = component.get('rrule')
+    if not rule:
+        return [start]
+    
+    is_date = not isinstance(start, datetime)
+    zone = None if is_date else start.tzinfo
+    dtstart = wall_time(start, zone)
+    
+    recur = vRecur(rule)
+    if 'UNTIL' in recur:
+        recur['UNTIL'] = [wall_time(u, zone) for u in recur['UNTIL']]
+    try:
+        rules = rrulestr('RRULE:' + recur.to_ical().decode(), dtstart=dtstart, forceset=True)
+    except (ValueError, TypeError):
+        return [start]
+    for name, add in (('rdate', rules.rdate), ('exdate', rules.exdate)):
+        values = component.get(name)
+        for item in (values if isinstance(values, list) else [values] if values else []):
+            for d in item.dts:
+                value = d.dt if isinstance(d.dt, datetime) else datetime.combine(d.dt, dtstart.time())
+                add(wall_time(value, zone))
+    
+    horizon = wall_time(datetime.now(tz.UTC), zone) + timedelta(days=IMPORT_HORIZON_DAYS)
+    starts = []
+    for value in islice(rules, IMPORT_MAX_OCCURRENCES):
+        if value > horizon:
+            break
+        starts.append(value.date() if is_date else attach_zone(value, zone))
+    return starts
+
+def event_occurrences(component):
+    """
+    把一个 VEVENT 转换为 (date, start, end, title, reminder) 元组列表
+    支持 DTEND / DURATION、TZID 和 UTC 时间、RRULE 重复；跨天的全天事件按天展开
+    """
+    dtstart = component.get('dtstart')
+    if dtstart is None:
+        return []
+    start = dtstart.dt
+    end = component.get('dtend').dt if component.get('dtend') is not None else None
+    if end is None and component.get('duration') is not None:
+        end = start + component.get('duration').dt
+    length = end - start if end is not None and type(end) is type(start) else None
+
+    title = ' '.join(TITLE_UNSAFE.sub(' ', str(component.get('summary') or '')).split())[:200] or 'Untitled'
+    reminder = alarm_reminder(component)
+
+    occurrences = []
+    for occurrence in occurrence_starts(component, start):
+        if not isinstance(occurrence, datetime):
+            days = min(max(length.days, 1) if length else 1, IMPORT_MAX_SPAN_DAYS)
+            occurrences.extend(
+                (occurrence + timedelta(days=i), None, None, title, None) for i in range(days)
+            )
+            continue
+        local_start = to_local(occurrence)
+        local_end = to_local(occurrence + length) if length else None
+        # 结束时间只在同一天时记录
+        end_str = local_end.strftime('%H:%M') if local_end and local_end.date() == local_start.date() else None
+        occurrences.append((local_start.date(), local_start.strftime('%H:%M'), end_str, title, reminder))
+    return occurrences
+
+def format_event_line(event_date, start, end, title, reminder):
+    """按页面正文的日历语法生成一行：@YYYY.MM.DD HH:MM-HH:MM [标题|提醒]"""
+    line = f"@{event_date.strftime('%Y.%m.%d')}"
+    if start:
+        line += f" {start}" + (f"-{end}" if end else "")
+    return f"{line} [{title}" + (f"|{reminder}" if reminder else "") + "]"
+
+def write_chunk(occurrences, title):
+    """
+    把一块事件写成一个导入页面，日历事件批量插入索引表并提交
+    索引行由生成的正文重新提取，与之后保存页面时 index_page_meta 的结果一致
+    """
+    lines = sorted({format_event_line(*o) for o in occurrences})
+    content = "\n\n".join(["# Imported Calendar Events\n"] + lines)
+    page = Page(title=title, page_type="doc", icon="📥", content=content)
+    db.session.add(page)
+    db.session.flush()
+
+    db.session.bulk_insert_mappings(CalendarEvent, [
+        {'page_id': page.id, 'date': d, 'start': s, 'end': e, 'title': t, 'reminder': r}
+        for d, s, e, t, r in extract_page_events(content)
+    ])
+    bump_meta_version('pages')
+    bump_meta_version('calendar')
+    db.session.commit()
+    return page
+
+def import_ics_stream(stream, total_bytes=None):
+    """
+    流式导入，逐步产出进度消息:
+      {'type': 'progress', 'vevents', 'events', 'bytes', 'total'}
+      {'type': 'page', 'page_id', 'events'}    每写入一个导入页面
+      {'type': 'done', 'page_ids', 'vevents', 'events', 'skipped'}
+    """
+    prefix = f"Imported-{datetime.now().strftime('%m%d')}"
+    buffer, page_ids = [], []
+    vevents = events = skipped = 0
+
+    def progress():
+        position = stream.tell() if hasattr(stream, 'tell') else None
+        return {'type': 'progress', 'vevents': vevents, 'events': events, 'bytes': position, 'total': total_bytes}
+
+    for component in iter_vevents(stream):
+        vevents += 1
+        try:
+            occurrences = event_occurrences(component)
+        except Exception:
+            occurrences = []
+        if not occurrences:
+            skipped += 1
+        buffer.extend(occurrences)
+
+        while len(buffer) >= IMPORT_CHUNK_SIZE:
+            chunk, buffer = buffer[:IMPORT_CHUNK_SIZE], buffer[IMPORT_CHUNK_SIZE:]
+            page = write_chunk(chunk, f"{prefix} #{len(page_ids) + 1}")
+            page_ids.append(page.id)
+            events += len(chunk)
+            yield {'type': 'page', 'page_id': page.id, 'events': len(chunk)}
+            yield progress()
+        if vevents % PROGRESS_EVERY == 0:
+            yield progress()
+
+    if buffer:
+        title = f"{prefix} #{len(page_ids) + 1}" if page_ids else prefix
+        page = write_chunk(buffer, title)
+        page_ids.append(page.id)
+        events += len(buffer)
+        yield {'type': 'page', 'page_id': page.id, 'events': len(buffer)}
+
+    yield {'type': 'done', 'page_ids': page_ids, 'vevents': vevents, 'events': events, 'skipped': skipped}
+
+# ========== 订阅源导出 ==========
+# 整个订阅源按 (calendar 数据版本, 日期窗口) 缓存；版本变化后重新生成时，
+# 未变化的事件直接复用已序列化的 VEVENT 片段，只序列化新增或修改过的行
+FEED_CACHE_SIZE = int(os.environ.get('ICS_FEED_CACHE_SIZE', 16))
+FEED_CACHE_MAX_BYTES = int(os.environ.get('ICS_FEED_CACHE_MAX_BYTES', 8 * 1024 * 1024))  # 超过此大小的订阅源不缓存整体
+FRAGMENT_CACHE_SIZE = int(os.environ.get('ICS_FEED_FRAGMENT_CACHE_SIZE', 20000))
+FEED_CHUNK_BYTES = 64 * 1024
+# 重复提醒的 DTSTART 锚点：固定值保证每次生成的内容相同
+NOTICE_ANCHOR = datetime(2000, 1, 1)
+
+FEED_HEADER = (
+    b'BEGIN:VCALENDAR\r\n'
+    b'VERSION:2.0\r\n'
+    b'PRODID:-//Nation Pro Calendar//mxm.dk//\r\n'
+    b'X-WR-CALNAME:Notiobsidian\r\n'
+)
+FEED_FOOTER = b'END:VCALENDAR\r\n'
+VEVENT_BEGIN = b'BEGIN:VEVENT\r\n'
+
+feed_cache = LRUCache(FEED_CACHE_SIZE)
+fragment_cache = LRUCache(FRAGMENT_CACHE_SIZE)
+
+def reminder_trigger(reminder):
+    """15m / 1h / 1d 形式的提醒换算为 VALARM 的 TRIGGER（与提醒调度器的解析规则一致，默认单位为分钟）"""
+    match = re.match(r'^(\d+(?:\.\d+)?)\s*([dhms])?', (reminder or '').strip().lower())
+    if not match:
+        return None
+    seconds = float(match.group(1)) * {'d': 86400, 'h': 3600, 'm': 60, 's': 1}[match.group(2) or 'm']
+    return -timedelta(seconds=seconds)
+
+def notice_schedule(condition):
+    """
+    把提醒条件换算为 (DTSTART, RRULE)，语义与 NotificationChecker.next_fire 相同:
+      [time ]YYYY-MM-DD HH:MM[:SS]  单次，RRULE 为 None
+      daily HH:MM[:SS]              每天
+      every Nm / Nh                 每小时内分钟数 / 每天内小时数能被 N 整除时触发（每小时 / 每天从 0 重新开始），
+                                    用 BYMINUTE/BYHOUR 精确表示，N 不整除 60 / 24 时同样成立（every 45m 即 :00 和 :45）
+    秒级间隔和无法解析的条件返回 None
+    """
+    condition = (condition or '').strip()
+    match = re.match(r'^(?:time )?(\d{4}-\d{2}-\d{2} \d{2}:\d{2})(:\d{2})?$', condition)
+    if match:
+        try:
+            return datetime.strptime(match.group(1) + (match.group(2) or ':00'), '%Y-%m-%d %H:%M:%S'), None
+        except ValueError:
+            return None
+    
+    match = re.match(r'^daily (\d{2}):(\d{2})(?::(\d{2}))?$', condition)
+    if match:
+        try:
+            dtstart = NOTICE_ANCHOR.replace(hour=int(match.group(1)), minute=int(match.group(2)),
+                                            second=int(match.group(3) or 0))
+        except ValueError:
+            return None
+        return dtstart, {'FREQ': 'DAILY'}
+    
+    match = re.match(r'^every (\d+)([smh])$', condition)
+    if match:
+        n, unit = int(match.group(1)), match.group(2)
+        # 秒级提醒每天上万次，不适合放进订阅日历
+        if n <= 0 or unit == 's':
+            return None
+        if unit == 'm':
+            return NOTICE_ANCHOR, {'FREQ': 'HOURLY', 'BYMINUTE': list(range(0, 60, n)), 'BYSECOND': [0]}
+        return NOTICE_ANCHOR, {'FREQ': 'DAILY', 'BYHOUR': list(range(0, 24, n)), 'BYMINUTE': [0], 'BYSECOND': [0]}
+    return None
+
+def page_url(base_url, page_id):
+    return f"{base_url.rstrip('/')}/p/{page_id}"
+
+def fragment_uid(*parts):
+    """由内容生成稳定的 UID，订阅客户端据此识别同一事件"""
+    digest = hashlib.sha1('|'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+    return f"{digest}@notiobsidian"
+
+def serialize_fragment(event):
+    """序列化 VEVENT 并去掉开头的 BEGIN 行，输出时在其后插入 DTSTAMP"""
+    return event.to_ical()[len(VEVENT_BEGIN):]
+
+def event_fragment(row, base_url=''):
+    """日历事件行对应的 VEVENT 片段（按行内容缓存）；base_url 为站点根地址，订阅客户端需要绝对 URL"""
+    key = ('event', row.page_id, row.date, row.start, row.end, row.title, row.reminder, row.page_title)
+    fragment = fragment_cache.get(key + (base_url,))
+    if fragment is not None:
+        return fragment
+    
+    event = ICalEvent()
+    event.add('uid', fragment_uid(*key))
+    event.add('summary', f"{row.title} (from {row.page_title})")
+    if row.start:
+        dtstart = datetime.strptime(f"{row.date} {row.start}", '%Y-%m-%d %H:%M')
+        dtend = datetime.strptime(f"{row.date} {row.end}", '%Y-%m-%d %H:%M') if row.end else None
+        event.add('dtstart', dtstart)
+        event.add('dtend', dtend if dtend and dtend > dtstart else dtstart + timedelta(hours=1))
+    else:
+        # 没有时间的事件导出为全天事件
+        event.add('dtstart', row.date)
+        event.add('dtend', row.date + timedelta(days=1))
+    event.add('url', page_url(base_url, row.page_id))
+    
+    trigger = reminder_trigger(row.reminder) if row.reminder else None
+    if trigger is not None:
+        alarm = ICalAlarm()
+        alarm.add('action', 'DISPLAY')
+        alarm.add('description', row.title)
+        alarm.add('trigger', trigger)
+        event.add_component(alarm)
+    
+    fragment = serialize_fragment(event)
+    fragment_cache.put(key + (base_url,), fragment)
+    return fragment
+
+def notice_fragment(row, start=None, end=None, base_url=''):
+    """提醒组件对应的 VEVENT 片段；重复提醒带 RRULE，单次提醒按日期窗口过滤；无法表示时返回 None"""
+    schedule = notice_schedule(row.condition)
+    if schedule is None:
+        return None
+    dtstart, rrule = schedule
+    if rrule is None and ((start and dtstart.date() < start) or (end and dtstart.date() > end)):
+        return None
+    
+    key = ('notice', row.page_id, row.condition, row.content, row.page_title)
+    fragment = fragment_cache.get(key + (base_url,))
+    if fragment is not None:
+        return fragment
+    
+    event = ICalEvent()
+    event.add('uid', fragment_uid(*key))
+    event.add('summary', f"🔔 {row.content} (from {row.page_title})")
+    event.add('dtstart', dtstart)
+    event.add('duration', timedelta(0))
+    if rrule:
+        event.add('rrule', rrule)
+    event.add('url', page_url(base_url, row.page_id))
+    alarm = ICalAlarm()
+    alarm.add('action', 'DISPLAY')
+    alarm.add('description', row.content)
+    alarm.add('trigger', timedelta(0))
+    event.add_component(alarm)
+    
+    fragment = serialize_fragment(event)
+    fragment_cache.put(key + (base_url,), fragment)
+    return fragment
+
+def iter_feed(start=None, end=None, stamp=None, base_url=''):
+    """逐块产出订阅源（每块约 64KB），事件按 yield_per 分批读取，不一次性加载全部行"""
+    stamp_line = f"DTSTAMP:{(stamp or datetime.utcnow()).strftime('%Y%m%dT%H%M%SZ')}\r\n".encode()
+    
+    events = db.session.query(
+        CalendarEvent.page_id, CalendarEvent.date, CalendarEvent.start, CalendarEvent.end,
+        CalendarEvent.title, CalendarEvent.reminder, Page.title.label('page_title')
+    ).join(Page, Page.id == CalendarEvent.page_id)
+    if start:
+        events = events.filter(CalendarEvent.date >= start)
+    if end:
+        events = events.filter(CalendarEvent.date <= end)
+    notices = db.session.query(
+        PageNotice.page_id, PageNotice.condition, PageNotice.content, Page.title.label('page_title')
+    ).join(Page, Page.id == PageNotice.page_id)
+    
+    parts, size = [FEED_HEADER], len(FEED_HEADER)
+    fragments = chain(
+        (event_fragment(row, base_url) for row in events.order_by(CalendarEvent.date, CalendarEvent.start).yield_per(1000)),
+        (notice_fragment(row, start, end, base_url) for row in notices.order_by(PageNotice.page_id, PageNotice.id))
+    )
+    for fragment in fragments:
+        if fragment is None:
+            continue
+        parts.extend((VEVENT_BEGIN, stamp_line, fragment))
+        size += len(VEVENT_BEGIN) + len(stamp_line) + len(fragment)
+        if size >= FEED_CHUNK_BYTES:
+            yield b''.join(parts)
+            parts, size = [], 0
+    parts.append(FEED_FOOTER)
+    yield b''.join(parts)
+
+def cached_feed(start=None, end=None):
+    """
+    返回 (ETag, Last-Modified, 字节块迭代器)
+    同一数据版本和日期窗口只生成一次；未命中时边生成边输出，完成后放入缓存
+    """
+    meta = get_meta_row('calendar')
+    base_url = request.url_root
+    key = (meta.version, start, end, base_url)
+    etag = f"calendar-{meta.version}-{start or ''}-{end or ''}"
+    stamp = meta.updated_at or datetime.utcnow()
+    
+    cached = feed_cache.get(key)
+    if cached is not None:
+        return etag, stamp, iter([cached])
+    
+    def generate():
+        parts, size = [], 0
+        for chunk in iter_feed(start, end, stamp, base_url):
+            if parts is not None:
+                parts.append(chunk)
+                size += len(chunk)
+                if size > FEED_CACHE_MAX_BYTES:
+                    parts = None
+            yield chunk
+        if parts is not None:
+            feed_cache.put(key, b''.join(parts))
+    return etag, stamp, generate()
+
+def feed_response(start=None, end=None, filename=None):
+    """
+    订阅源响应：If-None-Match / If-Modified-Since 命中时返回 304，不生成内容；否则流式输出
+    filename 不为空时作为附件下载
+    """
+    etag, last_modified, chunks = cached_feed(start, end)
+    last_modified = last_modified.replace(microsecond=0)
+    if request.if_none_match.contains(etag) or (
+        not request.if_none_match and request.if_modified_since
+        and request.if_modified_since.replace(tzinfo=None) >= last_modified
+    ):
+        response = Response(status=304)
+    else:
+        response = Response(stream_with_context(chunks), mimetype='text/calendar')
+        if filename:
+            response.headers['Content-Disposition'] = f"attachment; filename={filename}"
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,129 @@
+# app/utils/search.py
+import re
+from markupsafe import escape
+from sqlalchemy import text
+from app import db
+
+# 高亮标记先用控制字符占位，HTML 转义之后再替换成 <mark>，避免正文里的 HTML 被注入
+HL_START, HL_END = '\x02', '\x03'
+
+# 当前 SQLite 是否可用 FTS5 / trigram 分词（trigram 能按子串匹配中文，但要求每个词至少 3 个字符）
+fts_enabled = False
+fts_trigram = False
+
+TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS page_fts_ai AFTER INSERT ON page BEGIN
+        INSERT INTO page_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS page_fts_ad AFTER DELETE ON page BEGIN
+        INSERT INTO page_fts(page_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS page_fts_au AFTER UPDATE OF title, content ON page BEGIN
+        INSERT INTO page_fts(page_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO page_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+]
+
+def init_search_index():
+    """
+    创建 page_fts 全文索引（外部内容表，正文只存一份）和同步触发器
+    所有对 page 表的写入都由触发器增量同步；首次创建时全量导入已有页面
+    """
+    global fts_enabled, fts_trigram
+
+    with db.engine.begin() as conn:
+        existing = conn.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'page_fts'"
+        )).scalar()
+
+        if existing is None:
+            for tokenizer in ("trigram", "unicode61 remove_diacritics 2"):
+                try:
+                    conn.execute(text(
+                        "CREATE VIRTUAL TABLE page_fts USING fts5("
+                        f"title, content, content='page', content_rowid='id', tokenize='{tokenizer}')"
+                    ))
+                    existing = tokenizer
+                    break
+                except Exception:
+                    continue
+            else:
+                print("⚠️ 当前 SQLite 不支持 FTS5，搜索退化为 LIKE 扫描")
+                return
+            conn.execute(text("INSERT INTO page_fts(page_fts) VALUES ('rebuild')"))
+
+        for trigger in TRIGGERS:
+            conn.execute(text(trigger))
+
+    fts_enabled = True
+    fts_trigram = 'trigram' in existing
+
+def render_highlight(value):
+    """把带占位标记的文本转成安全的 HTML"""
+    return str(escape(value or '')).replace(HL_START, '<mark>').replace(HL_END, '</mark>')
+
+def build_match_query(terms):
+    """把用户输入拆成短语，逐个加引号转义后以 AND 连接"""
+    phrases = ['"' + t.replace('"', '""') + '"' for t in terms]
+    if not fts_trigram:
+        phrases = [p + '*' for p in phrases]
+    return ' AND '.join(phrases)
+
+def search_pages(query, limit=20):
+    """
+    全文搜索页面标题和正文
+    返回按相关度排序的结果，title/snippet 为带 <mark> 高亮的 HTML
+    """
+    terms = query.split()
+    if not terms:
+        return []
+
+    # trigram 无法匹配少于 3 个字符的词，这类查询走 LIKE
+    if fts_enabled and (not fts_trigram or all(len(t) >= 3 for t in terms)):
+        rows = db.session.execute(text(
+            "SELECT p.id, p.icon, "
+            "highlight(page_fts, 0, :hs, :he) AS title, "
+            "snippet(page_fts, 1, :hs, :he, '…', 16) AS snippet "
+            "FROM page_fts JOIN page p ON p.id = page_fts.rowid "
+            "WHERE page_fts MATCH :match "
+            "ORDER BY bm25(page_fts, 10.0, 1.0) LIMIT :limit"
+        ), {'hs': HL_START, 'he': HL_END, 'match': build_match_query(terms), 'limit': limit})
+        return [{
+            'id': r.id,
+            'icon': r.icon,
+            'title': render_highlight(r.title),
+            'snippet': render_highlight(r.snippet)
+        } for r in rows]
+
+    return search_pages_like(terms, limit)
+
+def search_pages_like(terms, limit):
+    """LIKE 兜底搜索：标题命中排在前面，摘要在 Python 中截取"""
+    conditions = ' AND '.join(
+        f"(title LIKE :t{i} ESCAPE '\\' OR content LIKE :t{i} ESCAPE '\\')" for i in range(len(terms))
+    )
+    params = {
+        f"t{i}": '%' + re.sub(r'([%_\\])', r'\\\1', t) + '%' for i, t in enumerate(terms)
+    }
+    params['first'] = params['t0']
+    params['limit'] = limit
+    rows = db.session.execute(text(
+        f"SELECT id, icon, title, content FROM page WHERE {conditions} "
+        "ORDER BY (title LIKE :first ESCAPE '\\') DESC, id LIMIT :limit"
+    ), params)
+
+    pattern = re.compile('|'.join(re.escape(t) for t in terms), re.IGNORECASE)
+    mark = lambda s: pattern.sub(lambda m: HL_START + m.group(0) + HL_END, s or '')
+    results = []
+    for r in rows:
+        content = r.content or ''
+        match = pattern.search(content)
+        start = max(match.start() - 40, 0) if match else 0
+        snippet = ('…' if start else '') + content[start:start + 120]
+        results.append({
+            'id': r.id,
+            'icon': r.icon,
+            'title': render_highlight(mark(r.title)),
+            'snippet': render_highlight(mark(snippet))
+        })
+    return results
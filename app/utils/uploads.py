@@ -0,0 +1,263 @@
+# app/utils/uploads.py
+# 文件上传存储：
+#   按内容 SHA-256 命名（<sha256>.<扩展名>），相同内容只保存一份
+#   分片续传：未完成的上传写在 UPLOAD_PARTIAL_FOLDER（默认 instance/upload_parts）下，偏移量即分片文件长度，断线后从该偏移继续
+#   写入时边读边算哈希，内存占用与文件大小无关
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from threading import Lock
+from flask import current_app, url_for
+from werkzeug.utils import secure_filename
+from app.utils.cache import LRUCache
+
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 4 * 1024 * 1024))           # 客户端分片大小
+UPLOAD_MAX_CHUNK = int(os.environ.get('UPLOAD_MAX_CHUNK', 16 * 1024 * 1024))            # 单个请求体上限
+UPLOAD_MAX_SIZE = int(os.environ.get('UPLOAD_MAX_SIZE', 4 * 1024 * 1024 * 1024))        # 单个文件上限
+UPLOAD_PARTIAL_TTL = float(os.environ.get('UPLOAD_PARTIAL_TTL', 24 * 3600))             # 未完成上传保留时长（秒）
+COPY_BLOCK = 64 * 1024
+
+UPLOAD_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+# 进行中上传的哈希状态：upload_id -> (已哈希的字节数, hashlib 对象)
+# 进程重启或分片落到其他 worker 时缓存缺失，从分片文件重新计算
+hash_states = LRUCache(max_entries=int(os.environ.get('UPLOAD_HASH_STATES', 64)))
+upload_lock = Lock()
+active_uploads = set()  # 本进程正在写入的 upload_id，同一上传的重试请求在原请求结束前被拒绝
+
+
+class UploadError(Exception):
+    """上传协议错误，status 为返回给客户端的 HTTP 状态码"""
+
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+def upload_folder():
+    folder = current_app.config.get('UPLOAD_FOLDER') or os.path.join('static', 'uploads')
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+def partial_folder():
+    """未完成的上传放在静态目录和源码目录之外，避免被直接访问"""
+    folder = current_app.config['UPLOAD_PARTIAL_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+def partial_paths(upload_id):
+    if not UPLOAD_ID_RE.match(upload_id or ''):
+        raise UploadError('Upload not found', 404)
+    base = os.path.join(partial_folder(), upload_id)
+    return base + '.part', base + '.json'
+
+def safe_extension(filename):
+    ext = os.path.splitext(secure_filename(filename or ''))[1].lower()
+    return ext if re.match(r'^\.[a-z0-9]{1,10}$', ext) else ''
+
+def blob_url(name):
+    return url_for('static', filename=f'uploads/{name}')
+
+def find_blob(digest):
+    """按内容哈希查找已保存的文件，返回文件名"""
+    for path in glob.glob(os.path.join(upload_folder(), digest + '*')):
+        name = os.path.basename(path)
+        if name == digest or name.startswith(digest + '.'):
+            return name
+    return None
+
+def store_blob(temp_path, digest, filename):
+    """把已写完的临时文件按哈希入库，已存在相同内容时丢弃临时文件，返回 (文件名, 是否重复)"""
+    with upload_lock:
+        existing = find_blob(digest)
+        if existing:
+            os.remove(temp_path)
+            return existing, True
+        name = digest + safe_extension(filename)
+        shutil.move(temp_path, os.path.join(upload_folder(), name))
+        return name, False
+
+def copy_stream(stream, out, hasher, limit=None):
+    """分块复制 stream 到 out 并更新哈希，返回写入的字节数"""
+    written = 0
+    while limit is None or written < limit:
+        block = stream.read(COPY_BLOCK if limit is None else min(COPY_BLOCK, limit - written))
+        if not block:
+            break
+        out.write(block)
+        hasher.update(block)
+        written += len(block)
+        if written > UPLOAD_MAX_SIZE:
+            raise UploadError('File too large', 413)
+    return written
+
+def save_stream(stream, filename):
+    """一次性上传（旧接口 /api/upload）：流式写入临时文件，算出哈希后去重入库"""
+    temp_path = os.path.join(partial_folder(), uuid.uuid4().hex + '.tmp')
+    hasher = hashlib.sha256()
+    try:
+        with open(temp_path, 'wb') as out:
+            size = copy_stream(stream, out, hasher)
+        name, duplicate = store_blob(temp_path, hasher.hexdigest(), filename)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return {'url': blob_url(name), 'sha256': hasher.hexdigest(), 'size': size, 'duplicate': duplicate}
+
+
+# ========== 分片续传 ==========
+
+def prune_partials():
+    """删除超过保留时长仍未完成的上传"""
+    cutoff = time.time() - UPLOAD_PARTIAL_TTL
+    for path in glob.glob(os.path.join(partial_folder(), '*')):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+def read_meta(upload_id):
+    part_path, meta_path = partial_paths(upload_id)
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        raise UploadError('Upload not found', 404)
+    meta['offset'] = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    return meta
+
+def upload_status(meta):
+    return {
+        'upload_id': meta['upload_id'],
+        'offset': meta['offset'],
+        'size': meta['size'],
+        'chunk_size': UPLOAD_CHUNK_SIZE
+    }
+
+def create_upload(filename, size, sha256=None):
+    """
+    开始一次分片上传
+    客户端已算出哈希且服务器已有相同内容时直接返回地址，不再传输
+    """
+    if not isinstance(size, int) or size < 0:
+        raise UploadError('Invalid size')
+    if size > UPLOAD_MAX_SIZE:
+        raise UploadError('File too large', 413)
+    sha256 = (sha256 or '').lower() or None
+    if sha256 and not SHA256_RE.match(sha256):
+        raise UploadError('Invalid sha256')
+
+    if sha256:
+        existing = find_blob(sha256)
+        if existing:
+            return {'status': 'complete', 'url': blob_url(existing), 'sha256': sha256, 'duplicate': True}
+
+    prune_partials()
+    upload_id = uuid.uuid4().hex
+    part_path, meta_path = partial_paths(upload_id)
+    meta = {
+        'upload_id': upload_id,
+        'filename': secure_filename(filename or '') or 'file',
+        'size': size,
+        'sha256': sha256,
+        'created_at': time.time()
+    }
+    open(part_path, 'wb').close()
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    meta['offset'] = 0
+    status = upload_status(meta)
+    status['status'] = 'created'
+    return status
+
+def resume_hasher(upload_id, part_path, offset):
+    """取回进行中上传的哈希状态，缺失或与偏移不一致时从分片文件的前 offset 字节重新计算"""
+    state = hash_states.get(upload_id)
+    if state and state[0] == offset:
+        return state[1]
+    hasher = hashlib.sha256()
+    remaining = offset
+    with open(part_path, 'rb') as f:
+        while remaining > 0:
+            block = f.read(min(COPY_BLOCK, remaining))
+            if not block:
+                break
+            hasher.update(block)
+            remaining -= len(block)
+    return hasher
+
+def append_chunk(upload_id, offset, stream, length):
+    """
+    在 offset 处追加一个分片，offset 必须等于已接收的字节数，否则返回 409 和当前偏移
+    分片写到一半断开时已写入的部分保留，客户端查询偏移后从断点继续
+    """
+    meta = read_meta(upload_id)
+    part_path, meta_path = partial_paths(upload_id)
+    if length is None:
+        if offset < meta['size']:
+            raise UploadError('Content-Length required', 411)
+        length = 0  # 空文件只需一个空请求完成上传
+    if length > UPLOAD_MAX_CHUNK:
+        raise UploadError('Chunk too large', 413)
+    if offset + length > meta['size']:
+        raise UploadError('Chunk exceeds declared size', 400, offset=meta['offset'])
+    
+    with upload_lock:
+        if upload_id in active_uploads:
+            raise UploadError('Upload busy', 409, offset=meta['offset'])
+        active_uploads.add(upload_id)
+    try:
+        # 占用之后再检查偏移：过期的重试可能在上一个请求写入期间读到了旧偏移
+        received = os.path.getsize(part_path)
+        if offset != received:
+            raise UploadError('Offset mismatch', 409, offset=received)
+        hasher = resume_hasher(upload_id, part_path, offset)
+        hash_states.pop(upload_id)
+        with open(part_path, 'r+b') as out:
+            out.seek(offset)
+            offset += copy_stream(stream, out, hasher, limit=length)
+            # 截掉偏移之后可能残留的旧字节，文件长度始终等于已哈希的字节数
+            out.truncate(offset)
+    except FileNotFoundError:
+        raise UploadError('Upload not found', 404)
+    finally:
+        with upload_lock:
+            active_uploads.discard(upload_id)
+    meta['offset'] = offset
+    
+    if offset < meta['size']:
+        hash_states.put(upload_id, (offset, hasher))
+        status = upload_status(meta)
+        status['status'] = 'partial'
+        return status
+    return finish_upload(meta, part_path, meta_path, hasher.hexdigest())
+
+def finish_upload(meta, part_path, meta_path, digest):
+    if meta.get('sha256') and meta['sha256'] != digest:
+        os.remove(part_path)
+        os.remove(meta_path)
+        raise UploadError('Checksum mismatch', 422, sha256=digest)
+    name, duplicate = store_blob(part_path, digest, meta['filename'])
+    os.remove(meta_path)
+    return {
+        'status': 'complete',
+        'url': blob_url(name),
+        'sha256': digest,
+        'size': meta['size'],
+        'duplicate': duplicate
+    }
+
+def cancel_upload(upload_id):
+    read_meta(upload_id)
+    hash_states.pop(upload_id)
+    for path in partial_paths(upload_id):
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,213 @@
+# app/utils/variables.py
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import text, bindparam
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app import db
+from app.models.page import Variable, VariableValue, VariableObservation, VariableRollup
+
+ROLLUP_PERIODS = ('day', 'week', 'month')
+ROLLUP_BATCH_SIZE = 150
+# 同一页面对同一变量在这段时间内的连续变化合并为一条观测（自动保存会保存输入到一半的值）
+OBSERVATION_COALESCE_SECONDS = float(os.environ.get('VAR_OBSERVATION_COALESCE_SECONDS', 120))
+
+def rollup_bucket(period, moment):
+    """时间（datetime 或 date）所属的桶：当天 / 所在周的周一 / 所在月的 1 号"""
+    day = moment.date() if isinstance(moment, datetime) else moment
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    return day
+
+def apply_rollups(observations):
+    """
+    把一批观测的变化量累加进日/周/月汇总表（SQLite upsert）
+    每条默认计 1 次观测；合并进已有观测的修正带 samples（0 或撤销时的 -1）
+    """
+    buckets = {}
+    for obs in observations:
+        for period in ROLLUP_PERIODS:
+            key = (obs['variable_id'], period, rollup_bucket(period, obs['observed_at']))
+            total, samples = buckets.get(key, (0.0, 0))
+            buckets[key] = (total + obs['delta'], samples + obs.get('samples', 1))
+
+    rows = [
+        {'variable_id': var_id, 'period': period, 'bucket': bucket, 'total': total, 'samples': samples}
+        for (var_id, period, bucket), (total, samples) in buckets.items()
+    ]
+    # 分批写入，避免超过 SQLite 单条语句的参数上限
+    for i in range(0, len(rows), ROLLUP_BATCH_SIZE):
+        stmt = sqlite_insert(VariableRollup).values(rows[i:i + ROLLUP_BATCH_SIZE])
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['variable_id', 'period', 'bucket'],
+            set_={
+                'total': VariableRollup.total + stmt.excluded.total,
+                'samples': VariableRollup.samples + stmt.excluded.samples
+            }
+        ))
+
+def record_variable_observations(page_id, new_values, observed_at=None):
+    """
+    对比页面当前的变量值和新值，把有变化的变量追加到历史日志并更新汇总
+    new_values: {variable_id: value}，页面不再包含的变量按 0 记录
+    同一页面对同一变量在 OBSERVATION_COALESCE_SECONDS 内（且同一天）的上一条观测直接改写，
+    输入过程中的中间值不会产生额外的观测；改回原值时删除该观测
+    必须在覆盖 VariableValue 之前调用；不 commit，由调用方统一提交
+    """
+    observed_at = observed_at or datetime.utcnow()
+    old_values = dict(db.session.query(VariableValue.variable_id, VariableValue.value).filter_by(page_id=page_id))
+
+    changes = {}
+    for var_id in set(old_values) | set(new_values):
+        value = new_values.get(var_id, 0.0)
+        delta = value - old_values.get(var_id, 0.0)
+        if delta:
+            changes[var_id] = (value, delta)
+    if not changes:
+        return
+
+    recent = {}
+    if OBSERVATION_COALESCE_SECONDS > 0:
+        rows = VariableObservation.query.filter(
+            VariableObservation.page_id == page_id,
+            VariableObservation.variable_id.in_(list(changes)),
+            VariableObservation.observed_at >= observed_at - timedelta(seconds=OBSERVATION_COALESCE_SECONDS)
+        ).order_by(VariableObservation.id)
+        recent = {obs.variable_id: obs for obs in rows if obs.observed_at.date() == observed_at.date()}
+
+    observations, corrections = [], []
+    for var_id, (value, delta) in changes.items():
+        obs = recent.get(var_id)
+        if obs is None:
+            observations.append({
+                'variable_id': var_id,
+                'page_id': page_id,
+                'value': value,
+                'delta': delta,
+                'observed_at': observed_at
+            })
+            continue
+        # 汇总里已计入 obs.delta，只补上差额；改回原值时同时撤销那一次观测
+        obs.delta += delta
+        if abs(obs.delta) < 1e-9:
+            obs.delta = 0.0  # 多次浮点加减后的残差视为改回原值
+        corrections.append({
+            'variable_id': var_id,
+            'delta': delta,
+            'observed_at': obs.observed_at,
+            'samples': 0 if obs.delta else -1
+        })
+        if obs.delta:
+            obs.value = value
+            obs.observed_at = observed_at
+        else:
+            db.session.delete(obs)
+
+    if observations:
+        db.session.bulk_insert_mappings(VariableObservation, observations)
+    apply_rollups(observations + corrections)
+
+def rebuild_variable_history():
+    """
+    旧数据库首次启动时，用当前的 VariableValue 生成初始历史和汇总
+    每条现有记录视为在其 updated_at 时刻的一次观测
+    """
+    VariableRollup.query.delete()
+    VariableObservation.query.delete()
+    observations = [{
+        'variable_id': v.variable_id,
+        'page_id': v.page_id,
+        'value': v.value or 0.0,
+        'delta': v.value or 0.0,
+        'observed_at': v.updated_at or datetime.utcnow()
+    } for v in VariableValue.query.all() if v.value]
+    if observations:
+        db.session.bulk_insert_mappings(VariableObservation, observations)
+        apply_rollups(observations)
+    db.session.commit()
+    print(f"📈 已根据 {len(observations)} 条变量值生成历史记录")
+
+def delete_variable_history(var_id):
+    """删除变量时一并清理它的历史和汇总"""
+    VariableRollup.query.filter_by(variable_id=var_id).delete()
+    VariableObservation.query.filter_by(variable_id=var_id).delete()
+
+# ========== 统计查询 ==========
+# 每个变量内先按标题求和并排名，再把排名超过 :top 的来源归入同一个 Others 分组
+STATS_DISTRIBUTION_SQL = text("""
+    WITH dist AS (
+        SELECT v.variable_id, COALESCE(p.title, 'Unknown') AS label, SUM(v.value) AS total
+        FROM variable_value v
+        LEFT JOIN page p ON p.id = v.page_id
+        WHERE v.variable_id IN :ids
+        GROUP BY v.variable_id, label
+    ), ranked AS (
+        SELECT variable_id, label, total,
+               ROW_NUMBER() OVER (PARTITION BY variable_id ORDER BY total DESC) AS rn
+        FROM dist
+    )
+    SELECT variable_id,
+           CASE WHEN MIN(rn) <= :top THEN MIN(label) ELSE 'Others' END AS label,
+           SUM(total) AS total
+    FROM ranked
+    GROUP BY variable_id, MIN(rn, :top + 1)
+    ORDER BY variable_id, MIN(rn)
+""").bindparams(bindparam('ids', expanding=True))
+
+def downsample_series(labels, values, points):
+    """
+    把相邻的桶合并到不超过 points 个点；每个桶是变化量，合并时求和以保持总量不变
+    合并后的点以组内第一个桶的日期为标签
+    """
+    if not points or len(labels) <= points:
+        return labels, values
+    size = -(-len(labels) // points)
+    return (
+        labels[::size],
+        [sum(values[i:i + size]) for i in range(0, len(values), size)]
+    )
+
+def variable_stats(var_ids, period='day', start=None, end=None, points=None, top=10):
+    """
+    一次性计算多个变量的统计数据: {variable_id: {variable, timeline, distribution}}
+    timeline 读取汇总表，可按 start/end 日期截取并降采样；distribution 是当前各页面的贡献（前 top 个 + Others）
+    查询次数固定为 3 次，与变量数量无关
+    """
+    variables = Variable.query.filter(Variable.id.in_(var_ids)).all() if var_ids else []
+    if not variables:
+        return {}
+    ids = [v.id for v in variables]
+
+    query = db.session.query(VariableRollup.variable_id, VariableRollup.bucket, VariableRollup.total).filter(
+        VariableRollup.variable_id.in_(ids), VariableRollup.period == period
+    )
+    if start:
+        query = query.filter(VariableRollup.bucket >= rollup_bucket(period, start))
+    if end:
+        query = query.filter(VariableRollup.bucket <= end)
+    series = {var_id: ([], []) for var_id in ids}
+    for row in query.order_by(VariableRollup.variable_id, VariableRollup.bucket):
+        labels, values = series[row.variable_id]
+        labels.append(row.bucket.isoformat())
+        values.append(row.total)
+
+    distribution = {var_id: ([], []) for var_id in ids}
+    for row in db.session.execute(STATS_DISTRIBUTION_SQL, {'ids': ids, 'top': top}):
+        labels, values = distribution[row.variable_id]
+        labels.append(row.label)
+        values.append(row.total)
+
+    result = {}
+    for v in variables:
+        labels, values = downsample_series(*series[v.id], points)
+        result[v.id] = {
+            'variable': {
+                'name': v.display_name,
+                'unit': v.unit,
+                'color': v.color
+            },
+            'timeline': {'labels': labels, 'values': values},
+            'distribution': dict(zip(('labels', 'values'), distribution[v.id]))
+        }
+    return result
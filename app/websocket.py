@@ -1,171 +1,558 @@
 # app/websocket.py
-from threading import Lock, Timer
+from threading import Lock, Thread, Condition
 from datetime import datetime, timedelta
+import heapq
+import itertools
 import json
 import re
 import sqlite3
+import queue
 import os
+import time
+import uuid
+from flask import session
 
 # 从socket模块导入sock实例
 from app.socket import sock
+from app import database
+from app import cluster
+from app.cluster import checker_lease, relay
+from app.utils.cache import TimeBucketDedupe
 
-clients = set()
-clients_lock = Lock()
-check_timer = None
+clients = {}          # ws -> ClientConnection
+clients_lock = Lock()  # 只保护 clients 字典本身，持锁期间不做网络 I/O
 
-# 存储所有活动的通知
-active_notices = []
-active_events = []
+# 每个客户端发送队列的容量；队列满时丢弃新消息，
+# 若客户端超过 CLIENT_STALE_AFTER 秒没有成功发出任何消息则视为卡死并断开（浏览器会自动重连）
+CLIENT_QUEUE_SIZE = int(os.environ.get('WS_CLIENT_QUEUE_SIZE', 100))
+CLIENT_STALE_AFTER = float(os.environ.get('WS_CLIENT_STALE_AFTER', 30))
+send_stats = {'sent': 0, 'dropped': 0, 'stale_disconnects': 0}
+send_stats_lock = Lock()
 
-# 通知缓存，用于去重
-sent_notifications_cache = set()
-max_cache_size = 100
+def count_send_stat(name):
+    with send_stats_lock:
+        send_stats[name] += 1
 
-# 直接使用数据库路径
-DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'nation_pro_v3.db')
-
-class NotificationChecker:
-    def __init__(self):
-        self.interval = 1  # 1秒检查一次
-        self.running = True
-        self.start()
+class ClientConnection:
+    """
+    单个 WebSocket 客户端
+    所有发往该客户端的消息先序列化再放入有界队列，由独立的发送线程写入套接字；
+    慢客户端只会阻塞自己的发送线程，不影响广播方和其他客户端
+    """
     
-    def start(self):
-        """启动定时检查"""
-        self.check()
+    def __init__(self, ws):
+        self.ws = ws
+        self.queue = queue.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        self.sent = 0
+        self.dropped = 0
+        self.stale = False
+        self.page_id = None               # 客户端当前打开的页面，该页面的事件带完整字段下发
+        self.connected_at = datetime.now()
+        self.last_progress = time.monotonic()  # 上次成功发送的时间
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
     
-    def get_db_connection(self):
-        """直接获取数据库连接"""
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        return conn
-    
-    def extract_calendar_events(self):
-        """直接从数据库提取日历事件"""
-        events = []
+    def send(self, data):
+        """序列化并放入发送队列（单发消息用，广播时由 broadcast 统一序列化）"""
+        return self.enqueue(json.dumps(data))
+    
+    def enqueue(self, payload):
+        """放入发送队列；队列已满时丢弃该消息，长时间没有进展的客户端标记为 stale"""
+        if self.stale:
+            return False
         try:
-            conn = self.get_db_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('SELECT id, title, content FROM page')
-            pages = cursor.fetchall()
-            
-            pattern = r'@(\d{4}[.\-]\d{2}[.\-]\d{2})(?:\s+(\d{1,2}:\d{2})(?:-(\d{1,2}:\d{2}))?)?\s*\[(.*?)(?:\|(.*?))?\]'
-            
-            for page in pages:
-                content = page['content'] or ''
-                matches = re.findall(pattern, content)
-                
-                for date_str, start_time, end_time, event_name, reminder_rule in matches:
-                    clean_date = date_str.replace('.', '-')
-                    events.append({
-                        'id': page['id'],
-                        'title': event_name,
-                        'date': clean_date,
-                        'start': start_time if start_time else None,
-                        'end': end_time if end_time else None,
-                        'source_page': page['title'],
-                        'reminder': reminder_rule.strip() if reminder_rule else None
-                    })
-            
-            conn.close()
-        except Exception:
+            self.queue.put_nowait(payload)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            count_send_stat('dropped')
+            if time.monotonic() - self.last_progress > CLIENT_STALE_AFTER:
+                self.mark_stale()
+            return False
+    
+    def mark_stale(self):
+        """停止向该客户端投递，发送线程退出时关闭连接"""
+        if self.stale:
+            return
+        self.stale = True
+        count_send_stat('stale_disconnects')
+        with clients_lock:
+            clients.pop(self.ws, None)
+        # 队列可能是满的，清空一条给结束标记腾位置
+        try:
+            self.queue.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
             pass
-        
-        return events
     
-    def extract_notices(self):
-        """直接从数据库提取通知"""
-        notices = []
+    def close(self):
+        """连接已断开（receive 循环结束），让发送线程退出"""
+        self.stale = True
         try:
-            conn = self.get_db_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('SELECT id, title, content FROM page')
-            pages = cursor.fetchall()
-            
-            pattern = r'\{\{notice\|(.*?)\|(.*?)\}\}'
-            
-            for page in pages:
-                content = page['content'] or ''
-                matches = re.findall(pattern, content)
-                
-                for condition, content_text in matches:
-                    notices.append({
-                        'page_id': page['id'],
-                        'source_page': page['title'],
-                        'condition': condition.strip(),
-                        'content': content_text.strip()
-                    })
-            
-            conn.close()
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+    
+    def run(self):
+        while True:
+            payload = self.queue.get()
+            if payload is None or self.stale:
+                break
+            try:
+                self.ws.send(payload)
+                self.sent += 1
+                self.last_progress = time.monotonic()
+                count_send_stat('sent')
+            except Exception:
+                self.mark_stale()
+                break
+        try:
+            self.ws.close()
         except Exception:
             pass
-        
-        return notices
     
-    def check(self):
-        """检查所有提醒"""
-        if not self.running:
+    def stats(self):
+        return {
+            'queued': self.queue.qsize(),
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'stale': self.stale,
+            'connected_at': self.connected_at.isoformat()
+        }
+
+def broadcast(data):
+    """消息只序列化一次，投递到每个客户端的发送队列，不在锁内做网络 I/O"""
+    return broadcast_payload(json.dumps(data))
+
+def broadcast_payload(payload):
+    """投递已序列化的消息（其他进程经 relay 转发过来的广播直接走这里）"""
+    with clients_lock:
+        targets = list(clients.values())
+    for client in targets:
+        client.enqueue(payload)
+    return len(targets)
+
+def client_stats():
+    """各客户端队列深度、发送/丢弃计数，以及进程内累计值"""
+    with clients_lock:
+        targets = list(clients.values())
+    with send_stats_lock:
+        totals = dict(send_stats)
+    return {
+        'clients': [c.stats() for c in targets],
+        'queue_capacity': CLIENT_QUEUE_SIZE,
+        'total_queued': sum(c.queue.qsize() for c in targets),
+        **totals
+    }
+
+# 已发送通知的去重记录：按分钟分桶，超过保留时间整桶过期
+sent_notifications_cache = TimeBucketDedupe(
+    retention=int(os.environ.get('NOTIFY_DEDUPE_SECONDS', 120)), bucket_seconds=60
+)
+
+# 调度器使用的查询：语句文本固定，sqlite3 在长期连接上缓存其预编译结果
+NOTICE_SQL = ('SELECT n.page_id, p.title, n.condition, n.content '
+              'FROM page_notice n JOIN page p ON p.id = n.page_id')
+EVENT_SQL = ('SELECT page_id, title, date, start, reminder FROM calendar_event '
+             'WHERE reminder IS NOT NULL AND start IS NOT NULL')
+# 'calendar' 版本只在提醒/日历事件（或所属页面标题）变化、页面删除时递增，置顶、改图标、新建页面等不影响调度
+CALENDAR_VERSION_SQL = "SELECT version FROM meta_version WHERE name = 'calendar'"
+
+class NotificationChecker:
+    """
+    提醒调度器
+    为每条提醒/事件计算下一次触发时间并放入最小堆，线程只睡到最近的触发时间；
+    页面变化时只重新调度该页面的条目，空闲时几乎不占 CPU
+    多 worker 部署时只有持有 checker_lease 的进程调度数据库中的提醒，其余进程只调度本进程客户端同步的条目；
+    通知经 relay 推送到所有进程的客户端，并按通知 ID 在数据库中去重
+    """
+    max_sleep = 60  # 最长睡眠秒数，防止系统时间跳变后睡过头
+    max_client_entries = int(os.environ.get('WS_CLIENT_MAX_ENTRIES', 500))  # 每个客户端每类最多登记的条目数
+    
+    def __init__(self):
+        self.running = False
+        self.thread = None
+        self.cond = Condition()
+        self.heap = []        # (fire_time, seq, key, gen)
+        self.entries = {}     # key -> 条目
+        self.page_keys = {}   # page_id -> {key}，用于按页面重新调度
+        self.client_keys = {}    # 客户端 -> {key}：该客户端同步过来的条目
+        self.client_owners = {}  # key -> {客户端}：所有持有者断开后条目即被移除
+        # 已触发过的一次性事件提醒，页面重新保存或客户端重新同步时不再重复触发
+        self.fired = TimeBucketDedupe(retention=7 * 86400, bucket_seconds=3600)
+        self.seq = itertools.count()
+        self.conn = None              # 长期持有的只读连接
+        self.db_lock = Lock()         # 连接在请求线程和调度线程之间共享
+        self.data_version = None      # 上次读取时的 PRAGMA data_version
+        self.calendar_version = None  # 上次读取时的提醒数据版本号（meta_version.calendar）
+        self.is_leader = False        # 是否持有调度租约
+        self.lease_checked = 0        # 上次续约的时间（monotonic）
+    
+    def start(self):
+        """抢占调度租约、加载全部提醒并启动调度线程"""
+        if self.thread:
             return
-        
+        self.running = True
+        self.update_leadership(force=True)
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        """停止检查"""
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        if self.is_leader:
+            checker_lease.release()
+            self.is_leader = False
+        with self.db_lock:
+            self.close_db_connection()
+    
+    def after_fork(self):
+        """
+        fork 出的子进程：调度线程不会被复制，父进程加载的条目、连接和锁也不能沿用，
+        恢复初始状态后重新抢占租约并启动
+        """
+        was_running = self.running
+        self.__init__()
+        if was_running:
+            self.start()
+    
+    def update_leadership(self, force=False):
+        """
+        按租约续约间隔抢占/续约调度租约
+        成为主进程时加载全部数据库提醒；失去租约时丢弃它们，只保留本进程客户端的条目
+        """
+        now = time.monotonic()
+        if not force and now - self.lease_checked < checker_lease.renew_interval:
+            return
+        self.lease_checked = now
+        was_leader, self.is_leader = self.is_leader, checker_lease.try_acquire()
+        if self.is_leader and not was_leader:
+            print(f"👑 提醒调度由本进程负责 ({cluster.WORKER_ID})")
+            self.reload_all()
+        elif was_leader and not self.is_leader:
+            print(f"⚠️ 调度租约已被其他进程接管 ({cluster.WORKER_ID})")
+            with self.cond:
+                for page_id in list(self.page_keys):
+                    if page_id is not None:
+                        self._drop_page(page_id)
+        if self.is_leader:
+            relay.prune()
+    
+    def get_db_connection(self):
+        """获取长期持有的只读连接（与 SQLAlchemy 引擎相同的 PRAGMA 配置），调用方持有 self.db_lock"""
+        if self.conn is None:
+            self.conn = database.connect(readonly=True, check_same_thread=False)
+            self.conn.row_factory = sqlite3.Row
+        return self.conn
+    
+    def close_db_connection(self):
+        """关闭只读连接，调用方持有 self.db_lock；出错后下次使用时重新连接"""
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+            self.conn = None
+    
+    def read_calendar_version(self, conn):
+        row = conn.execute(CALENDAR_VERSION_SQL).fetchone()
+        return row[0] if row else None
+    
+    # ========== 数据加载 ==========
+    def load_rows(self, page_id=None):
+        """从提醒表和日历事件表读取条目（不扫描正文），同时记录读取时的数据版本；非主进程不加载"""
+        notices, events = [], []
+        if not self.is_leader:
+            return notices, events
+        notice_sql, event_sql, params = NOTICE_SQL, EVENT_SQL, ()
+        if page_id is not None:
+            notice_sql += ' WHERE n.page_id = ?'
+            event_sql += ' AND page_id = ?'
+            params = (page_id,)
+        with self.db_lock:
+            try:
+                conn = self.get_db_connection()
+                # 在同一个读事务里取数据和版本号，保证两者对应同一快照
+                conn.execute('BEGIN')
+                try:
+                    notices = conn.execute(notice_sql, params).fetchall()
+                    events = conn.execute(event_sql, params).fetchall()
+                    self.calendar_version = self.read_calendar_version(conn)
+                    self.data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+                finally:
+                    conn.execute('COMMIT')
+            except Exception:
+                self.close_db_connection()
+        return notices, events
+    
+    def has_unseen_changes(self):
+        """
+        检查是否有未通过 reload_page 通知的页面修改（例如其他进程写入）
+        PRAGMA data_version 不变时直接返回，不读取任何数据页；变化时再比较提醒数据版本号
+        （租约续约和广播队列写在独立的协调库里，不会改变主库的 data_version）
+        """
+        with self.db_lock:
+            try:
+                conn = self.get_db_connection()
+                data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+                if data_version == self.data_version:
+                    return False
+                self.data_version = data_version
+                return self.read_calendar_version(conn) != self.calendar_version
+            except Exception:
+                self.close_db_connection()
+                return False
+    
+    def reload_all(self):
+        """重新加载所有页面的提醒"""
+        notices, events = self.load_rows()
+        with self.cond:
+            for page_id in list(self.page_keys):
+                if page_id is not None:
+                    self._drop_page(page_id)
+            self._add_rows(notices, events)
+            self.cond.notify()
+    
+    def reload_page(self, page_id):
+        """页面保存后只重新调度该页面的条目"""
+        notices, events = self.load_rows(page_id)
+        with self.cond:
+            self._drop_page(page_id)
+            self._add_rows(notices, events)
+            self.cond.notify()
+    
+    def remove_page(self, page_id):
+        """页面删除后移除其条目"""
+        with self.cond:
+            self._drop_page(page_id)
+            self.cond.notify()
+    
+    def add_client_notices(self, notices, owner, replace=False):
+        """
+        登记客户端同步过来的提醒，按 (page_id, condition, content) 去重，多个客户端同步同一条只调度一次
+        replace=True 表示全量同步：该客户端之前登记、这次没有出现的提醒随之释放
+        """
+        with self.cond:
+            claimed = set()
+            room = self._client_room(owner, 'notice', replace)
+            for n in notices:
+                if len(claimed) >= room:
+                    break
+                if isinstance(n, dict) and n.get('condition'):
+                    key = self._add_notice('client', n.get('page_id'), n.get('source_page', '系统'),
+                                           str(n['condition']).strip(), str(n.get('content', '')).strip())
+                    if key:
+                        claimed.add(key)
+            self._claim(owner, 'notice', claimed, replace)
+            self.cond.notify()
+    
+    def add_client_events(self, events, owner, replace=False):
+        """登记客户端同步过来的日历事件提醒，规则同 add_client_notices"""
+        with self.cond:
+            claimed = set()
+            room = self._client_room(owner, 'event', replace)
+            for e in events:
+                if len(claimed) >= room:
+                    break
+                if isinstance(e, dict) and e.get('reminder') and e.get('start'):
+                    key = self._add_event('client', e.get('id'), e.get('title', ''),
+                                          e.get('date', ''), e['start'], e['reminder'])
+                    if key:
+                        claimed.add(key)
+            self._claim(owner, 'event', claimed, replace)
+            self.cond.notify()
+    
+    def release_client(self, owner):
+        """客户端断开：释放它登记的条目，没有其他持有者的条目从调度中移除"""
+        with self.cond:
+            for key in list(self.client_keys.get(owner, ())):
+                self._release(owner, key)
+            self.client_keys.pop(owner, None)
+            self._compact_heap()
+    
+    def stats(self):
+        with self.cond:
+            return {
+                'entries': len(self.entries),
+                'heap': len(self.heap),
+                'client_entries': len(self.client_owners),
+                'client_owners': len(self.client_keys),
+                'leader': self.is_leader,
+                'worker': cluster.WORKER_ID
+            }
+    
+    # ========== 客户端条目归属（调用方持有 self.cond） ==========
+    def _client_room(self, owner, kind, replace):
+        if replace:
+            return self.max_client_entries
+        owned = self.client_keys.get(owner, ())
+        return max(self.max_client_entries - sum(1 for k in owned if k[1] == kind), 0)
+    
+    def _claim(self, owner, kind, claimed, replace):
+        owned = self.client_keys.setdefault(owner, set())
+        if replace:
+            for key in [k for k in owned if k[1] == kind and k not in claimed]:
+                self._release(owner, key)
+            self._compact_heap()
+        for key in claimed:
+            owned.add(key)
+            self.client_owners.setdefault(key, set()).add(owner)
+    
+    def _release(self, owner, key):
+        self.client_keys.get(owner, set()).discard(key)
+        owners = self.client_owners.get(key)
+        if owners is None:
+            return
+        owners.discard(owner)
+        if not owners:
+            self._forget(key)
+    
+    def _forget(self, key):
+        """移除一个条目及其归属记录；堆中的旧项惰性失效"""
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.page_keys.get(entry['page_id'] if key[0] == 'db' else None, set()).discard(key)
+        for owner in self.client_owners.pop(key, ()):
+            self.client_keys.get(owner, set()).discard(key)
+    
+    # ========== 堆维护（调用方持有 self.cond） ==========
+    def _add_rows(self, notices, events):
+        for r in notices:
+            self._add_notice('db', r['page_id'], r['title'], r['condition'], r['content'])
+        for r in events:
+            self._add_event('db', r['page_id'], r['title'], r['date'], r['start'], r['reminder'])
+    
+    def _add_notice(self, source, page_id, source_page, condition, content):
+        """调度一条提醒，返回其 key；无法调度或已由数据库条目覆盖时返回 None"""
+        key = (source, 'notice', page_id, condition, content)
+        if key in self.entries:
+            return key
+        if source == 'client' and ('db',) + key[1:] in self.entries:
+            return None
+        entry = {
+            'kind': 'notice', 'page_id': page_id, 'source_page': source_page,
+            'condition': condition, 'content': content, 'gen': 0
+        }
+        return self._schedule(key, entry, self.next_fire(condition, datetime.now()))
+    
+    def _add_event(self, source, page_id, title, date_str, start, reminder):
+        """调度一条事件提醒，返回其 key；已过期、已触发过或已由数据库条目覆盖时返回 None"""
+        key = (source, 'event', page_id, title, date_str, start, reminder)
+        if key in self.entries:
+            return key
+        if source == 'client' and ('db',) + key[1:] in self.entries:
+            return None
+        if key[1:] in self.fired:
+            return None
         try:
-            now = datetime.now()
+            event_time = datetime.strptime(f"{date_str} {start}", '%Y-%m-%d %H:%M')
+        except (TypeError, ValueError):
+            return None
+        trigger_time = event_time - timedelta(milliseconds=self.parse_duration(reminder))
+        now = datetime.now()
+        if now >= event_time:
+            return None
+        entry = {
+            'kind': 'event', 'page_id': page_id, 'title': title,
+            'reminder': reminder, 'gen': 0
+        }
+        # 已处于提醒窗口内的事件立即触发
+        return self._schedule(key, entry, max(trigger_time, now))
+    
+    def _schedule(self, key, entry, fire_time):
+        if fire_time is None:
+            return None
+        self.entries[key] = entry
+        self.page_keys.setdefault(entry['page_id'] if key[0] == 'db' else None, set()).add(key)
+        heapq.heappush(self.heap, (fire_time, next(self.seq), key, entry['gen']))
+        return key
+    
+    def _drop_page(self, page_id):
+        for key in list(self.page_keys.get(page_id, ())):
+            self._forget(key)
+        self.page_keys.pop(page_id, None)
+        self._compact_heap()
+    
+    def _compact_heap(self):
+        # 堆中的失效条目惰性删除，失效过多时重建堆
+        if len(self.heap) > 2 * len(self.entries) + 64:
+            self.heap = [item for item in self.heap if self._is_live(item)]
+            heapq.heapify(self.heap)
+    
+    def _is_live(self, item):
+        entry = self.entries.get(item[2])
+        return entry is not None and entry['gen'] == item[3]
+    
+    def _pop_due(self, now):
+        """弹出所有已到期的条目，周期性提醒重新入堆"""
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            item = heapq.heappop(self.heap)
+            if not self._is_live(item):
+                continue
+            key, entry = item[2], self.entries[item[2]]
+            due.append(dict(entry))
             
-            # 1. 检查日历事件 - 合并数据库和实时同步的
-            db_events = self.extract_calendar_events()
-            all_events = db_events + active_events
+            next_time = None
+            if entry['kind'] == 'notice':
+                next_time = self.next_fire(entry['condition'], max(now, item[0]))
+            if next_time is None:
+                if entry['kind'] == 'event':
+                    self.fired.add(key[1:])
+                self._forget(key)
+            else:
+                entry['gen'] += 1
+                heapq.heappush(self.heap, (next_time, next(self.seq), key, entry['gen']))
+        return due
+    
+    # ========== 调度循环 ==========
+    def run(self):
+        while True:
+            self.update_leadership()
+            if self.is_leader and self.has_unseen_changes():
+                self.reload_all()
             
-            for evt in all_events:
-                if not evt.get('reminder'):
+            with self.cond:
+                if not self.running:
+                    return
+                due = self._pop_due(datetime.now())
+                if not due:
+                    # 至少每个续约间隔醒来一次，按时续约或接管过期的租约
+                    timeout = min(self.max_sleep, checker_lease.renew_interval)
+                    if self.heap:
+                        timeout = min(timeout, (self.heap[0][0] - datetime.now()).total_seconds())
+                    if timeout > 0:
+                        self.cond.wait(timeout)
                     continue
-                    
-                try:
-                    event_time = datetime.strptime(f"{evt['date']} {evt['start']}", '%Y-%m-%d %H:%M')
-                    offset = self.parse_duration(evt['reminder'])
-                    trigger_time = event_time - timedelta(milliseconds=offset)
-                    
-                    if trigger_time <= now < event_time:
-                        broadcast_notification(
-                            title=f"📅 {evt['title']}",
-                            body=f"将在 {evt['reminder']} 后开始",
-                            url=f"/p/{evt['id']}"
-                        )
-                except Exception:
-                    pass
             
-            # 2. 检查Notice组件 - 合并数据库和实时同步的
-            db_notices = self.extract_notices()
-            all_notices = db_notices + active_notices
-            
-            for notice in all_notices:
+            for entry in due:
                 try:
-                    if self.check_condition(notice['condition'], now):
-                        broadcast_notification(
-                            title=f"🔔 {notice['content']}",
-                            body=f"来自: {notice.get('source_page', '系统')}",
-                            url=f"/p/{notice['page_id']}"
-                        )
+                    self.fire(entry)
                 except Exception:
                     pass
-                    
-        except Exception:
-            pass
-        
-        # 继续下一次检查
-        if self.running:
-            global check_timer
-            check_timer = Timer(self.interval, self.check)
-            check_timer.daemon = True
-            check_timer.start()
     
-    def stop(self):
-        """停止检查"""
-        self.running = False
-        global check_timer
-        if check_timer:
-            check_timer.cancel()
-            check_timer = None
+    def fire(self, entry):
+        """发送到期的提醒"""
+        if entry['kind'] == 'event':
+            broadcast_notification(
+                title=f"📅 {entry['title']}",
+                body=f"将在 {entry['reminder']} 后开始",
+                url=f"/p/{entry['page_id']}"
+            )
+        else:
+            broadcast_notification(
+                title=f"🔔 {entry['content']}",
+                body=f"来自: {entry.get('source_page') or '系统'}",
+                url=f"/p/{entry['page_id']}"
+            )
     
     def parse_duration(self, str_duration):
         """解析持续时间"""
@@ -183,147 +570,148 @@ class NotificationChecker:
         multipliers = {'d': 86400000, 'h': 3600000, 'm': 60000, 's': 1000}
         return int(num * multipliers.get(unit, 60000))
     
-    def check_condition(self, cond, now):
-        """检查条件"""
-        if not cond or not now:
-            return False
+    def next_fire(self, cond, after):
+        """
+        计算条件在 after 之后（不含）的下一次触发时间
+        支持: [time ]YYYY-MM-DD HH:MM[:SS] / daily HH:MM[:SS] / every Ns|Nm|Nh（按整点对齐）
+        无法解析或不会再触发时返回 None
+        """
+        if not cond or not after:
+            return None
         
-        # 格式化时间
-        year = now.year
-        month = str(now.month).zfill(2)
-        day = str(now.day).zfill(2)
-        hours = str(now.hour).zfill(2)
-        minutes = str(now.minute).zfill(2)
-        seconds = str(now.second).zfill(2)
-        
-        current_time = f"{hours}:{minutes}"
-        current_time_with_seconds = f"{hours}:{minutes}:{seconds}"
-        current_full = f"{year}-{month}-{day} {hours}:{minutes}"
-        current_full_with_seconds = f"{year}-{month}-{day} {hours}:{minutes}:{seconds}"
+        t = after.replace(microsecond=0) + timedelta(seconds=1)
         
         # 绝对时间
-        if cond in [current_full, f"time {current_full}", current_full_with_seconds, f"time {current_full_with_seconds}"]:
-            return True
+        match = re.match(r'^(?:time )?(\d{4}-\d{2}-\d{2} \d{2}:\d{2})(:\d{2})?$', cond)
+        if match:
+            try:
+                fire_time = datetime.strptime(match.group(1) + (match.group(2) or ':00'), '%Y-%m-%d %H:%M:%S')
+            except ValueError:
+                return None
+            return fire_time if fire_time >= t else None
         
         # 每日重复
-        if cond.startswith('daily '):
-            time_part = cond[6:].strip()
-            if time_part == current_time_with_seconds:
-                return True
-            if time_part == current_time and seconds == '00':
-                return True
+        match = re.match(r'^daily (\d{2}):(\d{2})(?::(\d{2}))?$', cond)
+        if match:
+            try:
+                fire_time = t.replace(hour=int(match.group(1)), minute=int(match.group(2)),
+                                      second=int(match.group(3) or 0))
+            except ValueError:
+                return None
+            return fire_time if fire_time >= t else fire_time + timedelta(days=1)
         
-        # 间隔重复 - 灵活版本
-        if cond.startswith('every '):
-            interval = cond[6:].strip()
+        # 间隔重复：every 5s 在秒数整除时触发，every 15m / every 2h 在整分/整点触发
+        match = re.match(r'^every (\d+)([smh])$', cond)
+        if match:
+            n, unit = int(match.group(1)), match.group(2)
+            if n <= 0:
+                return None
+            if unit == 's':
+                second = -(-t.second // n) * n
+                if second < 60:
+                    return t.replace(second=second)
+                return t.replace(second=0) + timedelta(minutes=1)
             
-            # 秒级: every 5s, every 10s, every 30s
-            sec_match = re.match(r'^(\d+)s$', interval)
-            if sec_match:
-                interval_sec = int(sec_match.group(1))
-                if int(seconds) % interval_sec == 0:
-                    return True
+            if t.second:
+                t = t.replace(second=0) + timedelta(minutes=1)
+            if unit == 'm':
+                minute = -(-t.minute // n) * n
+                if minute < 60:
+                    return t.replace(minute=minute)
+                return t.replace(minute=0) + timedelta(hours=1)
             
-            # 分钟级: every 1m, every 5m, every 15m
-            min_match = re.match(r'^(\d+)m$', interval)
-            if min_match:
-                interval_min = int(min_match.group(1))
-                if int(minutes) % interval_min == 0 and seconds == '00':
-                    return True
-            
-            # 小时级: every 1h, every 2h, every 6h
-            hour_match = re.match(r'^(\d+)h$', interval)
-            if hour_match:
-                interval_hour = int(hour_match.group(1))
-                if int(hours) % interval_hour == 0 and minutes == '00' and seconds == '00':
-                    return True
+            if t.minute:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            hour = -(-t.hour // n) * n
+            if hour < 24:
+                return t.replace(hour=hour)
+            return t.replace(hour=0) + timedelta(days=1)
         
-        return False
+        return None
 
-# 全局通知管理器
+# 全局通知管理器（由 create_app 在数据库初始化后启动）
 notification_checker = NotificationChecker()
+# 在 app.cluster 的 fork 钩子（重新生成 WORKER_ID、重置租约）之后执行
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=notification_checker.after_fork)
 
 @sock.route('/ws')
 def websocket_handler(ws):
-    """WebSocket连接处理"""
-    client_id = id(ws)
+    """WebSocket连接处理：本线程只负责接收，发送由 ClientConnection 的发送线程完成"""
+    # 页面事件和通知包含页面内容，未登录的连接直接关闭（1008: policy violation）
+    if not session.get('logged_in'):
+        ws.close(reason=1008, message='Unauthorized')
+        return
+    
+    client = ClientConnection(ws)
     
     with clients_lock:
-        clients.add(ws)
+        clients[ws] = client
     
     # 发送连接成功消息
-    ws.send(json.dumps({
+    client.send({
         'type': 'connected',
         'message': 'WebSocket连接成功',
         'timestamp': datetime.now().isoformat()
-    }))
+    })
     
     try:
-        while True:
+        while not client.stale:
             message = ws.receive()
             if message:
                 try:
                     data = json.loads(message)
-                    handle_client_message(ws, data)
+                    handle_client_message(client, data)
                 except Exception:
                     pass
     except Exception:
         pass
     finally:
         with clients_lock:
-            clients.remove(ws)
+            clients.pop(ws, None)
+        client.close()
+        notification_checker.release_client(client)
 
-def handle_client_message(ws, data):
+def handle_client_message(client, data):
     """处理客户端发送的消息"""
-    global active_notices, active_events, sent_notifications_cache
-    
     msg_type = data.get('type')
     
     if msg_type == 'ping':
-        ws.send(json.dumps({'type': 'pong'}))
+        client.send({'type': 'pong'})
         
     elif msg_type == 'sync_notices':
-        new_notices = data.get('notices', [])
-        active_notices.extend(new_notices)
-        notification_checker.check()
+        # 全量同步：替换该客户端之前登记的提醒
+        notification_checker.add_client_notices(data.get('notices', []), client, replace=True)
+        
+    elif msg_type == 'new_notices':
+        notification_checker.add_client_notices(data.get('notices', []), client)
         
     elif msg_type == 'sync_events':
-        new_events = data.get('events', [])
-        active_events.extend(new_events)
+        notification_checker.add_client_events(data.get('events', []), client, replace=True)
         
-    elif msg_type == 'new_notices':
-        new_notices = data.get('notices', [])
-        active_notices.extend(new_notices)
-        notification_checker.check()
+    elif msg_type == 'subscribe':
+        # 客户端打开的页面，None 表示没有打开页面
+        page_id = data.get('page_id')
+        client.page_id = page_id if type(page_id) is int else None
         
     elif msg_type == 'new_notice':
         notice = data.get('data', {})
         if notice:
-            active_notices.append(notice)
-            notification_checker.check()
+            notification_checker.add_client_notices([notice], client)
     
     else:
         pass
 
 def broadcast_notification(title, body, url=None):
-    """广播通知给所有客户端"""
-    if not clients:
-        return
-    
+    """广播通知给所有进程的客户端"""
     # 生成通知ID用于去重
     notification_id = f"{title}_{body}_{datetime.now().strftime('%Y%m%d%H%M')}"
     
-    # 每分钟只发一次相同通知
-    global sent_notifications_cache
-    if notification_id in sent_notifications_cache:
+    # 每分钟只发一次相同通知（保留窗口内重复的直接丢弃）
+    if not sent_notifications_cache.add(notification_id):
         return
     
-    # 添加到缓存
-    sent_notifications_cache.add(notification_id)
-    if len(sent_notifications_cache) > max_cache_size:
-        sent_notifications_cache.pop()
-    
-    data = {
+    payload = json.dumps({
         'type': 'notification',
         'data': {
             'title': title,
@@ -332,15 +720,36 @@ def broadcast_notification(title, body, url=None):
             'timestamp': datetime.now().isoformat(),
             'id': notification_id
         }
+    })
+    # 写入跨进程广播队列；其他进程已发出同一通知（例如多个进程的客户端同步了同一条提醒）时不再重复推送
+    if relay.publish(notification_id, payload):
+        broadcast_payload(payload)
+
+
+def publish_page_event(event, page_id, version=None, fields=None, changed=(), origin=None):
+    """
+    广播页面变化事件（page_created / page_updated / page_deleted）给所有进程的客户端
+    fields 是随事件下发的新值；changed 是变化了的页面字段，默认即 fields 的键
+    （正文变化时 fields 里是补丁或完整正文以及链接/标签，过长的正文不下发，由客户端自行重新加载）
+    fields 只发给当前打开该页面（subscribe）的客户端，其他客户端只收到版本号和 changed
+    origin 是发起修改的标签页 ID，该标签页收到后忽略自己的事件
+    """
+    fields = fields or {}
+    message = {
+        'type': event,
+        'page_id': page_id,
+        'version': version,
+        'changed': sorted(changed or fields),
+        'origin': origin
     }
-    
+    # 不带 fields 的消息只通知哪个页面的哪些字段变了，客户端需要时通过 /api/page/<id>（需登录）拉取
+    summary = json.dumps(message)
+    # 只有存在其他 worker 时才写跨进程队列，且不带 fields（不把正文复制进队列）
+    if relay.peers:
+        relay.publish(f"{event}:{page_id}:{uuid.uuid4().hex}", summary)
+    # 完整字段（补丁或正文）只发给打开了该页面的客户端
+    detail = json.dumps({**message, 'fields': fields})
     with clients_lock:
-        disconnected = set()
-        for ws in clients:
-            try:
-                ws.send(json.dumps(data))
-            except Exception:
-                disconnected.add(ws)
-        
-        for ws in disconnected:
-            clients.remove(ws)
\ No newline at end of file
+        targets = list(clients.values())
+    for client in targets:
+        client.enqueue(detail if client.page_id == page_id else summary)
@@ -14,11 +14,15 @@ window.Analytics = {
     modalId: 'analytics-modal',
     chartInstance1: null,
     chartInstance2: null,
+    statsRequest: null, // 所有变量统计数据的批量请求（Promise），打开面板时预取
+    statsPoints: 90,    // 趋势图最多显示的点数，超出时由后端合并相邻时段
 
     // 打开管理面板
     openPanel: function() {
         this.renderModalStructure();
         this.loadVariablesList();
+        this.invalidateStats();
+        this.getStats();
         document.getElementById(this.modalId).classList.remove('hidden');
     },
 
@@ -76,6 +80,25 @@ window.Analytics = {
     // 刷新变量列表
     refreshVariables: function() {
         this.loadVariablesList();
+        this.invalidateStats();
+        this.getStats();
+    },
+
+    // 一次请求获取所有变量的统计数据，结果按变量 ID 索引
+    getStats: function() {
+        if (!this.statsRequest) {
+            this.statsRequest = fetch(`/api/vars/stats?points=${this.statsPoints}`)
+                .then(res => res.ok ? res.json() : {})
+                .catch(e => {
+                    console.error('加载统计数据失败:', e);
+                    return {};
+                });
+        }
+        return this.statsRequest;
+    },
+
+    invalidateStats: function() {
+        this.statsRequest = null;
     },
 
     // 加载变量列表
@@ -138,6 +161,7 @@ window.Analytics = {
             const res = await fetch(`/api/vars/${varId}/delete`, { method: 'POST' });
             const data = await res.json();
             if (data.status === 'success') {
+                this.invalidateStats();
                 const dash = document.getElementById('analytics-dashboard');
                 if (dash) {
                     dash.innerHTML = `<div class="h-full flex flex-col items-center justify-center text-gray-400"><p>Variable deleted successfully</p></div>`;
@@ -219,6 +243,7 @@ window.Analytics = {
             });
             const data = await res.json();
             if (data.status === 'success') {
+                this.invalidateStats();
                 alert('success');
                 this.loadVariablesList();
                 this.loadDashboardByName(data.name);
@@ -242,8 +267,13 @@ window.Analytics = {
         dash.innerHTML = `<div class="text-center mt-20"><i class="fas fa-spinner fa-spin text-2xl text-indigo-500"></i></div>`;
 
         try {
-            const res = await fetch(`/api/vars/${varId}/stats`);
-            const data = await res.json();
+            const allStats = await this.getStats();
+            let data = allStats[varId];
+            if (!data) {
+                // 批量数据里没有（例如刚创建的变量）时单独请求
+                const res = await fetch(`/api/vars/${varId}/stats?points=${this.statsPoints}`);
+                data = await res.json();
+            }
 
             // 获取变量定义
             const varDef = window.allVariables.find(v => v.id === varId) || {};
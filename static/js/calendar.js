@@ -14,6 +14,27 @@ if (window.pageType === 'calendar') {
     const weekHeader = document.getElementById('calendar-week-header');
     const monthNames = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"];
 
+    // Events of the visible range only, fetched from /api/calendar/events
+    window.calendarEvents = [];
+    let loadSeq = 0;
+
+    async function loadEvents(start, end) {
+        const seq = ++loadSeq;
+        try {
+            const res = await fetch(`/api/calendar/events?start=${start}&end=${end}`);
+            const events = await res.json();
+            if (seq !== loadSeq) return false; // A newer range was requested meanwhile
+            window.calendarEvents = Array.isArray(events) ? events : [];
+        } catch (err) {
+            console.error('Failed to load events:', err);
+            if (seq !== loadSeq) return false;
+            window.calendarEvents = [];
+        }
+        return true;
+    }
+
+    const toDateStr = (y, m, d) => `${y}-${String(m + 1).padStart(2, '0')}-${String(d).padStart(2, '0')}`;
+
     // ===== Public API =====
     window.switchToDayView = (dateStr) => {
         currentViewMode = 'day';
@@ -64,21 +85,67 @@ if (window.pageType === 'calendar') {
             formData.append('file', file);
             
             try {
-                const res = await fetch(`/api/calendar/import`, { method: 'POST', body: formData });
-                const d = await res.json();
-                if (d.status === 'success') {
-                    alert('Import successful!');
+                // The server streams one JSON progress message per line while it imports
+                const res = await fetch(`/api/calendar/import`, {
+                    method: 'POST',
+                    body: formData,
+                    headers: { 'Accept': 'application/x-ndjson', 'X-Client-Id': window.clientId }
+                });
+                if (!res.ok) {
+                    const d = await res.json().catch(() => ({}));
+                    alert('Import failed: ' + (d.error || res.status));
+                    return;
+                }
+                
+                const reader = res.body.getReader();
+                const decoder = new TextDecoder();
+                let buffered = '';
+                let last = null;
+                while (true) {
+                    const { done, value } = await reader.read();
+                    if (done) break;
+                    buffered += decoder.decode(value, { stream: true });
+                    const lines = buffered.split('\n');
+                    buffered = lines.pop();
+                    for (const line of lines.filter(Boolean)) {
+                        last = JSON.parse(line);
+                        if (last.type === 'progress') showImportProgress(last);
+                    }
+                }
+                showImportProgress(null);
+                
+                if (last?.type === 'done') {
+                    alert(`Import successful! ${last.events} events into ${last.page_ids.length} page(s)` +
+                          (last.skipped ? `, ${last.skipped} skipped` : ''));
                     location.reload();
                 } else {
-                    alert('Import failed: ' + d.error);
+                    alert('Import failed: ' + (last?.error || 'connection lost'));
                 }
             } catch (err) { 
+                showImportProgress(null);
                 console.error(err); 
             }
         };
         input.click();
     };
 
+    // Small fixed banner with the import progress; null removes it
+    function showImportProgress(progress) {
+        let banner = document.getElementById('ics-import-progress');
+        if (!progress) {
+            banner?.remove();
+            return;
+        }
+        if (!banner) {
+            banner = document.createElement('div');
+            banner.id = 'ics-import-progress';
+            banner.className = 'fixed bottom-4 right-4 bg-white border rounded shadow px-4 py-2 text-sm text-gray-600 z-50';
+            document.body.appendChild(banner);
+        }
+        const percent = progress.total && progress.bytes ? ` (${Math.min(100, Math.round(progress.bytes * 100 / progress.total))}%)` : '';
+        banner.innerText = `Importing... ${progress.events} events${percent}`;
+    }
+
     window.renderCalendar = () => {
         if (currentViewMode === 'day') {
             renderDayView();
@@ -88,22 +155,25 @@ if (window.pageType === 'calendar') {
     };
 
     // ===== Private render functions =====
-    function renderMonthView() {
+    async function renderMonthView() {
         if (!grid) return;
+
+        const year = viewDate.getFullYear();
+        const month = viewDate.getMonth();
+        const firstDay = new Date(year, month, 1);
+        const lastDay = new Date(year, month + 1, 0);
+        const startDay = firstDay.getDay();
+        const totalDays = lastDay.getDate();
+
+        if (!await loadEvents(toDateStr(year, month, 1), toDateStr(year, month, totalDays))) return;
         
         grid.className = 'calendar-grid bg-gray-100';
         weekHeader.classList.remove('hidden');
         grid.innerHTML = '';
 
-        const year = viewDate.getFullYear();
-        const month = viewDate.getMonth();
         titleEl.innerText = `${monthNames[month]} ${year}`;
         updateHeaderControls('month');
 
-        const firstDay = new Date(year, month, 1);
-        const lastDay = new Date(year, month + 1, 0);
-        const startDay = firstDay.getDay();
-        const totalDays = lastDay.getDate();
         const todayStr = new Date().toISOString().split('T')[0];
 
         // Fill empty cells at month start
@@ -113,7 +183,7 @@ if (window.pageType === 'calendar') {
 
         // Render date cells
         for (let day = 1; day <= totalDays; day++) {
-            const currentStr = `${year}-${String(month + 1).padStart(2, '0')}-${String(day).padStart(2, '0')}`;
+            const currentStr = toDateStr(year, month, day);
             const events = window.calendarEvents.filter(e => e.date === currentStr);
             
             let html = '';
@@ -133,8 +203,9 @@ if (window.pageType === 'calendar') {
         }
     }
 
-    function renderDayView() {
+    async function renderDayView() {
         if (!grid) return;
+        if (!await loadEvents(selectedDay, selectedDay)) return;
         
         grid.className = 'flex flex-col bg-white min-h-[500px] border border-gray-200 rounded-lg overflow-hidden';
         weekHeader.classList.add('hidden');
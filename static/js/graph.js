@@ -17,6 +17,12 @@ if (window.pageType === 'graph') {
     let cabinetSort = 'tag';
     let selectedNodeId = null;
 
+    // Links/tags come from the server-side index (no content scanning),
+    // loaded from /api/meta/graph on init
+    let graphMeta = new Map();
+    const getPageLinks = (id) => graphMeta.get(id)?.links || [];
+    const getPageTags = (id) => graphMeta.get(id)?.tags || [];
+
     // ========== Global icon cleaning function (compatibility) ==========
     window.getDisplayIcon = window.getDisplayIcon || function(icon) {
         if (!icon) return '📄';
@@ -64,7 +70,8 @@ if (window.pageType === 'graph') {
     network = new vis.Network(container, { nodes: graphNodes, edges: graphEdges }, options);
 
     // ========== Core rendering logic ==========
-    function refreshGraphData() {
+    // save=false when redrawing for remote changes (the visible set is unchanged)
+    function refreshGraphData(save = true) {
         graphNodes.clear();
         graphEdges.clear();
 
@@ -85,7 +92,7 @@ if (window.pageType === 'graph') {
             const sourcePage = window.allPagesData.find(x => x.id === sourceId);
             if(!sourcePage) return;
 
-            const links = window.getLinks(sourcePage.content);
+            const links = getPageLinks(sourceId);
             links.forEach(linkTitle => {
                 const targetPage = window.allPagesData.find(x => x.title === linkTitle);
                 if(targetPage && nodesInGraph.has(targetPage.id)) {
@@ -98,7 +105,7 @@ if (window.pageType === 'graph') {
             });
         });
         
-        saveCurrentState();
+        if (save) saveCurrentState();
     }
 
     // ========== State persistence ==========
@@ -173,12 +180,12 @@ if (window.pageType === 'graph') {
                 try {
                     const res = await fetch(`/api/graph/connect`, {
                         method: 'POST', 
-                        headers: {'Content-Type': 'application/json'},
+                        headers: jsonHeaders(),
                         body: JSON.stringify({ source_id: selectedNodeId, target_title: targetName })
                     });
                     const data = await res.json();
                     if(data.status === 'success') {
-                        page.content = data.content;
+                        if (graphMeta.has(selectedNodeId)) graphMeta.get(selectedNodeId).links = data.links;
                         const targetP = window.allPagesData.find(p => p.title === targetName);
                         if(targetP && nodesInGraph.has(targetP.id)) refreshGraphData();
                         else alert("Connection established. Drag the target page into the graph to see the link.");
@@ -191,7 +198,7 @@ if (window.pageType === 'graph') {
                 }
             }
         } else if (action === 'disconnect') {
-            const existingLinks = window.getLinks(page.content);
+            const existingLinks = getPageLinks(selectedNodeId);
             if(existingLinks.length === 0) {
                 alert("This page currently has no outgoing links.");
                 return;
@@ -203,12 +210,12 @@ if (window.pageType === 'graph') {
                 try {
                     const res = await fetch(`/api/graph/disconnect`, {
                         method: 'POST', 
-                        headers: {'Content-Type': 'application/json'},
+                        headers: jsonHeaders(),
                         body: JSON.stringify({ source_id: selectedNodeId, target_title: targetName })
                     });
                     const data = await res.json();
                     if(data.status === 'success') {
-                        page.content = data.content;
+                        if (graphMeta.has(selectedNodeId)) graphMeta.get(selectedNodeId).links = data.links;
                         refreshGraphData();
                     }
                 } catch(err) {
@@ -245,10 +252,7 @@ if (window.pageType === 'graph') {
             const untagged = [];
             
             availablePages.forEach(p => {
-                const tags = [];
-                const regex = /\[\[(?![@])([^\]]+?)\]\]/g;
-                let match;
-                while ((match = regex.exec(p.content)) !== null) tags.push(match[1]);
+                const tags = getPageTags(p.id);
                 
                 if(tags.length === 0) {
                     untagged.push(p);
@@ -320,14 +324,46 @@ if (window.pageType === 'graph') {
     });
 
     // ========== Initialize ==========
-    refreshGraphData();
-    renderCabinet();
+    async function loadGraphMeta() {
+        try {
+            const res = await fetch('/api/meta/graph');
+            window.graphData = await res.json();
+        } catch (err) {
+            console.error('Failed to load graph data:', err);
+        }
+        graphMeta = new Map((window.graphData?.nodes || []).map(n => [n.id, n]));
+    }
 
-    // ========== Listen for data updates ==========
-    // When global page data changes, refresh graph and cabinet
-    window.addEventListener('pagesDataUpdated', () => {
+    loadGraphMeta().then(() => {
         refreshGraphData();
         renderCabinet();
     });
 
+    // ========== Listen for data updates ==========
+    // When global page data changes (locally or via server-pushed page events), refresh graph and cabinet
+    window.addEventListener('pagesDataUpdated', (e) => {
+        const event = e.detail || {};
+        let save = true;
+        if (event.type === 'resync') {
+            loadGraphMeta().then(() => {
+                refreshGraphData(false);
+                renderCabinet();
+            });
+            return;
+        }
+        if (event.type === 'page_deleted') {
+            graphMeta.delete(event.page_id);
+            save = nodesInGraph.delete(event.page_id);
+        } else if (event.type) {
+            save = false;
+            const fields = event.fields || {};
+            if (fields.links) {
+                const node = graphMeta.get(event.page_id) || {id: event.page_id};
+                graphMeta.set(event.page_id, {...node, links: fields.links, tags: fields.tags || []});
+            }
+        }
+        refreshGraphData(save);
+        renderCabinet();
+    });
+
 }
\ No newline at end of file
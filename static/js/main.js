@@ -6,6 +6,9 @@
     window.mdPreview = document.getElementById('markdown-preview');
     window.mdSource = document.getElementById('markdown-source');
     
+    // 标签页 ID：随写请求发送，服务器推送页面事件时据此跳过本标签页自己的修改
+    window.clientId = window.crypto?.randomUUID?.() || `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+    
     if (typeof window.calendarEvents === 'undefined') window.calendarEvents = [];
     if (typeof window.globalNotices === 'undefined') window.globalNotices = [];
     if (typeof window.allVariables === 'undefined') window.allVariables = [];
@@ -25,8 +28,28 @@
     
     // 加载变量数据
     loadVariables();
+    
+    // 加载全局提醒（ETag 缓存，未变化时返回 304）
+    loadGlobalNotices();
 })();
 
+// 写请求的公共请求头
+function jsonHeaders() {
+    return {'Content-Type': 'application/json', 'X-Client-Id': window.clientId};
+}
+
+// ========== 加载全局提醒 ==========
+async function loadGlobalNotices() {
+    try {
+        const res = await fetch('/api/meta/notices');
+        const notices = await res.json();
+        // 保留加载完成前本页新插入的提醒
+        window.globalNotices = notices.concat(window.globalNotices || []);
+    } catch (err) {
+        console.error('加载提醒失败:', err);
+    }
+}
+
 // ========== 加载变量数据 ==========
 async function loadVariables() {
     try {
@@ -94,15 +117,10 @@ window.triggerMediaUpload = function(type) {
 async function handleFileUpload(file, type) {
     if(!file) return;
     
-    const formData = new FormData();
-    formData.append('file', file);
-
     try {
-        const res = await fetch(`/api/upload`, {
-            method: 'POST',
-            body: formData
+        const data = await uploadFileChunked(file, (sent) => {
+            showUploadProgress(file.size ? Math.round(sent * 100 / file.size) : 100);
         });
-        const data = await res.json();
         
         if (data.url) {
             const regex = new RegExp(`\\{\\{${type}\\|?\\s*\\}\\}`, 'i');
@@ -120,12 +138,113 @@ async function handleFileUpload(file, type) {
         }
     } catch (err) {
         console.error(err);
-        alert('Upload failed.');
+        alert('Upload failed: ' + err.message);
     } finally {
+        showUploadProgress(null);
         window.fileInput.value = '';
     }
 }
 
+// 分片续传：文件按 chunk_size 切片逐个 PATCH，断线后查询服务器已接收的偏移继续；
+// 未完成的 upload_id 记在 localStorage，刷新页面后重新选择同一文件也能续传
+const UPLOAD_HASH_LIMIT = 64 * 1024 * 1024;   // 超过此大小不在浏览器里预先算哈希（需整个读入内存）
+const UPLOAD_MAX_RETRIES = 8;
+
+async function hashFile(file) {
+    if (!window.crypto?.subtle || file.size > UPLOAD_HASH_LIMIT) return null;
+    try {
+        const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+        return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+    } catch (err) {
+        return null;
+    }
+}
+
+async function uploadFileChunked(file, onProgress) {
+    const storageKey = `upload:${file.name}:${file.size}:${file.lastModified}`;
+    let upload = null;
+    
+    // 续传之前未完成的上传
+    const savedId = localStorage.getItem(storageKey);
+    if (savedId) {
+        const res = await fetch(`/api/uploads/${savedId}`).catch(() => null);
+        if (res?.ok) upload = await res.json();
+        else localStorage.removeItem(storageKey);
+    }
+    
+    if (!upload) {
+        const res = await fetch('/api/uploads', {
+            method: 'POST',
+            headers: jsonHeaders(),
+            body: JSON.stringify({ filename: file.name, size: file.size, sha256: await hashFile(file) })
+        });
+        upload = await res.json();
+        if (!res.ok) throw new Error(upload.error || res.statusText);
+        // 服务器已有相同内容，无需传输
+        if (upload.status === 'complete') return upload;
+        localStorage.setItem(storageKey, upload.upload_id);
+    }
+    
+    let offset = upload.offset;
+    let retries = 0;
+    do {
+        onProgress(offset);
+        const chunk = file.slice(offset, offset + upload.chunk_size);
+        let res = null;
+        try {
+            res = await fetch(`/api/uploads/${upload.upload_id}`, {
+                method: 'PATCH',
+                headers: { 'Upload-Offset': String(offset), 'Content-Type': 'application/octet-stream' },
+                body: chunk
+            });
+        } catch (err) {
+            res = null;   // 网络中断，稍后按服务器偏移重试
+        }
+        const data = res ? await res.json().catch(() => ({})) : {};
+        
+        if (res?.ok) {
+            retries = 0;
+            if (data.status === 'complete') {
+                localStorage.removeItem(storageKey);
+                onProgress(file.size);
+                return data;
+            }
+            offset = data.offset;
+            continue;
+        }
+        const busy = res?.status === 409 && data.error === 'Upload busy';   // 上一次请求仍在写入，稍后重试
+        if (res?.status === 409 && !busy && data.offset !== undefined) {
+            offset = data.offset;   // 偏移不一致：以服务器为准
+            continue;
+        }
+        if (res && res.status < 500 && !busy) {
+            localStorage.removeItem(storageKey);
+            throw new Error(data.error || res.statusText);
+        }
+        
+        if (++retries > UPLOAD_MAX_RETRIES) throw new Error('connection lost');
+        await new Promise(resolve => setTimeout(resolve, Math.min(1000 * Math.pow(2, retries - 1), 30000)));
+        const status = await fetch(`/api/uploads/${upload.upload_id}`).catch(() => null);
+        if (status?.ok) offset = (await status.json()).offset;
+    } while (true);
+}
+
+// 上传进度条，null 移除
+function showUploadProgress(percent) {
+    let banner = document.getElementById('upload-progress');
+    if (percent === null) {
+        banner?.remove();
+        return;
+    }
+    if (!banner) {
+        banner = document.createElement('div');
+        banner.id = 'upload-progress';
+        banner.className = 'fixed bottom-4 right-4 bg-white border rounded shadow px-4 py-2 text-sm text-gray-600 z-50';
+        document.body.appendChild(banner);
+    }
+    banner.innerText = `Uploading... ${percent}%`;
+}
+
 // ========== Markdown 渲染模块 ==========
 window.renderMarkdown = function() {
     if(window.mdPreview && window.mdSource && typeof marked !== 'undefined') {
@@ -151,16 +270,130 @@ window.toggleEditMode = function() {
 };
 
 // ========== 页面数据操作 ==========
+// 增量保存：只上传相对上次保存版本的差异，版本冲突时取回服务器正文合并后重试
 let saveTimer;
+let saveChain = Promise.resolve();
+let lastSavedContent = window.mdSource ? window.mdSource.value : null;
+
+function isHighSurrogate(code) {
+    return code >= 0xD800 && code <= 0xDBFF;
+}
+
+function isLowSurrogate(code) {
+    return code >= 0xDC00 && code <= 0xDFFF;
+}
+
+// 计算单段差异（公共前缀/后缀之间的部分），偏移为 UTF-16 码元，与后端一致
+function diffText(oldText, newText) {
+    let start = 0;
+    const minLen = Math.min(oldText.length, newText.length);
+    while (start < minLen && oldText.charCodeAt(start) === newText.charCodeAt(start)) start++;
+    // 不从代理对中间切开（例如 😀→😁 只有低位不同），否则服务器无法编码孤立的代理项
+    if (start > 0 && isHighSurrogate(oldText.charCodeAt(start - 1))) start--;
+    
+    let oldEnd = oldText.length;
+    let newEnd = newText.length;
+    while (oldEnd > start && newEnd > start && oldText.charCodeAt(oldEnd - 1) === newText.charCodeAt(newEnd - 1)) {
+        oldEnd--;
+        newEnd--;
+    }
+    if (oldEnd < oldText.length && isLowSurrogate(oldText.charCodeAt(oldEnd))) {
+        oldEnd++;
+        newEnd++;
+    }
+    return {pos: start, del: oldEnd - start, ins: newText.slice(start, newEnd)};
+}
+
+async function postContent(body) {
+    const res = await fetch(`/api/page/${window.pageId}/update`, {
+        method: 'POST', 
+        headers: jsonHeaders(),
+        body: JSON.stringify(body)
+    });
+    const data = await res.json().catch(() => ({}));
+    return {ok: res.ok, status: res.status, data};
+}
+
+// 把本地相对 base 的修改移到服务器的新正文上；两边改动的区域重叠时返回 null
+function rebaseText(base, local, server) {
+    if (server === base || server === local) return local;
+    if (local === base) return server;
+    const mine = diffText(base, local);
+    const theirs = diffText(base, server);
+    if (mine.pos + mine.del < theirs.pos) {
+        return server.slice(0, mine.pos) + mine.ins + server.slice(mine.pos + mine.del);
+    }
+    if (theirs.pos + theirs.del < mine.pos) {
+        const pos = mine.pos + theirs.ins.length - theirs.del;
+        return server.slice(0, pos) + mine.ins + server.slice(pos + mine.del);
+    }
+    return null;
+}
+
+// 版本冲突：取回服务器上的最新正文作为新的基准，把编辑器里的修改合并上去；无法自动合并时询问用户
+async function rebaseOnServer(val) {
+    const res = await fetch(`/api/page/${window.pageId}?content=1`);
+    if (!res.ok) throw new Error('Reload failed');
+    const page = await res.json();
+    
+    // 取回期间可能又有输入，以编辑器当前内容为准
+    const local = window.mdSource ? window.mdSource.value : val;
+    const base = lastSavedContent;
+    let merged = base === null ? local : rebaseText(base, local, page.content);
+    if (merged === null) {
+        merged = confirm('This page was changed elsewhere. Overwrite it with your version?\n' +
+                         'Cancel keeps the other version and discards your unsaved edits.')
+            ? local : page.content;
+    }
+    lastSavedContent = page.content;
+    window.pageVersion = page.version;
+    
+    if (window.mdSource && merged !== local) {
+        const {selectionStart, selectionEnd} = window.mdSource;
+        window.mdSource.value = merged;
+        window.mdSource.setSelectionRange(Math.min(selectionStart, merged.length), Math.min(selectionEnd, merged.length));
+        window.renderMarkdown();
+    }
+    return merged;
+}
+
+async function persistContent(val) {
+    for (let attempt = 0; attempt < 3; attempt++) {
+        if (val === lastSavedContent) return;
+        
+        let result = null;
+        if (lastSavedContent !== null) {
+            const baseVersion = window.pageVersion;
+            result = await postContent({
+                patch: [diffText(lastSavedContent, val)],
+                base_version: baseVersion,
+                length: val.length
+            });
+            // 补丁无效时仍基于同一版本全量保存，服务器版本已变化时同样返回 409
+            if (result.status === 400) result = await postContent({content: val, base_version: baseVersion});
+        }
+        if (result && result.ok) {
+            lastSavedContent = val;
+            if (typeof result.data.version === 'number') window.pageVersion = result.data.version;
+            return;
+        }
+        if (result && result.status !== 409) throw new Error(result.data.error || 'Save failed');
+        
+        // 其他标签页或设备先保存了新版本（或还没有基准正文）：合并后基于新版本重试
+        val = await rebaseOnServer(val);
+    }
+    throw new Error('Save failed: version conflict');
+}
+
 window.saveContent = function(val) {
     clearTimeout(saveTimer);
     saveTimer = setTimeout(() => {
         if (window.pageId) {
-            fetch(`/api/page/${window.pageId}/update`, {
-                method: 'POST', 
-                headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({content: val})
-            }).catch(err => console.error('Save failed:', err));
+            // 串行保存，保证每个补丁都基于上一次成功保存的版本
+            // 排到时再读取编辑器内容：前一次保存可能已把服务器上的修改合并进编辑器
+            saveChain = saveChain
+                .then(() => persistContent(window.mdSource ? window.mdSource.value : val))
+                .catch(err => console.error('Save failed:', err));
         }
     }, 800);
 };
@@ -170,19 +403,61 @@ window.saveMeta = function() {
     if (title && window.pageId) {
         fetch(`/api/page/${window.pageId}/update`, { 
             method: 'POST', 
-            headers: {'Content-Type': 'application/json'}, 
+            headers: jsonHeaders(), 
             body: JSON.stringify({title}) 
         }).catch(err => console.error('Save meta failed:', err));
     }
 };
 
+// 一次请求原子地更新页面元数据，并用返回的页面片段原地刷新界面
+async function patchPageMeta(fields) {
+    const res = await fetch(`/api/page/${window.pageId}/meta`, {
+        method: 'POST', 
+        headers: jsonHeaders(), 
+        body: JSON.stringify(fields) 
+    });
+    const data = await res.json();
+    if (!res.ok) throw new Error(data.error || 'Update failed');
+    applyPageMeta(data.page);
+    return data.page;
+}
+
+// page 可以只包含部分字段（服务器推送的变化事件），只刷新出现的字段
+function applyPageMeta(page) {
+    if ('cover' in page) {
+        const coverArea = document.getElementById('cover-area');
+        if (coverArea) {
+            coverArea.className = `cover-container ${page.cover || 'h-16 bg-white border-b border-gray-50'} transition-all duration-500 ease-in-out`;
+        }
+        document.getElementById('remove-cover-btn')?.classList.toggle('hidden', !page.cover);
+        document.getElementById('add-cover-btn')?.classList.toggle('hidden', !!page.cover);
+    }
+    
+    if ('icon' in page) {
+        const iconElement = document.getElementById('current-icon-display');
+        if (iconElement) iconElement.innerText = page.icon;
+        applyIconVisibility();
+    }
+    
+    // 正在输入标题时不覆盖
+    const titleInput = document.getElementById('title');
+    if ('title' in page && titleInput && document.activeElement !== titleInput) {
+        titleInput.value = page.title;
+    }
+    
+    // 同步侧边栏条目
+    const entry = (window.allPagesData || []).find(p => p.id === page.id);
+    if (entry) {
+        for (const key of ['title', 'icon', 'is_pinned']) {
+            if (key in page) entry[key] = page[key];
+        }
+        window.sidebar?.renderList();
+    }
+}
+
 window.changeCover = function(cls) {
     if (window.pageId) {
-        fetch(`/api/page/${window.pageId}/update`, { 
-            method: 'POST', 
-            headers: {'Content-Type': 'application/json'}, 
-            body: JSON.stringify({cover: cls}) 
-        }).then(() => location.reload());
+        patchPageMeta({cover: cls}).catch(err => console.error('Change cover failed:', err));
     }
 };
 
@@ -201,21 +476,8 @@ window.updateIcon = async function() {
     if (!newIcon || !window.pageId) return;
     
     try {
-        await fetch(`/api/page/${window.pageId}/update`, { 
-            method: 'POST', 
-            headers: {'Content-Type': 'application/json'}, 
-            body: JSON.stringify({icon: newIcon}) 
-        });
-        
-        if (newIcon.includes('||')) {
-            await fetch(`/api/page/${window.pageId}/update`, { 
-                method: 'POST', 
-                headers: {'Content-Type': 'application/json'}, 
-                body: JSON.stringify({cover: ''}) 
-            });
-        }
-        
-        location.reload();
+        // 隐藏模式下封面由后端在同一次更新里清空
+        await patchPageMeta({icon: newIcon});
     } catch (err) {
         console.error('❌ 更新图标失败:', err);
     }
@@ -225,7 +487,7 @@ window.createPage = async function(type) {
     try {
         const res = await fetch(`/api/page/create`, { 
             method: 'POST', 
-            headers: {'Content-Type': 'application/json'}, 
+            headers: jsonHeaders(), 
             body: JSON.stringify({type}) 
         });
         const d = await res.json();
@@ -237,13 +499,128 @@ window.createPage = async function(type) {
 
 window.deletePage = function(id) {
     if(confirm("Delete this page?")) {
-        fetch(`/api/page/${id}/delete`, {method:'POST'})
+        fetch(`/api/page/${id}/delete`, {method:'POST', headers: jsonHeaders()})
             .then(() => location.href = `/`)
             .catch(err => console.error('Delete failed:', err));
     }
 };
 
 
+// ========== 服务器推送的页面变化（其他标签页、设备或图谱操作） ==========
+// 按 diffText 的格式应用补丁，偏移为 UTF-16 码元，与 JS 字符串下标一致
+function applyTextPatch(text, ops) {
+    let result = '';
+    let cursor = 0;
+    for (const op of ops) {
+        result += text.slice(cursor, op.pos) + (op.ins || '');
+        cursor = op.pos + (op.del || 0);
+    }
+    return result + text.slice(cursor);
+}
+
+// 当前页面正文被其他地方修改：没有未保存的本地修改时原地替换编辑器内容
+function applyRemoteContent(event) {
+    if (!window.mdSource || typeof event.version !== 'number' || event.version <= window.pageVersion) return;
+    // 有未保存的修改时不动编辑器，下次保存遇到版本冲突时会取回服务器正文并合并
+    if (lastSavedContent === null || window.mdSource.value !== lastSavedContent) return;
+    
+    const fields = event.fields;
+    let next = null;
+    if (fields.patch && fields.patch.base_version === window.pageVersion) {
+        next = applyTextPatch(lastSavedContent, fields.patch.ops);
+    } else if (typeof fields.content === 'string') {
+        next = fields.content;
+    } else {
+        // 正文过长未随事件下发，或中间漏掉了版本
+        location.reload();
+        return;
+    }
+    
+    const {selectionStart, selectionEnd} = window.mdSource;
+    window.mdSource.value = next;
+    window.mdSource.setSelectionRange(Math.min(selectionStart, next.length), Math.min(selectionEnd, next.length));
+    lastSavedContent = next;
+    window.pageVersion = event.version;
+    window.renderMarkdown();
+}
+
+// 其他 worker 转发的事件只带 changed，不带字段值：从服务器拉取后按本地事件处理
+async function fetchPageEventFields(event) {
+    const withContent = event.page_id === window.pageId && event.changed.includes('content');
+    try {
+        const res = await fetch(`/api/page/${event.page_id}${withContent ? '?content=1' : ''}`);
+        if (!res.ok) return;
+        const page = await res.json();
+        const fields = {};
+        for (const key of event.type === 'page_created' ? Object.keys(page) : event.changed) {
+            if (key in page) fields[key] = page[key];
+        }
+        if (event.changed.includes('content')) {
+            fields.links = page.links;
+            fields.tags = page.tags;
+            if (withContent) fields.content = page.content;
+        }
+        handlePageEvent({...event, version: page.version, fields});
+    } catch (err) {
+        console.error('Fetch page event failed:', err);
+    }
+}
+
+function handlePageEvent(event) {
+    if (event.origin && event.origin === window.clientId) return;
+    if (!event.fields && event.type !== 'page_deleted') {
+        fetchPageEventFields(event);
+        return;
+    }
+    event.fields = event.fields || {};
+    const pages = window.allPagesData || [];
+    const index = pages.findIndex(p => p.id === event.page_id);
+    
+    if (event.type === 'page_created') {
+        if (index < 0) pages.push({...event.fields, id: event.page_id});
+    } else if (event.type === 'page_deleted') {
+        if (index >= 0) pages.splice(index, 1);
+        if (event.page_id === window.pageId) {
+            location.href = '/';
+            return;
+        }
+    } else if (event.type === 'page_updated') {
+        if (event.page_id === window.pageId) {
+            applyPageMeta({...event.fields, id: event.page_id});
+            if (event.changed.includes('content')) applyRemoteContent(event);
+        } else if (index >= 0) {
+            for (const key of ['title', 'icon', 'is_pinned']) {
+                if (key in event.fields) pages[index][key] = event.fields[key];
+            }
+        }
+    }
+    
+    window.sidebar?.renderList();
+    window.dispatchEvent(new CustomEvent('pagesDataUpdated', {detail: event}));
+}
+
+// 断线期间可能漏掉事件，重连后重新拉取页面列表
+async function resyncPages() {
+    try {
+        const pages = [];
+        for (let page = 1; ; page++) {
+            const res = await fetch(`/api/pages?page=${page}&per_page=500`);
+            const data = await res.json();
+            pages.push(...data.pages);
+            if (pages.length >= data.total || data.pages.length === 0) break;
+        }
+        // 原地替换，侧边栏持有的是同一个数组
+        window.allPagesData.splice(0, window.allPagesData.length, ...pages);
+        window.sidebar?.renderList();
+        window.dispatchEvent(new CustomEvent('pagesDataUpdated', {detail: {type: 'resync'}}));
+    } catch (err) {
+        console.error('Resync pages failed:', err);
+    }
+}
+
+window.addEventListener('pageEvent', (e) => handlePageEvent(e.detail));
+window.addEventListener('wsReconnected', resyncPages);
+
 // ========== Notice 交互逻辑 ==========
 window.toggleNoticeInput = function(id) {
     const type = document.getElementById(`cond-type-${id}`)?.value;
@@ -328,30 +705,30 @@ window.getVariableUnit = function(varCode) {
 };
 
 // ========== Emoji|| 格式解析器 ==========
-(function initEmojiPipeVisibility() {
+// 图标为 "Emoji||..." 时隐藏封面和图标；图标更新后会再次调用
+function applyIconVisibility() {
     const iconElement = document.getElementById('current-icon-display');
     const coverArea = document.getElementById('cover-area');
     const pageIconWrapper = document.querySelector('.page-icon-wrapper');
     const pageHeader = document.querySelector('.page-header-wrapper');
-    const addCoverBtn = document.querySelector('button[onclick*="changeCover"]');
+    const addCoverBtn = document.getElementById('add-cover-btn');
     
     if (!iconElement) return;
     
     const iconText = iconElement.innerText.trim();
     const emojiPipePattern = /^(\p{Emoji}+\|\|).*$/u;
     const isHiddenMode = emojiPipePattern.test(iconText);
+    const display = isHiddenMode ? 'none' : '';
     
-    if (isHiddenMode) {
-        
-        if (coverArea) coverArea.style.display = 'none';
-        if (pageIconWrapper) pageIconWrapper.style.display = 'none';
-        if (pageHeader) {
-            pageHeader.style.paddingTop = '0';
-            pageHeader.style.marginTop = '0';
-        }
-        if (addCoverBtn) addCoverBtn.style.display = 'none';
+    if (coverArea) coverArea.style.display = display;
+    if (pageIconWrapper) pageIconWrapper.style.display = display;
+    if (pageHeader) {
+        pageHeader.style.paddingTop = isHiddenMode ? '0' : '';
+        pageHeader.style.marginTop = isHiddenMode ? '0' : '';
     }
-})();
+    if (addCoverBtn) addCoverBtn.style.display = display;
+}
+applyIconVisibility();
 
 // ========== 辅助函数 ==========
 window.isHiddenMode = function(iconString) {
@@ -6,6 +6,8 @@ class SimpleSidebar {
         this.pages = window.allPagesData || [];
         this.sortMode = 'custom'; // custom, recent, name
         this.searchTerm = '';
+        this.contentResults = []; // Full-text matches from /api/search
+        this.searchTimer = null;
         
         this.init();
         this.loadState();
@@ -93,7 +95,7 @@ class SimpleSidebar {
         // Apply search and sort
         const filteredPages = this.filterAndSortPages();
         
-        if (filteredPages.length === 0) {
+        if (filteredPages.length === 0 && this.contentResults.length === 0) {
             this.container.innerHTML = '<div class="text-center text-gray-400 text-xs py-8">No matching pages found</div>';
             return;
         }
@@ -119,6 +121,12 @@ class SimpleSidebar {
             html += this.renderPageList(normalPages);
         }
         
+        // Full-text matches section
+        if (this.contentResults.length > 0) {
+            html += '<div class="px-2 py-1 text-[10px] text-gray-400 font-bold uppercase tracking-wider">Content Matches</div>';
+            html += this.renderContentResults(this.contentResults);
+        }
+        
         this.container.innerHTML = html;
         
         // Re-bind pin events
@@ -159,6 +167,41 @@ class SimpleSidebar {
         `).join('');
     }
     
+    // Render full-text results (title/snippet are escaped HTML with <mark> from the server)
+    renderContentResults(results) {
+        return results.map(r => `
+            <a href="/p/${r.id}" class="block px-2 py-1.5 rounded hover:bg-gray-100 transition-colors">
+                <div class="flex items-center space-x-2 truncate">
+                    <span class="text-base">${this.getCleanIcon(r.icon)}</span>
+                    <span class="truncate text-sm">${r.title}</span>
+                </div>
+                <div class="text-[10px] text-gray-400 line-clamp-2 break-all">${r.snippet}</div>
+            </a>
+        `).join('');
+    }
+    
+    // Debounced full-text search
+    scheduleContentSearch() {
+        clearTimeout(this.searchTimer);
+        const term = this.searchTerm.trim();
+        if (term.length < 2) {
+            this.contentResults = [];
+            return;
+        }
+        
+        this.searchTimer = setTimeout(async () => {
+            try {
+                const res = await fetch(`/api/search?q=${encodeURIComponent(term)}&limit=20`);
+                const data = await res.json();
+                if (this.searchTerm.trim() !== term) return; // Stale response
+                this.contentResults = data.results || [];
+                this.renderList();
+            } catch (err) {
+                console.error('Search failed:', err);
+            }
+        }, 250);
+    }
+    
     // Filter and sort pages
     filterAndSortPages() {
         let pages = [...this.pages];
@@ -166,10 +209,7 @@ class SimpleSidebar {
         // Search filter
         if (this.searchTerm) {
             const term = this.searchTerm.toLowerCase();
-            pages = pages.filter(p => 
-                p.title.toLowerCase().includes(term) || 
-                (p.content && p.content.toLowerCase().includes(term))
-            );
+            pages = pages.filter(p => p.title.toLowerCase().includes(term));
         }
         
         // Sort
@@ -206,6 +246,7 @@ class SimpleSidebar {
         if (searchInput) {
             searchInput.addEventListener('input', (e) => {
                 this.searchTerm = e.target.value;
+                this.scheduleContentSearch();
                 this.renderList();
             });
         }
@@ -215,6 +256,7 @@ class SimpleSidebar {
         if (clearBtn) {
             clearBtn.addEventListener('click', () => {
                 this.searchTerm = '';
+                this.scheduleContentSearch();
                 const searchInput = document.getElementById('sidebar-search');
                 if (searchInput) searchInput.value = '';
                 this.renderList();
@@ -266,7 +308,7 @@ class SimpleSidebar {
         try {
             const res = await fetch(`/api/sidebar/toggle_pin/${pageId}`, {
                 method: 'POST',
-                headers: {'Content-Type': 'application/json'}
+                headers: jsonHeaders()
             });
             const data = await res.json();
             
@@ -7,6 +7,7 @@ class WebSocketClient {
         this.maxReconnectAttempts = Infinity;
         this.reconnectDelay = 1000;
         this.isConnected = false;
+        this.hasConnected = false; // 曾经连上过，用于识别重连
         this.messageHandlers = new Map();
         this.notificationHandlers = new Set();
         
@@ -35,7 +36,14 @@ class WebSocketClient {
                 this.reconnectDelay = 1000;
                 this.startPing();
                 this.trigger('connected');
+                // 登记当前打开的页面，服务器只向打开该页面的连接下发正文补丁等完整字段
+                this.send({ type: 'subscribe', page_id: window.pageId || null });
                 this.syncAllNotices();
+                // 断线期间的页面事件已丢失，通知页面重新同步
+                if (this.hasConnected) {
+                    window.dispatchEvent(new CustomEvent('wsReconnected'));
+                }
+                this.hasConnected = true;
             };
             
             this.ws.onmessage = (e) => {
@@ -115,6 +123,13 @@ class WebSocketClient {
                 // ping响应，忽略
                 break;
                 
+            case 'page_created':
+            case 'page_updated':
+            case 'page_deleted':
+                // 页面变化事件由 main.js 原地更新侧边栏/编辑器，graph.js 更新图谱
+                window.dispatchEvent(new CustomEvent('pageEvent', { detail: data }));
+                break;
+                
             default:
                 console.log('📨 收到消息:', data);
         }
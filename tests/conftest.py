@@ -0,0 +1,32 @@
+# tests/conftest.py
+# 测试用的应用实例：数据库、协调库和上传目录都放在临时目录里
+# app.database 在导入时读取路径，环境变量必须在导入 app 之前设置
+import os
+import shutil
+import tempfile
+import pytest
+
+TEST_DIR = tempfile.mkdtemp(prefix='notiobsidian-tests-')
+os.environ['DATABASE_PATH'] = os.path.join(TEST_DIR, 'test.db')
+os.environ['CLUSTER_DATABASE_PATH'] = os.path.join(TEST_DIR, 'test_cluster.db')
+os.environ['UPLOAD_PARTIAL_FOLDER'] = os.path.join(TEST_DIR, 'upload_parts')
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import create_app, websocket
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['UPLOAD_FOLDER'] = os.path.join(TEST_DIR, 'uploads')
+    yield app
+    websocket.notification_checker.stop()
+    websocket.relay.stop()
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['logged_in'] = True
+    return client
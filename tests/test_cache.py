@@ -0,0 +1,74 @@
+# tests/test_cache.py
+# TimeBucketDedupe 的分桶边界和过期行为（通知去重的正确性依赖这些性质）
+from app.utils.cache import TimeBucketDedupe
+
+
+def make_dedupe():
+    # 与 sent_notifications_cache 相同的配置：保留 120 秒，按分钟分桶
+    return TimeBucketDedupe(retention=120, bucket_seconds=60)
+
+
+def test_duplicate_in_same_bucket_is_suppressed():
+    dedupe = make_dedupe()
+    assert dedupe.add('n1', now=10)
+    assert not dedupe.add('n1', now=30)
+    assert dedupe.add('n2', now=30)
+    assert dedupe.stats()['suppressed'] == 1
+
+
+def test_fire_at_bucket_end_is_suppressed_after_rollover():
+    dedupe = make_dedupe()
+    assert dedupe.add('n1', now=59.999)
+    # 下一个桶开始后仍能看到上一个桶里的键
+    assert not dedupe.add('n1', now=60.001)
+    assert not dedupe.add('n1', now=119.999)
+
+
+def test_key_is_kept_for_full_retention_from_bucket_end():
+    dedupe = make_dedupe()
+    assert dedupe.add('n1', now=59.999)
+    # 写在桶的最后一刻，也要完整保留 retention 秒
+    assert not dedupe.add('n1', now=59.999 + 120 - 0.001)
+
+
+def test_key_expires_with_its_bucket():
+    dedupe = make_dedupe()
+    assert dedupe.add('n1', now=0)
+    # 最多保留 retention + 一个桶长，之后整桶丢弃，同一键可再次发送
+    assert dedupe.add('n1', now=180)
+    assert len(dedupe) == 1
+
+
+def test_expired_buckets_are_evicted():
+    dedupe = make_dedupe()
+    for minute in range(10):
+        dedupe.add(f'n{minute}', now=minute * 60)
+    stats = dedupe.stats()
+    assert stats['buckets'] == dedupe.max_buckets
+    assert stats['size'] == dedupe.max_buckets
+    # 很久没有写入后，下一次写入前会清空所有过期的桶
+    assert dedupe.add('n0', now=3600)
+    assert dedupe.stats()['buckets'] == 1
+    assert len(dedupe) == 1
+
+
+def test_broadcast_notification_sends_once(monkeypatch):
+    from datetime import datetime
+    from app import websocket
+
+    class FixedDatetime(datetime):
+        # 通知 ID 含分钟，固定时间避免两次调用跨过分钟边界
+        @classmethod
+        def now(cls, tz=None):
+            return cls(2026, 1, 1, 9, 0, 30)
+
+    published, delivered = [], []
+    monkeypatch.setattr(websocket, 'datetime', FixedDatetime)
+    monkeypatch.setattr(websocket, 'sent_notifications_cache', make_dedupe())
+    monkeypatch.setattr(websocket.relay, 'publish', lambda message_id, payload: published.append(message_id) or True)
+    monkeypatch.setattr(websocket, 'broadcast_payload', delivered.append)
+
+    websocket.broadcast_notification('Standup', 'daily 09:00')
+    websocket.broadcast_notification('Standup', 'daily 09:00')
+    assert len(published) == 1
+    assert len(delivered) == 1
@@ -0,0 +1,62 @@
+# tests/test_calc.py
+# calc 表达式解析器：与 Python 算术一致的优先级/结合性，嵌套深度和指数上限
+import inspect
+import sys
+import pytest
+from app.utils.calc import MAX_DEPTH, MAX_EXPONENT, CalcError, evaluate_expression
+
+
+@pytest.mark.parametrize('expression', [
+    '1 + 2 * 3', '10 - 2 - 3', '100 / 10 / 5', '7 // 2 * 3', '2 ** 3 ** 2', '-2 ** 2',
+    '(1 + 2) * -3', '--3', '+4 - -2', '.5 * 4', '2 ** -1', '1 - 2 + 3 - 4 * 5 / 2',
+])
+def test_matches_python_arithmetic(expression):
+    assert evaluate_expression(expression) == float(eval(expression))
+
+
+@pytest.mark.parametrize('terms', [250, 5000])
+def test_long_flat_chains_do_not_count_as_nesting(terms):
+    assert evaluate_expression('+'.join(['1'] * terms)) == terms
+    assert evaluate_expression('*'.join(['1'] * terms)) == 1
+    assert evaluate_expression(' - '.join(['1'] * terms)) == 2 - terms
+
+
+@pytest.mark.parametrize('build', [
+    lambda n: '(' * n + '1' + ')' * n,
+    lambda n: '-' * n + '1',
+    lambda n: '1' + '**1' * n,
+])
+def test_nesting_limit(build):
+    assert evaluate_expression(build(MAX_DEPTH)) in (1.0, -1.0)
+    with pytest.raises(CalcError):
+        evaluate_expression(build(MAX_DEPTH + 1))
+
+
+def test_deepest_allowed_expression_leaves_stack_headroom():
+    # 模拟已经处在较深的调用栈中（Web 服务器、Flask 视图等），最深的合法表达式仍不能触发 RecursionError
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(len(inspect.stack()) + 650)
+    try:
+        assert evaluate_expression('1+2*(' * MAX_DEPTH + '1' + ')' * MAX_DEPTH) > 0
+        assert evaluate_expression('(1**(' * (MAX_DEPTH // 3) + '1' + '))' * (MAX_DEPTH // 3)) == 1
+    finally:
+        sys.setrecursionlimit(limit)
+
+
+def test_exponent_cap():
+    assert evaluate_expression(f'1 ** {MAX_EXPONENT}') == 1
+    with pytest.raises(CalcError):
+        evaluate_expression(f'2 ** {MAX_EXPONENT + 1}')
+    with pytest.raises(CalcError):
+        evaluate_expression('9 ** 9 ** 9')
+
+
+@pytest.mark.parametrize('expression', ['', '1 +', '(1', '1)', '2 x 3', '__import__("os")', '1 2'])
+def test_invalid_expressions(expression):
+    with pytest.raises(CalcError):
+        evaluate_expression(expression)
+
+
+def test_division_by_zero_raises():
+    with pytest.raises(ZeroDivisionError):
+        evaluate_expression('1 / (2 - 2)')
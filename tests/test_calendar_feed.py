@@ -0,0 +1,32 @@
+# tests/test_calendar_feed.py
+# /calendar.ics 的令牌校验和日期窗口参数：非法输入返回 401 / 400，而不是 500
+import pytest
+from app.routes import main
+
+
+@pytest.fixture
+def anonymous(app, monkeypatch):
+    monkeypatch.setattr(main, 'CALENDAR_FEED_TOKEN', 'feed-token')
+    return app.test_client()
+
+
+def test_token_grants_access(anonymous):
+    res = anonymous.get('/calendar.ics?token=feed-token')
+    assert res.status_code == 200
+    assert res.data.startswith(b'BEGIN:VCALENDAR')
+
+
+@pytest.mark.parametrize('token', ['', 'wrong', 'fëed-token', '令牌'])
+def test_bad_tokens_are_rejected(anonymous, token):
+    assert anonymous.get('/calendar.ics', query_string={'token': token}).status_code == 401
+
+
+@pytest.mark.parametrize('query', [
+    'past=99999999999999999999', 'future=99999999999', 'past=-1', 'future=abc', 'start=2026-13-01',
+])
+def test_invalid_windows_return_400(client, query):
+    assert client.get(f'/calendar.ics?{query}').status_code == 400
+
+
+def test_rolling_window(client):
+    assert client.get('/calendar.ics?past=30&future=365').status_code == 200
@@ -0,0 +1,98 @@
+# tests/test_ics_import.py
+# 流式 ICS 导入：折行展开、DTEND/DURATION、时区与夏令时、RRULE/EXDATE、VALARM 提醒，以及按块写入页面
+import io
+from datetime import date
+import pytest
+from dateutil import tz
+from app.utils import ics
+
+
+def calendar(*events):
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//test//EN']
+    for event in events:
+        lines += ['BEGIN:VEVENT'] + event.strip().splitlines() + ['END:VEVENT']
+    lines.append('END:VCALENDAR')
+    return ('\r\n'.join(lines) + '\r\n').encode('utf-8')
+
+
+def occurrences(event):
+    component = next(ics.iter_vevents(io.BytesIO(calendar(event))))
+    return ics.event_occurrences(component)
+
+
+@pytest.fixture(autouse=True)
+def utc_server(monkeypatch):
+    # 服务器本地时区固定为 UTC，带时区的事件换算结果才可预期
+    monkeypatch.setattr(ics, 'LOCAL_TZ', tz.UTC)
+
+
+def test_folded_lines_are_unfolded_and_broken_events_skipped():
+    data = calendar(
+        'UID:1\nSUMMARY:Long\n  title\nDTSTART:20260301T090000',
+        'UID:2\nDTSTART:not-a-date',
+        'UID:3\nSUMMARY:Next\nDTSTART:20260302T090000',
+    )
+    summaries = [str(e.get('summary')) for e in ics.iter_vevents(io.BytesIO(data))]
+    assert summaries[0] == 'Long title'
+    assert summaries[-1] == 'Next'
+
+
+def test_dtend_and_duration():
+    assert occurrences('SUMMARY:Meet\nDTSTART:20260301T090000\nDTEND:20260301T103000') == [
+        (date(2026, 3, 1), '09:00', '10:30', 'Meet', None)
+    ]
+    assert occurrences('SUMMARY:Call\nDTSTART:20260301T090000\nDURATION:PT45M') == [
+        (date(2026, 3, 1), '09:00', '09:45', 'Call', None)
+    ]
+    # 跨天结束的事件不记录结束时间
+    assert occurrences('SUMMARY:Late\nDTSTART:20260301T230000\nDTEND:20260302T010000')[0][2] is None
+
+
+def test_unsafe_title_characters_are_removed():
+    assert occurrences('SUMMARY:[a|b] {c}\nDTSTART:20260301T090000')[0][3] == 'a b c'
+
+
+def test_valarm_becomes_reminder():
+    event = ('SUMMARY:Standup\nDTSTART:20260301T090000\n'
+             'BEGIN:VALARM\nACTION:DISPLAY\nTRIGGER:-PT2H\nEND:VALARM')
+    assert occurrences(event)[0][4] == '2h'
+
+
+def test_utc_and_tzid_times_convert_to_server_time_across_dst():
+    assert occurrences('SUMMARY:UTC\nDTSTART:20260301T090000Z')[0][1] == '09:00'
+    # 纽约每周一 09:00，跨过 3 月 8 日的夏令时切换：UTC 从 14:00 变为 13:00
+    starts = occurrences('SUMMARY:NY\nDTSTART;TZID=America/New_York:20260302T090000\nRRULE:FREQ=WEEKLY;COUNT=2')
+    assert [(d, s) for d, s, *_ in starts] == [(date(2026, 3, 2), '14:00'), (date(2026, 3, 9), '13:00')]
+
+
+def test_rrule_with_exdate_and_count():
+    event = ('SUMMARY:Gym\nDTSTART:20260302T070000\nRRULE:FREQ=DAILY;COUNT=4\n'
+             'EXDATE:20260303T070000')
+    assert [d for d, *_ in occurrences(event)] == [date(2026, 3, 2), date(2026, 3, 4), date(2026, 3, 5)]
+
+
+def test_multi_day_all_day_event_expands_per_day():
+    event = 'SUMMARY:Trip\nDTSTART;VALUE=DATE:20260301\nDTEND;VALUE=DATE:20260304'
+    assert [d for d, *_ in occurrences(event)] == [date(2026, 3, 1), date(2026, 3, 2), date(2026, 3, 3)]
+
+
+def test_import_writes_events_in_chunks(client, monkeypatch):
+    monkeypatch.setattr(ics, 'IMPORT_CHUNK_SIZE', 2)
+    data = calendar(
+        'SUMMARY:One\nDTSTART:20260401T090000',
+        'SUMMARY:Two\nDTSTART:20260402T090000',
+        'SUMMARY:Daily\nDTSTART:20260403T090000\nRRULE:FREQ=DAILY;COUNT=3',
+        'SUMMARY:Broken',
+    )
+    res = client.post('/api/calendar/import', data={'file': (io.BytesIO(data), 'cal.ics')},
+                      content_type='multipart/form-data')
+    result = res.get_json()
+    assert res.status_code == 200
+    assert result['vevents'] == 4
+    assert result['events'] == 5
+    assert result['skipped'] == 1
+    assert len(result['page_ids']) == 3
+
+    listed = client.get('/api/calendar/events?start=2026-04-01&end=2026-04-30').get_json()
+    titles = sorted(e['title'] for e in listed)
+    assert titles == ['Daily', 'Daily', 'Daily', 'One', 'Two']
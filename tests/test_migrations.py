@@ -0,0 +1,117 @@
+# tests/test_migrations.py
+# 从最初版本的数据库文件升级：迁移依次执行、索引表和变量历史回填完整，升级后的结构与全新数据库一致
+import os
+import sqlite3
+import subprocess
+import sys
+from app import database
+from app.migrations import LATEST_VERSION
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 引入迁移之前的模型由 create_all 生成的结构
+BASELINE_SCHEMA = """
+CREATE TABLE daily_log (
+    id INTEGER NOT NULL, date DATE, content TEXT,
+    PRIMARY KEY (id), UNIQUE (date)
+);
+CREATE TABLE page (
+    id INTEGER NOT NULL, title VARCHAR(100), icon VARCHAR(20), cover VARCHAR(200), content TEXT,
+    page_type VARCHAR(20), graph_config TEXT, created_at DATETIME, is_pinned BOOLEAN,
+    PRIMARY KEY (id)
+);
+CREATE TABLE variable (
+    id INTEGER NOT NULL, name VARCHAR(50) NOT NULL, display_name VARCHAR(50), color VARCHAR(20),
+    unit VARCHAR(10), chart_type VARCHAR(20), created_at DATETIME,
+    PRIMARY KEY (id), UNIQUE (name)
+);
+CREATE TABLE variable_value (
+    id INTEGER NOT NULL, variable_id INTEGER NOT NULL, page_id INTEGER NOT NULL, value FLOAT,
+    updated_at DATETIME,
+    PRIMARY KEY (id),
+    FOREIGN KEY(variable_id) REFERENCES variable (id), FOREIGN KEY(page_id) REFERENCES page (id)
+);
+"""
+
+CONTENT = (
+    "See [[@Other]] and [[work]].\n"
+    "@2026.03.01 09:00-10:00 [Dentist|15m]\n"
+    "{{notice|daily 08:30|Stand up}}\n"
+    "{{calc|calc_cost: 12 * 2}}\n"
+)
+
+
+def make_baseline(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.execute("INSERT INTO page (id, title, icon, cover, content, page_type, graph_config, created_at, is_pinned) "
+                 "VALUES (1, 'Notes', '📄', '', ?, 'doc', '{}', '2026-01-01 00:00:00', 0)", (CONTENT,))
+    conn.execute("INSERT INTO page (id, title, content, page_type, created_at, is_pinned) "
+                 "VALUES (2, 'Other', '', 'doc', '2026-01-02 00:00:00', 1)")
+    conn.execute("INSERT INTO variable (id, name, display_name, created_at) VALUES (1, 'calc_cost', 'cost', '2026-01-01')")
+    conn.execute("INSERT INTO variable_value (variable_id, page_id, value, updated_at) "
+                 "VALUES (1, 1, 24.0, '2026-01-05 12:00:00')")
+    conn.commit()
+    conn.close()
+
+
+def start_app(tmp_path, db_path):
+    # app.database 在导入时读取 DATABASE_PATH，每次升级都在新的进程里启动应用
+    env = dict(os.environ,
+               DATABASE_PATH=str(db_path),
+               CLUSTER_DATABASE_PATH=str(tmp_path / 'cluster.db'),
+               UPLOAD_PARTIAL_FOLDER=str(tmp_path / 'parts'))
+    subprocess.run([sys.executable, '-c', 'from app import create_app; create_app()'],
+                   cwd=ROOT, env=env, check=True, capture_output=True, timeout=120)
+
+
+def schema(path):
+    conn = sqlite3.connect(path)
+    try:
+        tables = {name: {row[1] for row in conn.execute(f'PRAGMA table_info("{name}")')}
+                  for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        indexes = {name for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND name NOT LIKE 'sqlite_autoindex%'")}
+        return tables, indexes
+    finally:
+        conn.close()
+
+
+def test_upgrade_from_baseline(tmp_path, app):
+    db_path = tmp_path / 'baseline.db'
+    make_baseline(db_path)
+    start_app(tmp_path, db_path)
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == LATEST_VERSION
+    assert conn.execute('SELECT content, version FROM page WHERE id = 1').fetchone() == (CONTENT, 0)
+    # 回填的索引表
+    assert conn.execute('SELECT target_title FROM page_link WHERE source_id = 1').fetchall() == [('Other',)]
+    assert conn.execute('SELECT tag FROM page_tag WHERE page_id = 1').fetchall() == [('work',)]
+    assert conn.execute('SELECT date, start, "end", title, reminder FROM calendar_event').fetchall() == [
+        ('2026-03-01', '09:00', '10:00', 'Dentist', '15m')
+    ]
+    assert conn.execute('SELECT condition, content FROM page_notice').fetchall() == [('daily 08:30', 'Stand up')]
+    # 现有变量值成为历史的第一条记录
+    assert conn.execute('SELECT value FROM variable_observation').fetchall() == [(24.0,)]
+    # 全文搜索索引
+    assert conn.execute("SELECT rowid FROM page_fts WHERE page_fts MATCH 'Dentist'").fetchall() == [(1,)]
+    conn.close()
+
+    # 升级后的结构与 create_all 建出的全新数据库一致
+    assert schema(db_path) == schema(database.DB_PATH)
+
+
+def test_upgrade_is_idempotent(tmp_path):
+    db_path = tmp_path / 'baseline.db'
+    make_baseline(db_path)
+    start_app(tmp_path, db_path)
+    before = schema(db_path)
+    start_app(tmp_path, db_path)
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute('SELECT COUNT(*) FROM page_link').fetchone()[0] == 1
+    assert conn.execute('SELECT COUNT(*) FROM variable_observation').fetchone()[0] == 1
+    assert conn.execute('SELECT COUNT(*) FROM page').fetchone()[0] == 2
+    conn.close()
+    assert schema(db_path) == before
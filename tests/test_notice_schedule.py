@@ -0,0 +1,58 @@
+# tests/test_notice_schedule.py
+# 订阅源里提醒的 RRULE 展开后必须与调度器 next_fire 的触发时间完全一致
+from collections import namedtuple
+from datetime import datetime, timedelta
+import pytest
+from dateutil.rrule import rrulestr
+from icalendar import Event as ICalEvent
+from app.utils.ics import VEVENT_BEGIN, notice_fragment, notice_schedule
+from app.websocket import notification_checker
+
+NoticeRow = namedtuple('NoticeRow', 'page_id condition content page_title')
+
+# 从 RRULE 的锚点（2000-01-01）附近开始比较，展开时不必从锚点逐小时迭代到今天
+START = datetime(2000, 1, 1, 22, 17, 5)
+SPAN = timedelta(days=3)
+
+
+def feed_occurrences(condition):
+    """按订阅客户端的方式展开订阅源中的提醒：解析 VEVENT 片段，用其 DTSTART + RRULE 生成触发时间"""
+    fragment = notice_fragment(NoticeRow(1, condition, 'ping', 'Page'))
+    event = ICalEvent.from_ical(VEVENT_BEGIN + fragment)
+    dtstart = event.decoded('dtstart')
+    rule = event.get('rrule')
+    if rule is None:
+        return [dtstart] if START < dtstart <= START + SPAN else []
+    rules = rrulestr('RRULE:' + rule.to_ical().decode(), dtstart=dtstart)
+    return rules.between(START, START + SPAN)
+
+
+def scheduler_occurrences(condition):
+    fires, t = [], START
+    while True:
+        t = notification_checker.next_fire(condition, t)
+        if t is None or t > START + SPAN:
+            return fires
+        fires.append(t)
+
+
+@pytest.mark.parametrize('condition', [
+    'every 15m', 'every 45m', 'every 7m', 'every 90m',
+    'every 2h', 'every 5h', 'every 7h', 'every 30h',
+    'daily 09:30', 'daily 23:59:30',
+    '2000-01-02 08:00', 'time 2000-01-03 12:34:56',
+])
+def test_feed_matches_scheduler(condition):
+    expected = scheduler_occurrences(condition)
+    assert expected
+    assert feed_occurrences(condition) == expected
+
+
+def test_non_divisor_intervals_restart_each_hour_and_day():
+    assert notice_schedule('every 45m')[1]['BYMINUTE'] == [0, 45]
+    assert notice_schedule('every 5h')[1]['BYHOUR'] == [0, 5, 10, 15, 20]
+
+
+@pytest.mark.parametrize('condition', ['every 5s', 'every 0m', 'every 2d', 'daily 25:00', 'weekly'])
+def test_unsupported_conditions_are_not_exported(condition):
+    assert notice_schedule(condition) is None
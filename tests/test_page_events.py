@@ -0,0 +1,53 @@
+# tests/test_page_events.py
+# /ws 的登录检查，以及页面事件的分发：完整字段只发给打开了该页面的客户端
+import json
+from app import websocket
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.closed = None
+
+    def close(self, reason=None, message=None):
+        self.closed = reason
+
+
+class FakeClient:
+    def __init__(self, page_id=None):
+        self.page_id = page_id
+        self.messages = []
+
+    def enqueue(self, payload):
+        self.messages.append(json.loads(payload))
+        return True
+
+
+def test_unauthenticated_socket_is_closed(app):
+    # sock.route 不返回被装饰的函数，从视图函数的包装里取出原函数
+    handler = app.view_functions['__flask_sock.websocket_handler'].__wrapped__
+    ws = FakeWebSocket()
+    with app.test_request_context('/ws'):
+        handler(ws)
+    assert ws.closed == 1008
+    assert ws not in websocket.clients
+
+
+def test_subscribe_sets_the_open_page():
+    client = FakeClient()
+    websocket.handle_client_message(client, {'type': 'subscribe', 'page_id': 7})
+    assert client.page_id == 7
+    websocket.handle_client_message(client, {'type': 'subscribe', 'page_id': '7'})
+    assert client.page_id is None
+
+
+def test_fields_go_only_to_subscribed_clients(monkeypatch):
+    viewer, other = FakeClient(page_id=7), FakeClient(page_id=8)
+    monkeypatch.setattr(websocket, 'clients', {'a': viewer, 'b': other})
+    monkeypatch.setattr(websocket.relay, 'peers', 0)
+
+    websocket.publish_page_event('page_updated', 7, version=3,
+                                 fields={'content': 'secret'}, changed=['content'])
+    assert viewer.messages[0]['fields'] == {'content': 'secret'}
+    assert other.messages == [{
+        'type': 'page_updated', 'page_id': 7, 'version': 3, 'changed': ['content'], 'origin': None
+    }]
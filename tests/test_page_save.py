@@ -0,0 +1,74 @@
+# tests/test_page_save.py
+# 正文保存的版本校验：补丁和全量保存都以 base_version 为条件写入，版本不一致时返回 409 且不覆盖正文
+from app import database
+from app.routes import api
+
+
+def create_page(client, content):
+    page_id = client.post('/api/page/create', json={'type': 'doc'}).get_json()['id']
+    version = client.post(f'/api/page/{page_id}/update', json={'content': content}).get_json()['version']
+    return page_id, version
+
+
+def get_page(client, page_id):
+    return client.get(f'/api/page/{page_id}?content=1').get_json()
+
+
+def test_patch_applies_against_base_version(client):
+    page_id, version = create_page(client, 'hello world')
+    res = client.post(f'/api/page/{page_id}/update', json={
+        'base_version': version, 'patch': [{'pos': 5, 'del': 0, 'ins': ','}], 'length': 12
+    })
+    assert res.status_code == 200
+    assert res.get_json()['version'] == version + 1
+    assert get_page(client, page_id)['content'] == 'hello, world'
+
+
+def test_stale_patch_and_full_save_are_rejected(client):
+    page_id, version = create_page(client, 'first')
+    client.post(f'/api/page/{page_id}/update', json={'content': 'second', 'base_version': version})
+
+    res = client.post(f'/api/page/{page_id}/update', json={
+        'base_version': version, 'patch': [{'pos': 0, 'del': 5, 'ins': 'third'}]
+    })
+    assert res.status_code == 409
+    assert res.get_json()['version'] == version + 1
+
+    res = client.post(f'/api/page/{page_id}/update', json={'content': 'third', 'base_version': version})
+    assert res.status_code == 409
+    assert get_page(client, page_id)['content'] == 'second'
+
+
+def test_patch_without_base_version_is_rejected(client):
+    page_id, _ = create_page(client, 'abc')
+    res = client.post(f'/api/page/{page_id}/update', json={'patch': [{'pos': 0, 'del': 0, 'ins': 'x'}]})
+    assert res.status_code == 409
+
+
+def test_invalid_patch_op_returns_400(client):
+    page_id, version = create_page(client, 'abc')
+    res = client.post(f'/api/page/{page_id}/update', json={
+        'base_version': version, 'patch': [{'pos': '1', 'del': 0, 'ins': 'x'}]
+    })
+    assert res.status_code == 400
+
+
+def test_concurrent_write_between_check_and_update_returns_409(client, monkeypatch):
+    page_id, version = create_page(client, 'base')
+    original = api.apply_text_patch
+
+    def racing_apply(text, ops):
+        # 模拟另一个请求在版本检查之后、写入之前提交了新正文
+        conn = database.connect()
+        conn.execute('UPDATE page SET content = ?, version = version + 1 WHERE id = ?', ('other', page_id))
+        conn.commit()
+        conn.close()
+        return original(text, ops)
+
+    monkeypatch.setattr(api, 'apply_text_patch', racing_apply)
+    res = client.post(f'/api/page/{page_id}/update', json={
+        'base_version': version, 'patch': [{'pos': 4, 'del': 0, 'ins': '!'}]
+    })
+    assert res.status_code == 409
+    assert res.get_json()['version'] == version + 1
+    assert get_page(client, page_id)['content'] == 'other'
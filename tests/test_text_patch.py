@@ -0,0 +1,62 @@
+# tests/test_text_patch.py
+# apply_text_patch：偏移按 UTF-16 码元计算，与前端 diffText 生成的补丁一致；类型不符的操作一律拒绝
+import pytest
+from app.utils.helpers import apply_text_patch, utf16_len
+
+
+def test_insert_delete_replace():
+    assert apply_text_patch('hello world', [{'pos': 5, 'del': 0, 'ins': ','}]) == 'hello, world'
+    assert apply_text_patch('hello world', [{'pos': 5, 'del': 6}]) == 'hello'
+    assert apply_text_patch('hello world', [{'pos': 0, 'del': 5, 'ins': 'HELLO'}]) == 'HELLO world'
+
+
+def test_multiple_ops_are_relative_to_original():
+    ops = [{'pos': 0, 'del': 1, 'ins': 'A'}, {'pos': 4, 'del': 1, 'ins': 'E'}]
+    assert apply_text_patch('abcde', ops) == 'AbcdE'
+
+
+def test_offsets_count_utf16_code_units():
+    text = 'a😀b'
+    assert utf16_len(text) == 4
+    # emoji 占两个码元，b 的偏移是 3
+    assert apply_text_patch(text, [{'pos': 3, 'del': 1, 'ins': 'c'}]) == 'a😀c'
+    assert apply_text_patch(text, [{'pos': 1, 'del': 2, 'ins': ''}]) == 'ab'
+
+
+def test_splitting_surrogate_pair_is_rejected():
+    with pytest.raises(ValueError):
+        apply_text_patch('a😀b', [{'pos': 2, 'del': 0, 'ins': 'x'}])
+
+
+@pytest.mark.parametrize('ops', [
+    [{'pos': 4, 'del': 0, 'ins': 'x'}],                                # 起点越界
+    [{'pos': 1, 'del': 5}],                                            # 删除越界
+    [{'pos': 1, 'del': -1}],                                           # 负长度
+    [{'pos': -1, 'del': 0, 'ins': 'x'}],                               # 负偏移
+    [{'pos': 2, 'del': 0, 'ins': 'x'}, {'pos': 1, 'del': 0, 'ins': 'y'}],  # 未按 pos 升序
+])
+def test_out_of_range_ops_are_rejected(ops):
+    with pytest.raises(ValueError):
+        apply_text_patch('abc', ops)
+
+
+@pytest.mark.parametrize('op', [
+    {'pos': '1', 'del': 0, 'ins': 'x'},
+    {'pos': 1.0, 'del': 0, 'ins': 'x'},
+    {'pos': True, 'del': 0, 'ins': 'x'},
+    {'pos': 1, 'del': '1'},
+    {'pos': 1, 'del': False},
+    {'pos': 1, 'del': 0, 'ins': 5},
+    {'pos': 1, 'del': 0, 'ins': None},
+    {'pos': 1, 'del': 0, 'ins': ['x']},
+    {'del': 0, 'ins': 'x'},
+    'pos=1',
+])
+def test_ops_with_wrong_types_are_rejected(op):
+    with pytest.raises(ValueError):
+        apply_text_patch('abc', [op])
+
+
+def test_patch_must_be_a_list():
+    with pytest.raises(ValueError):
+        apply_text_patch('abc', {'pos': 0, 'del': 0, 'ins': 'x'})
@@ -0,0 +1,117 @@
+# tests/test_uploads.py
+# 分片续传：偏移校验、断点续传的哈希恢复、校验和，以及按内容哈希去重
+import hashlib
+import os
+import pytest
+from app.utils import uploads
+
+CONTENT = os.urandom(300 * 1024)
+DIGEST = hashlib.sha256(CONTENT).hexdigest()
+
+
+def start(client, content=CONTENT, **extra):
+    res = client.post('/api/uploads', json={'filename': 'photo.png', 'size': len(content), **extra})
+    return res.status_code, res.get_json()
+
+
+def send(client, upload_id, offset, chunk):
+    res = client.patch(f'/api/uploads/{upload_id}', data=chunk, headers={'Upload-Offset': str(offset)})
+    return res.status_code, res.get_json()
+
+
+@pytest.fixture(autouse=True)
+def empty_upload_folder(app):
+    folder = app.config['UPLOAD_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    for name in os.listdir(folder):
+        os.remove(os.path.join(folder, name))
+    uploads.hash_states.clear()
+
+
+def test_chunked_upload_and_resume(client):
+    status, created = start(client)
+    assert status == 201
+    upload_id = created['upload_id']
+
+    assert send(client, upload_id, 0, CONTENT[:100000]) == (200, {
+        'upload_id': upload_id, 'offset': 100000, 'size': len(CONTENT),
+        'chunk_size': uploads.UPLOAD_CHUNK_SIZE, 'status': 'partial'
+    })
+    # 断线后查询偏移继续；进程重启或换了 worker 时哈希状态丢失，从分片文件重新计算
+    assert client.get(f'/api/uploads/{upload_id}').get_json()['offset'] == 100000
+    uploads.hash_states.clear()
+
+    status, done = send(client, upload_id, 100000, CONTENT[100000:])
+    assert status == 200
+    assert done['status'] == 'complete'
+    assert done['sha256'] == DIGEST
+    assert done['url'].endswith(f'/uploads/{DIGEST}.png')
+    with open(os.path.join(client.application.config['UPLOAD_FOLDER'], DIGEST + '.png'), 'rb') as f:
+        assert f.read() == CONTENT
+    assert client.get(f'/api/uploads/{upload_id}').status_code == 404
+
+
+def test_stale_offset_is_rejected_with_current_offset(client):
+    upload_id = start(client)[1]['upload_id']
+    send(client, upload_id, 0, CONTENT[:1000])
+    # 重试了已经写入的分片：不追加重复字节，返回服务器上的偏移
+    status, body = send(client, upload_id, 0, CONTENT[:1000])
+    assert status == 409
+    assert body['offset'] == 1000
+    assert send(client, upload_id, 5000, CONTENT[5000:6000])[0] == 409
+    assert send(client, upload_id, 1000, CONTENT[1000:])[1]['sha256'] == DIGEST
+
+
+def test_concurrent_request_for_same_upload_is_busy(client):
+    upload_id = start(client)[1]['upload_id']
+    uploads.active_uploads.add(upload_id)
+    try:
+        status, body = send(client, upload_id, 0, CONTENT[:1000])
+    finally:
+        uploads.active_uploads.discard(upload_id)
+    assert status == 409
+    assert body['error'] == 'Upload busy'
+    assert client.get(f'/api/uploads/{upload_id}').get_json()['offset'] == 0
+
+
+def test_chunk_beyond_declared_size_is_rejected(client):
+    upload_id = start(client, content=b'abc')[1]['upload_id']
+    assert send(client, upload_id, 0, b'abcd')[0] == 400
+
+
+def test_checksum_mismatch_discards_upload(client):
+    upload_id = start(client, sha256='0' * 64)[1]['upload_id']
+    status, body = send(client, upload_id, 0, CONTENT)
+    assert status == 422
+    assert body['sha256'] == DIGEST
+    assert client.get(f'/api/uploads/{upload_id}').status_code == 404
+
+
+def test_identical_content_is_stored_once(client):
+    upload_id = start(client)[1]['upload_id']
+    first = send(client, upload_id, 0, CONTENT)[1]
+    assert first['duplicate'] is False
+
+    # 客户端预先算出哈希：服务器已有相同内容时不再传输
+    status, known = start(client, sha256=DIGEST)
+    assert status == 200
+    assert known == {'status': 'complete', 'url': first['url'], 'sha256': DIGEST, 'duplicate': True}
+
+    # 没带哈希的重复上传在完成时去重，保留已有文件
+    upload_id = start(client)[1]['upload_id']
+    again = send(client, upload_id, 0, CONTENT)[1]
+    assert again['duplicate'] is True
+    assert again['url'] == first['url']
+    assert os.listdir(client.application.config['UPLOAD_FOLDER']) == [DIGEST + '.png']
+
+
+def test_empty_file(client):
+    upload_id = start(client, content=b'')[1]['upload_id']
+    status, body = send(client, upload_id, 0, b'')
+    assert status == 200
+    assert body['sha256'] == hashlib.sha256(b'').hexdigest()
+
+
+def test_invalid_upload_id(client):
+    assert client.get('/api/uploads/../../etc').status_code == 404
+    assert send(client, 'x' * 32, 0, b'a')[0] == 404